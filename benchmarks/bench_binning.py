@@ -0,0 +1,68 @@
+"""
+Benchmark grid binning: legacy 2-D np.add.at path vs GridAccumulator's flat bincount/ufunc.at kernels.
+
+Uses synthetic points, so no LAZ files are needed:
+    python benchmarks/bench_binning.py --points 10000000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.binning import BIN_MODES, GridAccumulator  # noqa: E402
+
+
+def legacy_add_at(yi, xi, z, grid_size):
+    sum_grid = np.zeros((grid_size, grid_size), dtype=np.float64)
+    count_grid = np.zeros((grid_size, grid_size), dtype=np.int32)
+    np.add.at(sum_grid, (yi, xi), z)
+    np.add.at(count_grid, (yi, xi), 1)
+    return sum_grid, count_grid
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--points", type=int, default=10_000_000)
+    parser.add_argument("--grid", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n, g = args.points, args.grid
+    xi = rng.integers(0, g, n, dtype=np.int32)
+    yi = rng.integers(0, g, n, dtype=np.int32)
+    z = 100.0 + rng.normal(0.0, 5.0, n)
+
+    print(f"{n:,} points -> {g}x{g} grid (best of {args.repeat})")
+
+    legacy_s, (legacy_sum, _) = timed(lambda: legacy_add_at(yi, xi, z, g), args.repeat)
+    print(f"  {'np.add.at mean':<22} {legacy_s:8.3f} s  {n / legacy_s / 1e6:8.1f} Mpts/s")
+
+    for mode in BIN_MODES:
+        def run():
+            acc = GridAccumulator((g, g), (mode,))
+            acc.add_cells(yi, xi, z)
+            return acc
+
+        secs, acc = timed(run, args.repeat)
+        speedup = legacy_s / secs
+        print(f"  {'GridAccumulator ' + mode:<22} {secs:8.3f} s  {n / secs / 1e6:8.1f} Mpts/s  ({speedup:.1f}x)")
+        if mode == "mean" and not np.array_equal(acc.sum_grid, legacy_sum):
+            print("  WARNING: GridAccumulator sums differ from np.add.at")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark metadata scans: CourseFile.load eager vs lazy over a folder of courses.
+
+Defaults to the reference samples; --strokes adds a synthetic large course so
+the cost of the CourseDescription parse is visible:
+    python benchmarks/bench_course_load.py --dir "<game courses folder>"
+    python benchmarks/bench_course_load.py --strokes 100000
+"""
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.course_file import BrushLayer, CourseFile  # noqa: E402
+
+
+def scan(files, lazy):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for f in files:
+        course = CourseFile.load(f, lazy=lazy)
+        course.get_metadata()
+    secs = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return secs, peak
+
+
+def main():
+    root = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dir", type=Path, default=root / "reference" / "samples")
+    parser.add_argument("--strokes", type=int, default=0, help="also scan a synthetic course with this many strokes")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    files = sorted(args.dir.glob("*.course"))
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.strokes:
+            course = CourseFile.load(root / "reference" / "samples" / "2k25_flat.course")
+            rng = np.random.default_rng(0)
+            n = args.strokes
+            course.set_layer("height", BrushLayer.from_columns(
+                rng.uniform(-1000, 1000, n), rng.uniform(-1000, 1000, n), rng.normal(0.0, 1.0, n), 100.0, 1, 54
+            ))
+            big = Path(tmp) / "synthetic.course"
+            course.save(big)
+            files.append(big)
+        if not files:
+            print(f"No .course files in {args.dir}")
+            return
+
+        files = files * args.repeat
+        print(f"{len(files)} loads (+ get_metadata)")
+        eager_s, eager_peak = scan(files, lazy=False)
+        lazy_s, lazy_peak = scan(files, lazy=True)
+        for name, secs, peak in (("eager", eager_s, eager_peak), ("lazy", lazy_s, lazy_peak)):
+            print(f"  {name:<6} {secs / len(files) * 1e3:8.2f} ms/file  peak {peak / 1e6:8.2f} MB")
+        print(f"  speedup {eager_s / lazy_s:.1f}x, peak memory {eager_peak / max(lazy_peak, 1):.1f}x lower")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark CourseFile.save compression profiles.
+
+Builds a synthetic stamp-heavy course from the flat template, then reports
+per profile the compressor throughput (MB/s of UTF-16 CourseDescription
+payload), full save time, size on disk and a reload check, plus the brush
+array encode cost at full vs fixed (--precision) decimals:
+    python benchmarks/bench_course_save.py --strokes 100000
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.course_file import (  # noqa: E402
+    COMPRESSION_PROFILES,
+    BrushLayer,
+    CourseFile,
+    compress_payload,
+)
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    root = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--strokes", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=None, help="threads for block-parallel profiles")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--precision", type=int, default=3, help="decimals for the compact brush encoder")
+    args = parser.parse_args()
+
+    course = CourseFile.load(root / "reference" / "samples" / "2k25_flat.course")
+    rng = np.random.default_rng(0)
+    n = args.strokes
+    course.set_layer("height", BrushLayer.from_columns(
+        rng.uniform(-1000, 1000, n), rng.uniform(-1000, 1000, n), rng.normal(0.0, 5.0, n), 460.0, 1, 54
+    ))
+    layer = course.layer("height")
+    payload = json.dumps(dict(course.course_data, height=layer.to_entries())).encode("utf-16-le")
+    mb = len(payload) / 1e6
+    print(f"{n:,} strokes, {mb:.1f} MB UTF-16 CourseDescription (best of {args.repeat})")
+
+    full_s = best_of(lambda: json.dumps(layer.to_entries()), args.repeat)
+    compact_s = best_of(lambda: layer.to_json(args.precision), args.repeat)
+    full_len, compact_len = len(json.dumps(layer.to_entries())), len(layer.to_json(args.precision))
+    print(f"  brush encode: json {full_s:.3f} s / {full_len / 1e6:.1f} M chars, "
+          f"to_json({args.precision}) {compact_s:.3f} s / {compact_len / 1e6:.1f} M chars")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp) / "bench.course"
+        for profile in COMPRESSION_PROFILES:
+            compact_save_s = best_of(
+                lambda: course.save(out, compression=profile, threads=args.threads, brush_precision=args.precision),
+                args.repeat,
+            )
+            compact_mb = out.stat().st_size / 1e6
+            secs = best_of(lambda: compress_payload(payload, profile, args.threads), args.repeat)
+            ratio = len(payload) / len(compress_payload(payload, profile, args.threads))
+            save_s = best_of(lambda: course.save(out, compression=profile, threads=args.threads), args.repeat)
+            ok = len(CourseFile.load(out).layer("height")) == n
+            print(
+                f"  {profile:<8} gzip {mb / secs:7.1f} MB/s  ratio {ratio:5.1f}x  "
+                f"save {save_s:6.3f} s  {out.stat().st_size / 1e6:6.2f} MB on disk  "
+                f"load {'ok' if ok else 'FAILED'}"
+            )
+            print(f"  {'':<8} with brush_precision={args.precision}: save {compact_save_s:6.3f} s  {compact_mb:6.2f} MB on disk")
+
+
+if __name__ == "__main__":
+    main()
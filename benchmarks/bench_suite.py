@@ -0,0 +1,335 @@
+"""
+Benchmark suite: .course codec, LiDAR pipeline stages and stamp generation vs a stored baseline.
+
+Everything is synthetic (no LAZ files or game install needed):
+  - codec:  CourseFile.save / load with 1k/10k/100k/500k height strokes
+  - lidar:  each pipeline stage on synthetic point clouds of 1M/10M/50M points
+  - stamps: lattice stamp generation at several BRUSH_SPACING values
+  - fill:   push-pull vs nearest-neighbour (distance transform) gap filling, 1024^2-4096^2
+
+Each case reports best-of-N wall time, throughput and tracemalloc peak memory,
+and is compared against benchmarks/baseline.json; any case slower or larger
+than the tolerances allow is reported as a REGRESSION and the exit code is 1:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --quick --only codec,stamps
+    python benchmarks/bench_suite.py --only fill
+    python benchmarks/bench_suite.py --update-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.binning import GridAccumulator  # noqa: E402
+from src.course_file import BrushLayer, CourseFile  # noqa: E402
+from src.inpaint import fill_nan_pushpull  # noqa: E402
+from src.pipeline import (  # noqa: E402
+    PipelineConfig,
+    fill_nan_nearest,
+    stage_bin,
+    stage_fill,
+    stage_recognition,
+    stage_relief,
+    stage_stamp,
+    stage_water,
+)
+from src.stage_cache import StageResult  # noqa: E402
+
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+CODEC_STROKES = (1_000, 10_000, 100_000, 500_000)
+LIDAR_POINTS = (1_000_000, 10_000_000, 50_000_000)
+STAMP_SPACINGS = (25.0, 50.0, 100.0, 150.0)
+FILL_GRIDS = (1024, 2048, 4096)
+QUICK = {"codec": (1_000, 10_000, 100_000), "lidar": (1_000_000,), "stamps": (50.0, 150.0), "fill": (1024,)}
+GROUPS = ("codec", "lidar", "stamps", "fill")
+
+# Synthetic points are generated (untimed) and binned in chunks of this size.
+POINT_CHUNK = 2_000_000
+
+# Stop repeating a case once its timed runs add up to this (big cases get one timed run).
+CASE_BUDGET_SECONDS = 10.0
+
+# Differences below these floors are noise, never regressions.
+MIN_SECONDS_DELTA = 0.02
+MIN_PEAK_MB_DELTA = 2.0
+
+
+def _label(n: float) -> str:
+    for div, suffix in ((1_000_000, "M"), (1_000, "k")):
+        if n >= div and n % div == 0:
+            return f"{int(n // div)}{suffix}"
+    return f"{n:g}"
+
+
+def measure(fn, repeat: int):
+    """Best wall time over up to repeat runs (within CASE_BUDGET_SECONDS) and the tracemalloc peak (MB)"""
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    best, spent = float("inf"), 0.0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        secs = time.perf_counter() - t0
+        best, spent = min(best, secs), spent + secs
+        if spent > CASE_BUDGET_SECONDS:
+            break
+    return best, peak, result
+
+
+def synthetic_course(n: int) -> CourseFile:
+    course = CourseFile.load(ROOT / "reference" / "samples" / "2k25_flat.course")
+    rng = np.random.default_rng(0)
+    course.set_layer("height", BrushLayer.from_columns(
+        rng.uniform(-1000, 1000, n), rng.uniform(-1000, 1000, n), rng.normal(0.0, 5.0, n), 460.0, 1, 54
+    ))
+    return course
+
+
+def synthetic_heights(x: np.ndarray, y: np.ndarray, rng) -> np.ndarray:
+    """Rolling terrain in meters: broad hills, a valley and point noise"""
+    return (
+        100.0
+        + 12.0 * np.sin(x / 170.0) * np.cos(y / 230.0)
+        + 6.0 * np.sin((x + y) / 60.0)
+        - 15.0 * np.exp(-((x - 650.0) ** 2 + (y - 300.0) ** 2) / 2.0e4)
+        + rng.normal(0.0, 0.3, len(x))
+    )
+
+
+def bench_codec(sizes, repeat, log):
+    cases = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            course = synthetic_course(n)
+            path = Path(tmp) / f"synthetic_{n}.course"
+            secs, peak, _ = measure(lambda: course.save(path), repeat)
+            cases.append(_case(f"codec/save/{_label(n)}", secs, peak, n / secs, "strokes/s",
+                               file_mb=path.stat().st_size / 1e6))
+
+            def _load():
+                loaded = CourseFile.load(path)
+                return len(loaded.layer("height"))
+
+            secs, peak, count = measure(_load, repeat)
+            if count != n:
+                raise RuntimeError(f"codec round trip lost strokes: {count} != {n}")
+            cases.append(_case(f"codec/load/{_label(n)}", secs, peak, n / secs, "strokes/s"))
+            for case in cases[-2:]:
+                log(_format(case))
+    return cases
+
+
+def bench_lidar(sizes, repeat, log, grid_size: int = 1024):
+    """
+    ingest = cell assignment + GridAccumulator binning of the points (the LAZ
+    decode itself is not included); the raster stages run the pipeline stage
+    functions on the result with default knobs.
+    """
+    config = PipelineConfig(grid_size=grid_size)
+    cases = []
+    for n in sizes:
+        def _ingest():
+            # Chunks are regenerated from a fixed seed each run (untimed), so memory stays
+            # bounded by POINT_CHUNK as in the streaming reader; only binning is timed.
+            rng = np.random.default_rng(1)
+            acc = GridAccumulator((grid_size, grid_size), (config.bin_mode,))
+            points, binning = 0, 0.0
+            for start in range(0, n, POINT_CHUNK):
+                m = min(POINT_CHUNK, n - start)
+                x = rng.uniform(0.0, 1000.0, m)
+                y = rng.uniform(0.0, 1000.0, m)
+                # A lake with no returns gives the fill and water stages something to do.
+                keep = (x - 300.0) ** 2 + (y - 700.0) ** 2 > 90.0 ** 2
+                x, y = x[keep], y[keep]
+                z = synthetic_heights(x, y, rng)
+                t0 = time.perf_counter()
+                xi = np.clip(np.floor(x / 1000.0 * (grid_size - 1)).astype(np.int32), 0, grid_size - 1)
+                yi = np.clip(np.floor(y / 1000.0 * (grid_size - 1)).astype(np.int32), 0, grid_size - 1)
+                acc.add_cells(yi, xi, z)
+                binning += time.perf_counter() - t0
+                points += len(z)
+            return acc, points, binning
+
+        tracemalloc.start()
+        acc, points, secs = _ingest()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        spent = secs
+        for _ in range(repeat - 1):
+            if spent > CASE_BUDGET_SECONDS:
+                break
+            run_secs = _ingest()[2]
+            secs, spent = min(secs, run_secs), spent + run_secs
+        label = _label(n)
+        cases.append(_case(f"lidar/ingest/{label}", secs, peak, points / secs, "points/s"))
+        log(_format(cases[-1]))
+
+        prev = StageResult("ingest", "bench", acc.arrays(), {
+            "shape": [grid_size, grid_size], "modes": [config.bin_mode], "scale": 1.0,
+        })
+        for name, fn in (("bin", stage_bin), ("fill", stage_fill), ("relief", stage_relief),
+                         ("recognition", stage_recognition), ("water", stage_water)):
+            secs, peak, (arrays, meta) = measure(lambda: fn(config, prev), repeat)
+            cases.append(_case(f"lidar/{name}/{label}", secs, peak, grid_size * grid_size / secs, "cells/s"))
+            log(_format(cases[-1]))
+            prev = StageResult(name, "bench", arrays, meta)
+    return cases
+
+
+def bench_stamps(spacings, repeat, log, grid_size: int = 1024):
+    rng = np.random.default_rng(2)
+    v, u = np.mgrid[0:grid_size, 0:grid_size] / grid_size
+    height = (8.0 * np.sin(6.0 * u) * np.cos(4.0 * v) + rng.normal(0.0, 0.1, u.shape)).astype(np.float32)
+    water = StageResult("water", "bench", {"height": height, "water_mask": height < -6.0}, {})
+    cases = []
+    for spacing in spacings:
+        config = PipelineConfig(brush_spacing=spacing)
+        secs, peak, (arrays, _) = measure(lambda: stage_stamp(config, water), repeat)
+        n = len(arrays["stamps"])
+        cases.append(_case(f"stamps/spacing_{spacing:g}", secs, peak, n / secs, "stamps/s", stamps=n))
+        log(_format(cases[-1]))
+    return cases
+
+
+def bench_fill(sizes, repeat, log):
+    """
+    Both gap fillers on the same grid: 8% scattered dropouts plus a lake-sized
+    void. rmse is against the known surface inside the gaps, so the timing
+    and memory numbers come with the fill quality they buy.
+    """
+    cases = []
+    for n in sizes:
+        rng = np.random.default_rng(3)
+        v, u = np.mgrid[0:n, 0:n] * (1000.0 / n)
+        truth = synthetic_heights(u.ravel(), v.ravel(), rng).reshape(n, n).astype(np.float32)
+        del u, v
+        grid = truth.copy()
+        grid[rng.random((n, n)) < 0.08] = np.nan
+        grid[n // 5:n // 5 + n // 6, n // 2:n // 2 + n // 4] = np.nan
+        gaps = np.isnan(grid)
+        for name, fn in (("nearest", fill_nan_nearest), ("pushpull", fill_nan_pushpull)):
+            secs, peak, filled = measure(lambda: fn(grid), repeat)
+            rmse = float(np.sqrt(np.mean((filled[gaps] - truth[gaps]) ** 2)))
+            cases.append(_case(f"fill/{name}/{n}", secs, peak, n * n / secs, "cells/s", rmse_m=rmse))
+            log(_format(cases[-1]) + f"  rmse {rmse:.3f} m")
+            del filled
+    return cases
+
+
+def _case(name, seconds, peak_mb, throughput, unit, **extra):
+    return dict(name=name, seconds=seconds, peak_mb=peak_mb, throughput=throughput, unit=unit, **extra)
+
+
+def _format(case) -> str:
+    return (f"  {case['name']:<28} {case['seconds']:9.4f} s  {case['throughput']:12.4g} {case['unit']:<9}"
+            f"  peak {case['peak_mb']:8.1f} MB")
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(cases, baseline, time_tol: float, mem_tol: float, log):
+    """Print case vs baseline ratios; return the list of regression messages"""
+    known = {c["name"]: c for c in baseline.get("cases", [])}
+    regressions = []
+    log(f"\nvs baseline (tolerance: time +{time_tol:.0%}, peak memory +{mem_tol:.0%})")
+    for case in cases:
+        ref = known.get(case["name"])
+        if ref is None:
+            log(f"  {case['name']:<28} (no baseline)")
+            continue
+        t_ratio = case["seconds"] / max(ref["seconds"], 1e-12)
+        m_ratio = case["peak_mb"] / max(ref["peak_mb"], 1e-12)
+        flags = []
+        if case["seconds"] > ref["seconds"] * (1.0 + time_tol) and case["seconds"] - ref["seconds"] > MIN_SECONDS_DELTA:
+            flags.append(f"time {ref['seconds']:.4f} -> {case['seconds']:.4f} s ({t_ratio:.2f}x)")
+        if case["peak_mb"] > ref["peak_mb"] * (1.0 + mem_tol) and case["peak_mb"] - ref["peak_mb"] > MIN_PEAK_MB_DELTA:
+            flags.append(f"peak {ref['peak_mb']:.1f} -> {case['peak_mb']:.1f} MB ({m_ratio:.2f}x)")
+        log(f"  {case['name']:<28} time {t_ratio:5.2f}x  peak {m_ratio:5.2f}x{'  <-- REGRESSION' if flags else ''}")
+        regressions += [f"{case['name']}: {flag}" for flag in flags]
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"comma list of {', '.join(GROUPS)}")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes (skips 500k strokes, 10M/50M points, 2048+ fill grids)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="allowed slowdown fraction")
+    parser.add_argument("--mem-tolerance", type=float, default=0.25, help="allowed peak memory growth fraction")
+    parser.add_argument("--json", type=Path, default=None, help="also write this run's results here")
+    args = parser.parse_args()
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(sorted(unknown))}")
+
+    cases = []
+    if "codec" in groups:
+        print(f"codec (best of {args.repeat})")
+        cases += bench_codec(QUICK["codec"] if args.quick else CODEC_STROKES, args.repeat, print)
+    if "lidar" in groups:
+        print(f"lidar stages (best of {args.repeat})")
+        cases += bench_lidar(QUICK["lidar"] if args.quick else LIDAR_POINTS, args.repeat, print)
+    if "stamps" in groups:
+        print(f"stamps (best of {args.repeat})")
+        cases += bench_stamps(QUICK["stamps"] if args.quick else STAMP_SPACINGS, args.repeat, print)
+    if "fill" in groups:
+        print(f"gap fill (best of {args.repeat})")
+        cases += bench_fill(QUICK["fill"] if args.quick else FILL_GRIDS, args.repeat, print)
+
+    run = {"machine": machine_info(), "cases": cases}
+    if args.json:
+        args.json.write_text(json.dumps(run, indent=1))
+
+    if args.update_baseline:
+        # Keep baseline entries for groups/sizes that were not part of this run.
+        previous = json.loads(args.baseline.read_text()) if args.baseline.exists() else {"cases": []}
+        merged = {c["name"]: c for c in previous["cases"]}
+        merged.update({c["name"]: c for c in cases})
+        run["cases"] = sorted(merged.values(), key=lambda c: c["name"])
+        args.baseline.write_text(json.dumps(run, indent=1) + "\n")
+        print(f"\nBaseline updated: {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("machine") != run["machine"]:
+        print(f"\nNOTE: baseline was recorded on {baseline.get('machine')}; timings may not be comparable")
+    regressions = compare(cases, baseline, args.time_tolerance, args.mem_tolerance, print)
+    if regressions:
+        print("\n" + "!" * 72)
+        print(f"PERFORMANCE REGRESSION in {len(regressions)} case(s):")
+        for msg in regressions:
+            print(f"  {msg}")
+        print("!" * 72)
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""
+CourseForge command line: python courseforge.py run|batch ...
+"""
+import sys
+
+from src.cli import main
+
+
+if __name__ == "__main__":
+    sys.exit(main())
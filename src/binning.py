@@ -0,0 +1,180 @@
+"""
+CourseForge - Grid Binning Module
+Per-cell reductions of scattered points using flat cell indices and 1-D bincount/ufunc.at kernels
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+BIN_MODES = ("mean", "min", "max", "count", "median")
+
+# Bisection steps for the per-cell median; resolution is (cell max - cell min) / 2**steps.
+MEDIAN_STEPS = 8
+
+
+def flat_cell_index(rows: np.ndarray, cols: np.ndarray, width: int) -> np.ndarray:
+    """Row-major flat index of (row, col) cells, computed once and shared by every reduction"""
+    return rows.astype(np.int64) * width + cols
+
+
+def _approx_median(flat: np.ndarray, values: np.ndarray, lo: np.ndarray, hi: np.ndarray,
+                   counts: np.ndarray, steps: int) -> np.ndarray:
+    """
+    Per-cell lower median by bisection on [min, max].
+
+    Each step is one bincount over the points, so cost is O(points * steps)
+    with no sort. Only cells present in this batch are meaningful.
+    """
+    hit = counts > 0
+    lo = np.where(hit, lo, 0.0)
+    hi = np.where(hit, hi, 0.0)
+    half = counts / 2.0
+    for _ in range(steps):
+        mid = 0.5 * (lo + hi)
+        below = np.bincount(flat, weights=values <= mid[flat], minlength=len(lo))
+        go_up = below < half
+        lo = np.where(go_up, mid, lo)
+        hi = np.where(go_up, hi, mid)
+    return 0.5 * (lo + hi)
+
+
+class GridAccumulator:
+    """
+    Streaming per-cell mean/min/max/count/median accumulator.
+
+    Feed it batches (e.g. LAZ chunks) with add(); only the reductions needed
+    by the requested modes are kept. Counts are one bincount per batch; sums,
+    mins and maxes go through 1-D ufunc.at in input order straight into the
+    running grids, so any chunking reproduces a whole-tile np.add.at exactly.
+    The median bisects over the cells a batch touches.
+
+    The median is the lower middle value, to bisection resolution, for cells
+    whose points all arrive in one batch; cells split across batches get the
+    count-weighted mean of the per-batch medians.
+    """
+
+    def __init__(self, shape: Tuple[int, int], modes: Iterable[str] = ("mean",),
+                 median_steps: int = MEDIAN_STEPS):
+        modes = tuple(modes)
+        unknown = [m for m in modes if m not in BIN_MODES]
+        if unknown:
+            raise ValueError(f"Unknown bin mode(s) {unknown}; expected one of {BIN_MODES}")
+
+        self.shape = tuple(shape)
+        self.modes = modes
+        self.median_steps = median_steps
+        n = self.shape[0] * self.shape[1]
+
+        self.count = np.zeros(n, dtype=np.int64)
+        self.sum = np.zeros(n, dtype=np.float64) if "mean" in modes else None
+        # min/max are kept together: both are cheap and the median needs both as bounds.
+        extremes = any(m in modes for m in ("min", "max", "median"))
+        self.min = np.full(n, np.inf) if extremes else None
+        self.max = np.full(n, -np.inf) if extremes else None
+        self.median_weighted = np.zeros(n, dtype=np.float64) if "median" in modes else None
+
+    @property
+    def size(self) -> int:
+        return len(self.count)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """The accumulated reductions by name (for caching; see from_arrays)"""
+        names = ("count", "sum", "min", "max", "median_weighted")
+        return {name: getattr(self, name) for name in names if getattr(self, name) is not None}
+
+    @classmethod
+    def from_arrays(cls, shape: Tuple[int, int], modes: Iterable[str],
+                    arrays: Dict[str, np.ndarray]) -> 'GridAccumulator':
+        """Rebuild an accumulator from arrays(); arrays are used as-is (no copy)"""
+        acc = cls.__new__(cls)
+        acc.shape = tuple(shape)
+        acc.modes = tuple(modes)
+        acc.median_steps = MEDIAN_STEPS
+        acc.count = arrays["count"]
+        for name in ("sum", "min", "max", "median_weighted"):
+            setattr(acc, name, arrays.get(name))
+        return acc
+
+    def add(self, flat: np.ndarray, values: np.ndarray):
+        """Accumulate one batch of points given their flat cell indices"""
+        if len(flat) == 0:
+            return
+        batch_count = np.bincount(flat, minlength=self.size)
+        self.count += batch_count
+        # 1-D ufunc.at goes straight into the running grids in input order (sums exact across batches).
+        if self.sum is not None:
+            np.add.at(self.sum, flat, values)
+        if self.min is not None:
+            np.minimum.at(self.min, flat, values)
+            np.maximum.at(self.max, flat, values)
+
+        if self.median_weighted is not None:
+            # Bisect over the cells this batch touches, numbered through a lookup table (no sort).
+            cells = np.flatnonzero(batch_count)
+            lookup = np.empty(self.size, dtype=np.int64)
+            lookup[cells] = np.arange(len(cells))
+            inverse = lookup[flat]
+            batch_min = np.full(len(cells), np.inf)
+            batch_max = np.full(len(cells), -np.inf)
+            np.minimum.at(batch_min, inverse, values)
+            np.maximum.at(batch_max, inverse, values)
+            med = _approx_median(inverse, values, batch_min, batch_max, batch_count[cells], self.median_steps)
+            self.median_weighted[cells] += med * batch_count[cells]
+
+    def add_cells(self, rows: np.ndarray, cols: np.ndarray, values: np.ndarray):
+        self.add(flat_cell_index(rows, cols, self.shape[1]), values)
+
+    def merge_window(self, other: 'GridAccumulator', window: Tuple[int, int, int, int]):
+        """Fold another accumulator that covers rows row0:row1, cols col0:col1 of this grid"""
+        row0, row1, col0, col1 = window
+
+        def _view(a):
+            return a.reshape(self.shape)[row0:row1, col0:col1]
+
+        def _other(a):
+            return a.reshape(other.shape)
+
+        _view(self.count)[...] += _other(other.count)
+        if self.sum is not None:
+            _view(self.sum)[...] += _other(other.sum)
+        if self.min is not None:
+            np.minimum(_view(self.min), _other(other.min), out=_view(self.min))
+            np.maximum(_view(self.max), _other(other.max), out=_view(self.max))
+        if self.median_weighted is not None:
+            _view(self.median_weighted)[...] += _other(other.median_weighted)
+
+    @property
+    def sum_grid(self) -> Optional[np.ndarray]:
+        return None if self.sum is None else self.sum.reshape(self.shape)
+
+    @property
+    def count_grid(self) -> np.ndarray:
+        return self.count.reshape(self.shape)
+
+    def result(self, mode: str = "mean", scale: float = 1.0) -> np.ndarray:
+        """
+        Reduce to a float32 grid, NaN where no points landed.
+
+        scale multiplies the values (not counts), e.g. a feet->meters factor
+        applied after binning.
+        """
+        if mode not in self.modes:
+            raise ValueError(f"Bin mode '{mode}' was not accumulated (have {self.modes})")
+        if mode == "count":
+            return self.count_grid.astype(np.float32)
+
+        mask = self.count > 0
+        out = np.full(self.size, np.nan, dtype=np.float32)
+        if mode == "mean":
+            vals = self.sum[mask] / self.count[mask]
+        elif mode == "min":
+            vals = self.min[mask]
+        elif mode == "max":
+            vals = self.max[mask]
+        else:
+            vals = self.median_weighted[mask] / self.count[mask]
+        if scale != 1.0:
+            vals = vals * scale
+        out[mask] = vals.astype(np.float32)
+        return out.reshape(self.shape)
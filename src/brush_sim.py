@@ -0,0 +1,175 @@
+"""
+CourseForge - Brush Simulation Module
+Predicts the terrain a list of landscaping stamps produces, offline and without the game
+"""
+import math
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from scipy.signal import fftconvolve
+
+from src.course_file import BrushLayer
+from src.stamps import PLOT_MAX, PLOT_MIN, sample_bilinear
+
+
+# Tools/types the simulator models (README findings for 2K25):
+# tool 1 = raise/lower delta, type 54 = soft circle, value in meters at the centre.
+DELTA_TOOL = 1
+SOFT_CIRCLE_TYPE = 54
+
+# The falloff below is NOT calibrated against the game yet: both constants are
+# assumptions, so simulated heights (previews, solver, compaction error) are
+# estimates of the shape, not of in-game meters.
+
+# scale.x / scale.z are taken as the brush diameter in meters (uncalibrated).
+RADIUS_PER_SCALE = 0.5
+
+# Fraction of the radius held at full strength before the smoothstep falloff starts.
+# 0.0 is a pure smoothstep bump (uncalibrated); tune against in-game captures.
+SOFT_CIRCLE_HARDNESS = 0.0
+
+
+@dataclass
+class SimGrid:
+    """Square raster over the plot; cell (row, col) sits at (x=min+col*res, z=min+row*res)"""
+    resolution: float = 1.0
+    plot_min: float = PLOT_MIN
+    plot_max: float = PLOT_MAX
+
+    @property
+    def size(self) -> int:
+        return int(round((self.plot_max - self.plot_min) / self.resolution)) + 1
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (self.size, self.size)
+
+    def coords(self) -> np.ndarray:
+        return self.plot_min + np.arange(self.size) * self.resolution
+
+
+def soft_circle_profile(t: np.ndarray, hardness: float = SOFT_CIRCLE_HARDNESS) -> np.ndarray:
+    """Relative strength at normalized radius t (0 centre, 1 edge); zero outside"""
+    u = np.clip((t - hardness) / max(1.0 - hardness, 1e-9), 0.0, 1.0)
+    return 1.0 - u * u * (3.0 - 2.0 * u)
+
+
+def brush_kernel(scale_x: float, scale_z: float, resolution: float,
+                 hardness: float = SOFT_CIRCLE_HARDNESS) -> np.ndarray:
+    """Unit-peak footprint raster of one stamp, [row=z][col=x], odd-sized and centred"""
+    rx = max(scale_x * RADIUS_PER_SCALE / resolution, 1e-6)
+    rz = max(scale_z * RADIUS_PER_SCALE / resolution, 1e-6)
+    kx, kz = int(math.ceil(rx)), int(math.ceil(rz))
+    dz, dx = np.mgrid[-kz:kz + 1, -kx:kx + 1]
+    t = np.sqrt((dx / rx) ** 2 + (dz / rz) ** 2)
+    return soft_circle_profile(t, hardness)
+
+
+def _splat_impulses(x, z, values, grid: SimGrid, pad_x: int, pad_z: int) -> np.ndarray:
+    """Bilinear impulse image on the padded grid (sub-cell stamp positions are kept)"""
+    h, w = grid.size + 2 * pad_z, grid.size + 2 * pad_x
+    fc = (x - grid.plot_min) / grid.resolution + pad_x
+    fr = (z - grid.plot_min) / grid.resolution + pad_z
+    c0 = np.floor(fc).astype(np.int64)
+    r0 = np.floor(fr).astype(np.int64)
+    tc = fc - c0
+    tr = fr - r0
+
+    impulses = np.zeros(h * w, dtype=np.float64)
+    for dr, dc, wgt in ((0, 0, (1 - tr) * (1 - tc)), (0, 1, (1 - tr) * tc),
+                        (1, 0, tr * (1 - tc)), (1, 1, tr * tc)):
+        r, c = r0 + dr, c0 + dc
+        ok = (r >= 0) & (r < h) & (c >= 0) & (c < w)
+        impulses += np.bincount(r[ok] * w + c[ok], weights=(values * wgt)[ok], minlength=h * w)
+    return impulses.reshape(h, w)
+
+
+def _splat_direct(out: np.ndarray, x, z, values, kernel: np.ndarray, grid: SimGrid):
+    """
+    Add value * kernel around each stamp (cheap for small groups).
+
+    The stamp is spread over its four surrounding cells with bilinear weights,
+    exactly like _splat_impulses + convolution, so both paths agree.
+    """
+    kz, kx = kernel.shape[0] // 2, kernel.shape[1] // 2
+    fc = (x - grid.plot_min) / grid.resolution
+    fr = (z - grid.plot_min) / grid.resolution
+    c0 = np.floor(fc).astype(np.int64)
+    r0 = np.floor(fr).astype(np.int64)
+    tc = fc - c0
+    tr = fr - r0
+    n = grid.size
+    for dr, dc, wgt in ((0, 0, (1 - tr) * (1 - tc)), (0, 1, (1 - tr) * tc),
+                        (1, 0, tr * (1 - tc)), (1, 1, tr * tc)):
+        for r, c, v in zip((r0 + dr).tolist(), (c0 + dc).tolist(), (values * wgt).tolist()):
+            if v == 0.0:
+                continue
+            ra, rb = max(r - kz, 0), min(r + kz + 1, n)
+            ca, cb = max(c - kx, 0), min(c + kx + 1, n)
+            if ra >= rb or ca >= cb:
+                continue
+            out[ra:rb, ca:cb] += v * kernel[ra - (r - kz):rb - (r - kz), ca - (c - kx):cb - (c - kx)]
+
+
+def _fft_cost(grid_size: int, kernel: np.ndarray) -> float:
+    n = (grid_size + kernel.shape[0]) * (grid_size + kernel.shape[1])
+    return 3.0 * n * math.log2(max(n, 2))
+
+
+def simulate_heightfield(
+    layer: BrushLayer,
+    grid: Optional[SimGrid] = None,
+    hardness: float = SOFT_CIRCLE_HARDNESS,
+    tools: Iterable[int] = (DELTA_TOOL,),
+    brush_types: Iterable[int] = (SOFT_CIRCLE_TYPE,),
+) -> np.ndarray:
+    """
+    Rasterize the summed terrain delta (meters) of a stamp list.
+
+    Stamps are grouped by footprint size; each group is splatted as bilinear
+    impulses and convolved with its kernel by FFT, or added kernel-by-kernel
+    (with the same bilinear weights) when the group is small enough that this
+    is cheaper. Stamps of other tools/types are ignored. The falloff is
+    uncalibrated (see SOFT_CIRCLE_HARDNESS).
+    """
+    if grid is None:
+        grid = SimGrid()
+    out = np.zeros(grid.shape, dtype=np.float64)
+    d = layer.data
+    if len(d) == 0:
+        return out
+
+    use = np.isin(d["tool"], list(tools)) & np.isin(d["type"], list(brush_types)) & (d["value"] != 0.0)
+    d = d[use]
+    if len(d) == 0:
+        return out
+
+    # Group by footprint quantized to the raster so each group shares one kernel.
+    keys = np.stack([
+        np.round(d["scale_x"] / grid.resolution).astype(np.int64),
+        np.round(d["scale_z"] / grid.resolution).astype(np.int64),
+    ], axis=1)
+    footprints, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    for i, (qx, qz) in enumerate(footprints.tolist()):
+        idx = np.flatnonzero(inverse == i)
+        kernel = brush_kernel(qx * grid.resolution, qz * grid.resolution, grid.resolution, hardness)
+        x, z, v = d["pos_x"][idx], d["pos_z"][idx], d["value"][idx]
+        if len(idx) * kernel.size < _fft_cost(grid.size, kernel):
+            _splat_direct(out, x, z, v, kernel, grid)
+        else:
+            pad_z, pad_x = kernel.shape[0] // 2, kernel.shape[1] // 2
+            impulses = _splat_impulses(x, z, v, grid, pad_x, pad_z)
+            out += fftconvolve(impulses, kernel, mode="valid")
+    return out
+
+
+def sample_target(height_grid: np.ndarray, grid: Optional[SimGrid] = None) -> np.ndarray:
+    """Resample a pipeline height_grid (stretched over the plot) onto the simulation raster"""
+    if grid is None:
+        grid = SimGrid()
+    c = grid.coords()
+    zz, xx = np.meshgrid(c, c, indexing="ij")
+    return sample_bilinear(height_grid, xx.ravel(), zz.ravel()).reshape(grid.shape)
@@ -0,0 +1,265 @@
+"""
+CourseForge - Catalog Module
+SQLite catalog of the .course files in the game folders, refreshed incrementally by mtime/size
+"""
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+from src.course_diff import subtree_digest
+from src.course_file import BRUSH_LAYERS, CourseFile
+
+
+# Bump when the scanned fields change so every entry is rescanned.
+CATALOG_FORMAT = 2
+
+# CourseDescription keys the pipeline sets on its copy of the template (write_course),
+# left out of template_hash so a generated course hashes like the template it came from.
+TEMPLATE_VOLATILE_KEYS = frozenset(BRUSH_LAYERS) | {
+    "name", "hillsAmount", "hillsHeight", "terrainNoise", "perturbationNoise",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    format INTEGER NOT NULL,
+    name TEXT,
+    theme INTEGER,
+    version TEXT,
+    height_strokes INTEGER,
+    terrain_strokes INTEGER,
+    template_hash TEXT,
+    content_hash TEXT,
+    error TEXT,
+    scanned_at REAL
+);
+CREATE INDEX IF NOT EXISTS courses_version ON courses (version, height_strokes);
+CREATE INDEX IF NOT EXISTS courses_template ON courses (template_hash);
+CREATE INDEX IF NOT EXISTS courses_content ON courses (content_hash);
+"""
+
+
+@dataclass
+class CatalogEntry:
+    path: str
+    folder: str
+    mtime_ns: int
+    size: int
+    format: int
+    name: Optional[str] = None
+    theme: Optional[int] = None
+    version: Optional[str] = None
+    height_strokes: Optional[int] = None
+    terrain_strokes: Optional[int] = None
+    template_hash: Optional[str] = None
+    content_hash: Optional[str] = None
+    error: Optional[str] = None
+    scanned_at: Optional[float] = None
+
+
+_COLUMNS = tuple(f.name for f in fields(CatalogEntry))
+
+
+@dataclass
+class RefreshReport:
+    scanned: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+def _stroke_count(value: Any) -> int:
+    return len(value) if isinstance(value, list) else 0
+
+
+def template_hash(course: CourseFile) -> str:
+    """Hash of CourseDescription without strokes, name and the procedural knobs the pipeline sets"""
+    data = course.course_data
+    return subtree_digest({k: v for k, v in data.items() if k not in TEMPLATE_VOLATILE_KEYS}).hex()
+
+
+def _scan_course(job) -> CatalogEntry:
+    """Decode one file (lazily, no thumbnail) into its catalog row; failures become the error column"""
+    path, folder, mtime_ns, size = job
+    entry = CatalogEntry(path, folder, mtime_ns, size, CATALOG_FORMAT, scanned_at=time.time())
+    try:
+        course = CourseFile.load(Path(path), lazy=True)
+        data = course.course_data
+        entry.name = course.get_name()
+        entry.theme = course.get_theme()
+        entry.version = course.version.value
+        entry.height_strokes = _stroke_count(data.get("height"))
+        entry.terrain_strokes = _stroke_count(data.get("terrainHeight"))
+        entry.template_hash = template_hash(course)
+        entry.content_hash = subtree_digest(data).hex()
+    except Exception as exc:  # a corrupt file must not stop the scan
+        entry.error = f"{type(exc).__name__}: {exc}"
+    return entry
+
+
+class CourseCatalog:
+    """
+    One row per .course file: name, theme, game version, stroke counts and
+    template/content hashes, so lookups never decode a course.
+
+    refresh() stats the folders and rescans only files whose mtime or size
+    changed (in parallel), dropping rows for files that are gone.
+    """
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> 'CourseCatalog':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM courses").fetchone()[0]
+
+    # ---- refresh ----
+
+    def refresh(self, folders: Iterable[Union[str, Path]], workers: Optional[int] = None,
+                log=None) -> RefreshReport:
+        """Bring the catalog in line with the .course files directly inside folders"""
+        start = time.perf_counter()
+        report = RefreshReport()
+        folders = [Path(f) for f in folders]
+        known = {
+            row["path"]: (row["mtime_ns"], row["size"], row["format"])
+            for row in self.conn.execute(
+                f"SELECT path, mtime_ns, size, format FROM courses WHERE folder IN ({','.join('?' * len(folders))})",
+                [str(f) for f in folders],
+            )
+        }
+        jobs = []
+        seen = set()
+        for folder in folders:
+            if not folder.is_dir():
+                continue
+            with os.scandir(folder) as it:
+                for item in it:
+                    if not item.name.endswith(".course") or not item.is_file():
+                        continue
+                    st = item.stat()
+                    path = str(Path(folder) / item.name)
+                    seen.add(path)
+                    if known.get(path) == (st.st_mtime_ns, st.st_size, CATALOG_FORMAT):
+                        report.unchanged += 1
+                    else:
+                        jobs.append((path, str(folder), st.st_mtime_ns, st.st_size))
+
+        gone = [p for p in known if p not in seen]
+        with self.conn:
+            self.conn.executemany("DELETE FROM courses WHERE path = ?", [(p,) for p in gone])
+        report.removed = len(gone)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, len(jobs)))
+        if workers == 1:
+            entries = map(_scan_course, jobs)
+            self._store(entries, report, log)
+        else:
+            # spawn like the other pools (lazrs and friends do not survive fork)
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                self._store(pool.map(_scan_course, jobs, chunksize=4), report, log)
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def _store(self, entries: Iterable[CatalogEntry], report: RefreshReport, log):
+        sql = f"INSERT OR REPLACE INTO courses ({','.join(_COLUMNS)}) VALUES ({','.join('?' * len(_COLUMNS))})"
+        with self.conn:
+            for entry in entries:
+                self.conn.execute(sql, [getattr(entry, c) for c in _COLUMNS])
+                report.scanned += 1
+                if entry.error:
+                    report.failed += 1
+                if log is not None:
+                    log(f"  {Path(entry.path).name}: {entry.error or entry.name}")
+
+    # ---- queries ----
+
+    def query(self, version: Optional[str] = None, template: Optional[Union[str, Path]] = None,
+              min_strokes: Optional[int] = None, max_strokes: Optional[int] = None,
+              theme: Optional[int] = None, name: Optional[str] = None,
+              content_hash: Optional[str] = None) -> List[CatalogEntry]:
+        """
+        Entries matching every given filter, largest first. version is a
+        GameVersion value ("2K25"); template is a template hash or a .course
+        file (hashed here); name matches as a case-insensitive substring.
+        """
+        where, args = ["error IS NULL"], []
+        if version is not None:
+            where.append("version = ?")
+            args.append(version)
+        if template is not None:
+            where.append("template_hash = ?")
+            args.append(self.template_hash_of(template))
+        if min_strokes is not None:
+            where.append("height_strokes >= ?")
+            args.append(min_strokes)
+        if max_strokes is not None:
+            where.append("height_strokes <= ?")
+            args.append(max_strokes)
+        if theme is not None:
+            where.append("theme = ?")
+            args.append(theme)
+        if name is not None:
+            where.append("name LIKE ?")
+            args.append(f"%{name}%")
+        if content_hash is not None:
+            where.append("content_hash = ?")
+            args.append(content_hash)
+        rows = self.conn.execute(
+            f"SELECT {','.join(_COLUMNS)} FROM courses WHERE {' AND '.join(where)} "
+            "ORDER BY height_strokes DESC, path",
+            args,
+        )
+        return [CatalogEntry(**dict(row)) for row in rows]
+
+    def errors(self) -> List[CatalogEntry]:
+        rows = self.conn.execute(f"SELECT {','.join(_COLUMNS)} FROM courses WHERE error IS NOT NULL ORDER BY path")
+        return [CatalogEntry(**dict(row)) for row in rows]
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        """content_hash -> paths, for hashes held by more than one file"""
+        out: Dict[str, List[str]] = {}
+        rows = self.conn.execute(
+            "SELECT content_hash, path FROM courses WHERE content_hash IN "
+            "(SELECT content_hash FROM courses GROUP BY content_hash HAVING COUNT(*) > 1) ORDER BY path"
+        )
+        for row in rows:
+            out.setdefault(row["content_hash"], []).append(row["path"])
+        return out
+
+    def template_hash_of(self, template: Union[str, Path]) -> str:
+        """A template given as a hash is returned as is; a .course path is loaded and hashed"""
+        if isinstance(template, str) and not template.endswith(".course"):
+            return template
+        return template_hash(CourseFile.load(Path(template), lazy=True))
+
+
+def game_folders(versions: Optional[Sequence[str]] = None) -> List[Path]:
+    """The existing GAME_PATHS folders from config.py (all versions by default)"""
+    from config import GAME_PATHS
+
+    return [p for v, p in GAME_PATHS.items() if (versions is None or v in versions) and p.is_dir()]
@@ -0,0 +1,429 @@
+"""
+CourseForge - CLI Module
+`courseforge run` for one site, `courseforge batch` for a manifest of sites (process pool, memory budget, resume)
+and `courseforge catalog` to list/search the courses in the game folders
+"""
+import argparse
+import csv
+import dataclasses
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.catalog import CourseCatalog, game_folders
+from src.pipeline import PipelineConfig, laz_fingerprint, pipeline_diagnostics, run_pipeline
+
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DEFAULT_TEMPLATE = PROJECT_ROOT / "reference" / "samples" / "2k25_flat.course"
+DEFAULT_CATALOG = PROJECT_ROOT / "output" / "catalog.sqlite"
+
+# Memory estimate for a site that has not run yet: interpreter + numpy/scipy,
+# raster stage arrays per grid cell (fewer when tiled) and one LAZ chunk.
+BASE_PROCESS_MB = 150.0
+BYTES_PER_CELL = 64
+TILED_BYTES_PER_CELL = 24
+BYTES_PER_POINT = 48
+# Headroom on a site's recorded peak RSS from an earlier run.
+RECORDED_PEAK_MARGIN = 1.2
+
+DONE_SUFFIX = ".done.json"
+
+
+@dataclass
+class Site:
+    """One course to build: its LiDAR tiles, template, knobs and output path"""
+    name: str
+    tiles: List[Path]
+    template: Path
+    output: Path
+    config: PipelineConfig
+    cache_dir: Optional[Path] = None
+
+
+@dataclass
+class SiteResult:
+    """How one site ended: "done", "skipped" (finished earlier), "empty" (no stamps) or "failed" """
+    name: str
+    status: str
+    output: Path
+    seconds: float = 0.0
+    estimate_mb: float = 0.0
+    peak_rss_mb: Optional[float] = None
+    error: Optional[str] = None
+
+
+# ---- manifest ----
+def _resolve_tiles(patterns: Sequence[str], base: Path) -> List[Path]:
+    tiles: List[Path] = []
+    for pattern in patterns:
+        path = Path(pattern)
+        path = path if path.is_absolute() else base / path
+        matches = sorted(Path(p) for p in glob.glob(str(path))) if glob.has_magic(str(path)) else [path]
+        tiles += [p for p in matches if p not in tiles]
+    return tiles
+
+
+def _profile_knobs(profile: Any, profiles: Dict[str, Any], base: Path) -> Dict[str, Any]:
+    """A profile is a name from the manifest's "profiles", a path to a JSON knob file, or a knob dict"""
+    if profile is None:
+        return {}
+    if isinstance(profile, dict):
+        return dict(profile)
+    if profile in profiles:
+        return dict(profiles[profile])
+    path = Path(profile)
+    path = path if path.is_absolute() else base / path
+    if path.exists():
+        return json.loads(path.read_text())
+    raise ValueError(f"Unknown profile '{profile}'")
+
+
+def load_manifest(path: Path, out_dir: Optional[Path] = None) -> List[Site]:
+    """
+    Sites from a JSON manifest. Relative paths are relative to the manifest.
+
+        {
+          "out_dir": "output/batch",           # default: <manifest dir>/output/batch
+          "template": "reference/samples/2k25_flat.course",
+          "knobs": {"GRID_SIZE": 2048},         # every site
+          "profiles": {"hilly": {"RELIEF_MULT": 0.5}},
+          "sites": [
+            {"name": "hole01", "tiles": ["tiles/hole01/*.laz"], "profile": "hilly"},
+            {"name": "hole02", "tiles": ["tiles/*.laz"], "bbox": [x0, y0, x1, y1],
+             "knobs": {"MOSAIC_CELL_SIZE_M": 0.5}, "course_name": "Hole 2"}
+          ]
+        }
+
+    A site's knobs are: manifest knobs, then its profile, then its own knobs,
+    then bbox (MOSAIC_BBOX) and course_name (default: the site name).
+    """
+    path = Path(path)
+    base = path.parent
+    manifest = json.loads(path.read_text())
+    out_dir = Path(out_dir) if out_dir is not None else base / manifest.get("out_dir", "output/batch")
+    cache_dir = manifest.get("cache_dir")
+    profiles = manifest.get("profiles", {})
+    names = set()
+    sites = []
+    for entry in manifest.get("sites", []):
+        name = entry["name"]
+        if name in names:
+            raise ValueError(f"Duplicate site name '{name}'")
+        names.add(name)
+        tiles = _resolve_tiles(entry.get("tiles", []), base)
+        if not tiles:
+            raise ValueError(f"Site '{name}': no tiles match {entry.get('tiles')}")
+        knobs = dict(manifest.get("knobs", {}))
+        knobs.update(_profile_knobs(entry.get("profile", manifest.get("profile")), profiles, base))
+        knobs.update(entry.get("knobs", {}))
+        if "bbox" in entry:
+            knobs["MOSAIC_BBOX"] = tuple(entry["bbox"])
+        knobs.setdefault("COURSE_NAME", entry.get("course_name", name))
+        # Sites already run side by side; one mosaic worker each avoids oversubscribing the cores.
+        knobs.setdefault("MOSAIC_WORKERS", 1)
+        template = Path(entry.get("template", manifest.get("template", DEFAULT_TEMPLATE)))
+        sites.append(Site(
+            name=name,
+            tiles=tiles,
+            template=template if template.is_absolute() else base / template,
+            output=out_dir / f"{name}.course",
+            config=PipelineConfig().with_knobs(knobs),
+            cache_dir=(base / cache_dir) if cache_dir else None,
+        ))
+    return sites
+
+
+# ---- resume ----
+def site_fingerprint(site: Site) -> str:
+    """Hash of everything that determines a site's course: knobs, tiles and template"""
+    template = site.template.stat()
+    payload = {
+        "config": dataclasses.asdict(site.config.effective()),
+        "tiles": laz_fingerprint(site.tiles),
+        "template": [str(site.template), template.st_size, template.st_mtime_ns],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _done_path(site: Site) -> Path:
+    return site.output.with_name(site.output.name + DONE_SUFFIX)
+
+
+def is_finished(site: Site) -> bool:
+    """The output exists and was produced from the current knobs/tiles/template"""
+    done = _done_path(site)
+    if not site.output.exists() or not done.exists():
+        return False
+    try:
+        return json.loads(done.read_text()).get("fingerprint") == site_fingerprint(site)
+    except (OSError, ValueError):
+        return False
+
+
+# ---- memory budget ----
+def available_memory_mb() -> Optional[float]:
+    try:
+        for line in Path("/proc/meminfo").read_text().splitlines():
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024.0 * 1024.0)
+    except ImportError:
+        return None
+
+
+def _recorded_peak_mb(site: Site) -> Optional[float]:
+    """Peak RSS of this site's last run, from its metrics file"""
+    path = site.output.with_suffix(".metrics.jsonl")
+    try:
+        for line in reversed(path.read_text().splitlines()):
+            record = json.loads(line)
+            if record.get("type") == "run" and record.get("peak_rss_mb"):
+                return float(record["peak_rss_mb"])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def estimate_memory_mb(site: Site) -> float:
+    """Expected peak RSS: the last recorded peak (plus margin), else a per-cell/per-point estimate"""
+    recorded = _recorded_peak_mb(site)
+    if recorded is not None:
+        return recorded * RECORDED_PEAK_MARGIN
+    config = site.config.effective()
+    cells = config.grid_size * config.grid_size
+    if config.mosaic_bbox is not None and config.mosaic_cell_size_m:
+        min_x, min_y, max_x, max_y = config.mosaic_bbox
+        scale = config.mosaic_horizontal_unit_m / config.mosaic_cell_size_m
+        cells = int((max_x - min_x) * scale + 1) * int((max_y - min_y) * scale + 1)
+    per_cell = TILED_BYTES_PER_CELL if config.raster_tile_size else BYTES_PER_CELL
+    return BASE_PROCESS_MB + (cells * per_cell + config.laz_chunk_size * BYTES_PER_POINT) / (1024.0 * 1024.0)
+
+
+# ---- running ----
+def run_site(site: Site, log=None) -> SiteResult:
+    """Build one site (log: None = <output>.log); top level so the batch pool can pickle it"""
+    t0 = time.perf_counter()
+    site.output.parent.mkdir(parents=True, exist_ok=True)
+    log_file = None
+    if log is None:
+        log_file = open(site.output.with_suffix(".log"), 'w', encoding='utf-8')
+
+        def log(line: str):
+            log_file.write(line + "\n")
+            log_file.flush()
+
+    try:
+        results = run_pipeline(site.config, site.tiles, site.template, site.output,
+                               cache_dir=site.cache_dir, log=log)
+    except Exception as exc:  # one bad site should not sink the batch
+        log(f"ERROR: {type(exc).__name__}: {exc}")
+        return SiteResult(site.name, "failed", site.output, time.perf_counter() - t0,
+                          error=f"{type(exc).__name__}: {exc}")
+    finally:
+        if log_file is not None:
+            log_file.close()
+    seconds = time.perf_counter() - t0
+    peak = _recorded_peak_mb(site) if site.config.write_metrics else None
+    if "write" not in results:
+        return SiteResult(site.name, "empty", site.output, seconds, peak_rss_mb=peak, error="no stamps created")
+    done = _done_path(site)
+    tmp = done.with_name(done.name + ".tmp")
+    tmp.write_text(json.dumps({
+        "fingerprint": site_fingerprint(site), "seconds": seconds,
+        "diagnostics": pipeline_diagnostics(results),
+    }, indent=1, default=str))
+    os.replace(tmp, done)
+    return SiteResult(site.name, "done", site.output, seconds, peak_rss_mb=peak)
+
+
+def run_batch(sites: Sequence[Site], workers: Optional[int] = None, memory_budget_mb: Optional[float] = None,
+              force: bool = False, log=print) -> List[SiteResult]:
+    """
+    Build every site, skipping those already finished (unless force).
+
+    Sites run in a spawn process pool of up to workers processes (None = all
+    cores), but a site only starts while the estimated peak memory of
+    everything running fits memory_budget_mb (None = 75% of available RAM);
+    a site bigger than the whole budget runs alone. Each site logs to
+    <output>.log; the batch writes <out_dir>/batch_summary.csv.
+    """
+    results: List[SiteResult] = []
+    todo: List[Site] = []
+    for site in sites:
+        if not force and is_finished(site):
+            results.append(SiteResult(site.name, "skipped", site.output))
+            log(f"  {site.name}: finished earlier, skipped")
+        else:
+            todo.append(site)
+    if memory_budget_mb is None:
+        available = available_memory_mb()
+        memory_budget_mb = 0.75 * available if available else 4096.0
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(todo) or 1))
+    estimates = {site.name: estimate_memory_mb(site) for site in todo}
+    log(f"Batch: {len(todo)} to build, {len(results)} skipped; {workers} workers, "
+        f"memory budget {memory_budget_mb:.0f} MB")
+
+    t0 = time.perf_counter()
+    if workers == 1:
+        for site in todo:
+            results.append(_finish(run_site(site), estimates[site.name], log))
+    else:
+        pending = list(todo)
+        running = {}
+        # spawn, not fork: lazrs keeps a native thread pool that does not survive fork.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            while pending or running:
+                in_use = sum(estimates[s.name] for s in running.values())
+                while pending and len(running) < workers:
+                    need = estimates[pending[0].name]
+                    if running and in_use + need > memory_budget_mb:
+                        break
+                    site = pending.pop(0)
+                    if need > memory_budget_mb:
+                        log(f"  {site.name}: estimated {need:.0f} MB exceeds the budget; running it alone")
+                    running[pool.submit(run_site, site)] = site
+                    in_use += need
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    site = running.pop(future)
+                    results.append(_finish(future.result(), estimates[site.name], log))
+
+    if sites:
+        write_batch_summary(results, sites[0].output.parent / "batch_summary.csv")
+    failed = sum(1 for r in results if r.status in ("failed", "empty"))
+    built = sum(1 for r in results if r.status == "done")
+    log(f"Batch done: {built} built, {len(results) - built - failed} skipped, {failed} failed "
+        f"in {time.perf_counter() - t0:.1f} s")
+    return results
+
+
+def _finish(result: SiteResult, estimate_mb: float, log) -> SiteResult:
+    result.estimate_mb = estimate_mb
+    peak = f", peak {result.peak_rss_mb:.0f} MB" if result.peak_rss_mb else ""
+    detail = f"{result.status.upper()} {result.error}" if result.error else result.output.name
+    log(f"  {result.name}: {detail} ({result.seconds:.1f} s{peak})")
+    return result
+
+
+def write_batch_summary(results: Sequence[SiteResult], path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["site", "status", "output", "seconds", "estimate_mb", "peak_rss_mb", "error"])
+        for r in results:
+            writer.writerow([r.name, r.status, r.output.name, f"{r.seconds:.2f}", f"{r.estimate_mb:.0f}",
+                             "" if r.peak_rss_mb is None else f"{r.peak_rss_mb:.0f}", r.error or ""])
+
+
+# ---- command line ----
+def _parse_knob(text: str):
+    """KNOB=VALUE with VALUE as JSON when it parses (numbers, true/false/null, lists), else a string"""
+    if "=" not in text:
+        raise argparse.ArgumentTypeError(f"expected KNOB=VALUE, got '{text}'")
+    key, value = text.split("=", 1)
+    try:
+        return key.strip(), json.loads(value)
+    except ValueError:
+        return key.strip(), value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="courseforge", description="LiDAR -> PGA TOUR 2K .course files")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="build one course from LAZ tiles")
+    run.add_argument("tiles", nargs="+", help=".laz files or glob patterns")
+    run.add_argument("-o", "--output", type=Path, required=True, help="output .course path")
+    run.add_argument("--template", type=Path, default=DEFAULT_TEMPLATE)
+    run.add_argument("--profile", help="JSON file of knobs")
+    run.add_argument("--bbox", type=float, nargs=4, metavar=("MIN_X", "MIN_Y", "MAX_X", "MAX_Y"))
+    run.add_argument("--set", dest="knobs", type=_parse_knob, action="append", default=[],
+                     metavar="KNOB=VALUE", help="override a knob (repeatable), e.g. --set RELIEF_MULT=0.5")
+
+    batch = sub.add_parser("batch", help="build every site of a JSON manifest")
+    batch.add_argument("manifest", type=Path)
+    batch.add_argument("--out-dir", type=Path, default=None, help="override the manifest's out_dir")
+    batch.add_argument("--workers", type=int, default=None, help="max concurrent sites (default: all cores)")
+    batch.add_argument("--memory-budget-mb", type=float, default=None,
+                       help="max summed estimated peak RSS of running sites (default: 75%% of available RAM)")
+    batch.add_argument("--force", action="store_true", help="rebuild sites that are already finished")
+    batch.add_argument("--dry-run", action="store_true", help="list sites, status and memory estimates only")
+
+    catalog = sub.add_parser("catalog", help="refresh and search the catalog of game-folder courses")
+    catalog.add_argument("folders", nargs="*", type=Path, help="course folders (default: config.GAME_PATHS)")
+    catalog.add_argument("--db", type=Path, default=DEFAULT_CATALOG)
+    catalog.add_argument("--workers", type=int, default=None, help="parallel rescans (default: all cores)")
+    catalog.add_argument("--no-refresh", action="store_true", help="query the catalog as it is")
+    catalog.add_argument("--version", dest="game_version", help="e.g. 2K25")
+    catalog.add_argument("--template", help="template .course file or template hash")
+    catalog.add_argument("--min-strokes", type=int, default=None)
+    catalog.add_argument("--name", help="case-insensitive name substring")
+    return parser
+
+
+def _catalog(args) -> int:
+    folders = args.folders or game_folders()
+    with CourseCatalog(args.db) as catalog:
+        if not args.no_refresh:
+            if not folders:
+                raise ValueError("No course folders given and none of config.GAME_PATHS exist")
+            report = catalog.refresh(folders, args.workers)
+            print(f"Catalog {args.db}: {report.scanned} scanned ({report.failed} failed), "
+                  f"{report.unchanged} unchanged, {report.removed} removed in {report.seconds:.2f} s")
+        entries = catalog.query(args.game_version, args.template, args.min_strokes, name=args.name)
+        for e in entries:
+            print(f"  {Path(e.path).name}  {e.version}  {e.height_strokes:>7} strokes  "
+                  f"theme {e.theme}  template {e.template_hash[:12]}  {e.name}")
+        print(f"{len(entries)} course(s)")
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "run":
+            knobs = _profile_knobs(args.profile, {}, Path.cwd())
+            knobs.update(dict(args.knobs))
+            if args.bbox:
+                knobs["MOSAIC_BBOX"] = tuple(args.bbox)
+            tiles = _resolve_tiles(args.tiles, Path.cwd())
+            site = Site(args.output.stem, tiles, args.template, args.output, PipelineConfig().with_knobs(knobs))
+            result = run_site(site, log=print)
+            if result.error:
+                print(f"ERROR: {result.error}")
+            return 0 if result.status == "done" else 1
+        if args.command == "catalog":
+            return _catalog(args)
+
+        sites = load_manifest(args.manifest, args.out_dir)
+        if args.dry_run:
+            for site in sites:
+                status = "finished" if is_finished(site) else "to build"
+                print(f"  {site.name}: {len(site.tiles)} tile(s) -> {site.output} "
+                      f"[{status}, ~{estimate_memory_mb(site):.0f} MB]")
+            return 0
+        results = run_batch(sites, args.workers, args.memory_budget_mb, args.force)
+        return 1 if any(r.status in ("failed", "empty") for r in results) else 0
+    except (ValueError, OSError) as exc:
+        print(f"ERROR: {exc}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
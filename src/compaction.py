@@ -0,0 +1,196 @@
+"""
+CourseForge - Compaction Module
+Merges co-located identical strokes and folds redundant ones into their neighbours, within a simulated error bound
+"""
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from src.brush_sim import DELTA_TOOL, SimGrid
+from src.course_file import BrushLayer, CourseFile
+from src.stamp_solver import DEFAULT_NNZ_BUDGET, build_operator, solver_grid
+
+
+# Strokes closer than this (position, scale, rotation) count as the same spot/footprint.
+MERGE_RESOLUTION = 0.001
+
+# Fields that must agree (after rounding floats to MERGE_RESOLUTION) for strokes to merge.
+_MERGE_FIELDS = ("tool", "type", "holeId", "pos_x", "pos_y", "pos_z", "rot_x", "rot_y", "rot_z",
+                 "scale_x", "scale_y", "scale_z")
+
+@dataclass
+class CompactionReport:
+    strokes_before: int = 0
+    strokes_after: int = 0
+    merged: int = 0
+    # Strokes removed with their contribution refit into overlapping neighbours
+    absorbed: int = 0
+    # Neighbours whose value changed to absorb them
+    adjusted: int = 0
+    # Simulated terrain change (meters) against the input layer, on a resolution_m raster
+    max_error_m: float = 0.0
+    rms_error_m: float = 0.0
+    resolution_m: float = 0.0
+
+    @property
+    def reduction(self) -> float:
+        return 1.0 - self.strokes_after / max(1, self.strokes_before)
+
+    def summary(self) -> str:
+        return (
+            f"{self.strokes_before} -> {self.strokes_after} strokes ({100.0 * self.reduction:.1f}% fewer: "
+            f"{self.merged} merged, {self.absorbed} absorbed into {self.adjusted} neighbours), error max "
+            f"{self.max_error_m:.4f} m / RMS {self.rms_error_m:.5f} m @ {self.resolution_m:.1f} m"
+        )
+
+
+def _merge_keys(data: np.ndarray) -> np.ndarray:
+    cols = []
+    for name in _MERGE_FIELDS:
+        col = data[name]
+        if col.dtype.kind == "f":
+            # -inf (the y position) stays distinct from any finite value and equal to itself
+            finite = np.isfinite(col)
+            q = np.zeros(len(col), dtype=np.int64)
+            q[finite] = np.round(col[finite] / MERGE_RESOLUTION)
+            q[~finite & (col > 0)] = np.iinfo(np.int64).max
+            q[~finite & (col < 0)] = np.iinfo(np.int64).min
+            col = q
+        cols.append(col.astype(np.int64))
+    return np.stack(cols, axis=1)
+
+
+def _merge_identical(d: np.ndarray, additive: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(keep, values): additive strokes with the same footprint folded into the first, values summed"""
+    values = d["value"].astype(np.float64).copy()
+    keep = np.ones(len(d), dtype=bool)
+    idx = np.flatnonzero(additive)
+    if len(idx):
+        _, first, inverse = np.unique(_merge_keys(d[idx]), axis=0, return_index=True, return_inverse=True)
+        heads = idx[first]
+        values[heads] = np.bincount(inverse.ravel(), weights=values[idx])
+        keep[idx] = False
+        keep[heads] = True
+    return keep, values
+
+
+def _columns(A: sparse.csc_matrix, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(row, position in cols, weight) of every nonzero in the given columns of A"""
+    starts = A.indptr[cols]
+    lens = A.indptr[cols + 1] - starts
+    take = np.repeat(starts - np.cumsum(lens) + lens, lens) + np.arange(int(lens.sum()))
+    return A.indices[take], np.repeat(np.arange(len(cols)), lens), A.data[take]
+
+
+def _refit(A_n: np.ndarray, want: np.ndarray) -> np.ndarray:
+    """Least-squares dx with A_n @ dx ~ want, through the (small) normal equations"""
+    gram = A_n.T @ A_n
+    # A whisper of ridge keeps coincident footprints (a singular Gram) solvable.
+    ridge = 1e-9 * max(float(np.max(np.diag(gram), initial=0.0)), 1e-12)
+    return np.linalg.solve(gram + ridge * np.eye(len(gram)), A_n.T @ want)
+
+
+def _try_absorb(A: sparse.csc_matrix, overlap: sparse.csr_matrix, x: np.ndarray, resid: np.ndarray,
+                active: np.ndarray, j: int, tolerance: float, max_abs: Optional[float]):
+    """
+    Drop stroke j and least-squares refit the active strokes overlapping it.
+
+    Returns (neighbours, their new values, cells, new residual on cells), or
+    None if some cell would end up more than tolerance off.
+    """
+    near = overlap.indices[overlap.indptr[j]:overlap.indptr[j + 1]]
+    near = near[active[near] & (near != j)]
+    rows, which, weights = _columns(A, np.concatenate([[j], near]))
+    cells = np.flatnonzero(np.bincount(rows, minlength=A.shape[0]))
+    # Dense footprints on just the cells they touch: column 0 is j, the rest its neighbours.
+    local = np.zeros((len(cells), len(near) + 1))
+    local[np.searchsorted(cells, rows), which] = weights
+    A_n = local[:, 1:]
+    r = resid[cells] - local[:, 0] * x[j]
+    new_vals = x[near] + _refit(A_n, -r)
+    if max_abs is not None:
+        new_vals = np.clip(new_vals, -max_abs, max_abs)
+    r = r + A_n @ (new_vals - x[near])
+    if len(r) and float(np.max(np.abs(r))) > tolerance:
+        return None
+    return near, new_vals, cells, r
+
+
+def compact_layer(layer: BrushLayer, tolerance: float = 0.25, resolution: float = 4.0,
+                  tools: Iterable[int] = (DELTA_TOOL,), max_abs: Optional[float] = None,
+                  nnz_budget: int = DEFAULT_NNZ_BUDGET) -> Tuple[BrushLayer, CompactionReport]:
+    """
+    Compacted copy of layer plus what it cost.
+
+    Strokes of additive `tools` (raise/lower deltas) that share tool, type,
+    hole, position, rotation and scale are first merged into one with their
+    values summed, which leaves the terrain unchanged.
+
+    Then strokes are dropped, smallest simulated contribution first, and the
+    additive strokes overlapping them are refit by least squares to take
+    over their share, e.g. water drain strokes folded into the lattice around
+    them. Heights are simulated with build_operator (the brush_sim soft
+    circle at exact stroke positions, every type treated alike) on a raster
+    of resolution meters, coarsened to stay within nnz_budget. A drop is kept
+    only while that height stays within tolerance meters of the input in
+    every cell; refit values are clipped to max_abs. Other strokes are kept
+    as they are, and the list order stays.
+    """
+    tools = list(tools)
+    d = layer.data
+    report = CompactionReport(strokes_before=len(d), resolution_m=resolution)
+    additive = np.isin(d["tool"], tools)
+    keep, values = _merge_identical(d, additive)
+    report.merged = int(len(d) - keep.sum())
+
+    sim = np.flatnonzero(keep & additive)
+    if len(sim):
+        sim_layer = BrushLayer(d[sim].copy())
+        grid = SimGrid(resolution=max(resolution, solver_grid(sim_layer, nnz_budget).resolution))
+        report.resolution_m = grid.resolution
+        A = build_operator(sim_layer, grid).tocsc()
+        # Strokes share a cell exactly when their footprints overlap.
+        pattern = A.copy()
+        pattern.data[:] = 1.0
+        overlap = (pattern.T @ pattern).tocsr()
+
+        x = values[sim].copy()
+        resid = np.zeros(A.shape[0])
+        active = np.ones(len(sim), dtype=bool)
+        changed = np.zeros(len(sim), dtype=bool)
+        col_norm = np.sqrt(np.asarray(A.multiply(A).sum(axis=0)).ravel())
+        # Smallest contribution first; strokes that never reach the raster (off the plot) are left alone.
+        for j in np.argsort(np.abs(x) * col_norm, kind="stable").tolist():
+            if col_norm[j] == 0.0:
+                continue
+            absorbed = _try_absorb(A, overlap, x, resid, active, j, tolerance, max_abs)
+            if absorbed is None:
+                continue
+            near, new_vals, cells, r = absorbed
+            x[near] = new_vals
+            x[j] = 0.0
+            resid[cells] = r
+            active[j] = False
+            changed[near] = True
+
+        values[sim] = x
+        keep[sim[~active]] = False
+        report.absorbed = int(np.count_nonzero(~active))
+        report.adjusted = int(np.count_nonzero(changed & active))
+        report.max_error_m = float(np.max(np.abs(resid))) if len(resid) else 0.0
+        report.rms_error_m = float(np.sqrt(np.mean(resid ** 2))) if len(resid) else 0.0
+
+    out = d[keep].copy()
+    out["value"] = values[keep]
+    report.strokes_after = len(out)
+    return BrushLayer(out), report
+
+
+def compact_course(course: CourseFile, name: str = "height", tolerance: float = 0.25,
+                   resolution: float = 4.0) -> CompactionReport:
+    """Compact the strokes of course's `name` layer in place"""
+    compacted, report = compact_layer(course.layer(name), tolerance, resolution)
+    course.set_layer(name, compacted)
+    return report
@@ -0,0 +1,248 @@
+"""
+CourseForge - Course Diff Module
+Structural diff of two loaded courses: hashed subtrees, brush strokes matched by position
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.course_file import BRUSH_DTYPE, BRUSH_LAYERS, BrushLayer, CourseFile
+
+
+# Stroke positions are matched on a 1 mm lattice (the precision compact saves write).
+KEY_RESOLUTION = 0.001
+
+
+# ---- generic JSON trees ----
+
+def _encode(value):
+    if isinstance(value, BrushLayer):
+        return {"$strokes": _layer_digest(value)}
+    raise TypeError(f"Cannot hash {type(value).__name__}")
+
+
+def subtree_digest(value: Any) -> bytes:
+    """Content hash of a JSON subtree (key order ignored); BrushLayers hash their raw records"""
+    text = json.dumps(value, sort_keys=True, separators=(",", ":"), default=_encode)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _layer_digest(layer: BrushLayer) -> str:
+    return hashlib.blake2b(np.ascontiguousarray(layer.data).tobytes(), digest_size=16).hexdigest()
+
+
+def _diff_tree(a: Any, b: Any, path: str, out: List[Tuple[str, str]]):
+    """
+    Append (kind, path) for every differing node under a / b.
+
+    Subtrees are compared by digest first (Merkle-style) and only descended
+    into when they differ, so identical regions cost one hash each.
+    """
+    if type(a) != type(b):
+        out.append(("changed", path or "<root>"))
+        return
+    if isinstance(a, dict):
+        for k in sorted(set(a) | set(b)):
+            sub = f"{path}.{k}" if path else k
+            if k not in b:
+                out.append(("removed", sub))
+            elif k not in a:
+                out.append(("added", sub))
+            elif a[k] is not b[k] and subtree_digest(a[k]) != subtree_digest(b[k]):
+                _diff_tree(a[k], b[k], sub, out)
+        return
+    if isinstance(a, list):
+        _diff_list(a, b, path, out)
+        return
+    if a != b and not (a != a and b != b):  # NaN == NaN here
+        out.append(("changed", path or "<root>"))
+
+
+def _diff_list(a: list, b: list, path: str, out: List[Tuple[str, str]]):
+    """
+    Lists of equal length are compared position by position. Otherwise
+    identical elements are paired by digest first (so one insertion does not
+    shift every later index into a change); the leftovers are paired in order
+    and diffed, the surplus reported as added/removed.
+    """
+    ha = [subtree_digest(v) for v in a]
+    hb = [subtree_digest(v) for v in b]
+    if len(a) == len(b):
+        for i, (x, y) in enumerate(zip(ha, hb)):
+            if x != y:
+                _diff_tree(a[i], b[i], f"{path}[{i}]", out)
+        return
+
+    pending: Dict[bytes, List[int]] = {}
+    for j, h in enumerate(hb):
+        pending.setdefault(h, []).append(j)
+    left_a = []
+    for i, h in enumerate(ha):
+        if pending.get(h):
+            pending[h].pop(0)
+        else:
+            left_a.append(i)
+    left_b = sorted(j for js in pending.values() for j in js)
+    for i, j in zip(left_a, left_b):
+        _diff_tree(a[i], b[j], f"{path}[{i}]" if i == j else f"{path}[{i}->{j}]", out)
+    out.extend(("removed", f"{path}[{i}]") for i in left_a[len(left_b):])
+    out.extend(("added", f"{path}[{j}]") for j in left_b[len(left_a):])
+
+
+# ---- brush layers ----
+
+@dataclass
+class LayerDiff:
+    """Strokes of one brush layer: positions into the old (a) and new (b) layers"""
+    name: str
+    added: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    removed: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    # (k, 2) pairs (position in a, position in b): same spot, other fields differ
+    modified: np.ndarray = field(default_factory=lambda: np.zeros((0, 2), dtype=np.int64))
+    unchanged: int = 0
+    # Modified stroke count per BRUSH_DTYPE field
+    fields: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def changed(self) -> bool:
+        return bool(len(self.added) or len(self.removed) or len(self.modified))
+
+    def summary(self) -> str:
+        text = (f"{self.name}: +{len(self.added)} -{len(self.removed)} ~{len(self.modified)}"
+                f" ={self.unchanged}")
+        if self.fields:
+            text += " (" + ", ".join(f"{k} {v}" for k, v in self.fields.items()) + ")"
+        return text
+
+
+def _ranks(ids: np.ndarray) -> np.ndarray:
+    """Occurrence number of each id among equal ids, in list order"""
+    order = np.argsort(ids, kind="stable")
+    s = ids[order]
+    first = np.flatnonzero(np.r_[True, s[1:] != s[:-1]])
+    rank = np.empty(len(ids), dtype=np.int64)
+    rank[order] = np.arange(len(ids)) - np.repeat(first, np.diff(np.r_[first, len(ids)]))
+    return rank
+
+
+def _match(ids_a: np.ndarray, ids_b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Positions (in a, in b) paired by equal id, the n-th occurrence in a with the n-th in b"""
+    ids = np.unique(np.concatenate([ids_a, ids_b]), return_inverse=True)[1].astype(np.int64).ravel()
+    ids_a, ids_b = ids[:len(ids_a)], ids[len(ids_a):]
+    width = max(len(ids_a), len(ids_b)) + 1
+    ka = ids_a * width + _ranks(ids_a)
+    kb = ids_b * width + _ranks(ids_b)
+    _, ia, ib = np.intersect1d(ka, kb, assume_unique=True, return_indices=True)
+    return ia, ib
+
+
+def _row_ids(data: np.ndarray) -> np.ndarray:
+    """Whole-record bytes as comparable void scalars"""
+    data = np.ascontiguousarray(data)
+    return data.view(np.dtype((np.void, BRUSH_DTYPE.itemsize)))
+
+
+def _spot_ids(data: np.ndarray) -> np.ndarray:
+    """Stroke centre snapped to KEY_RESOLUTION, packed into one int64"""
+    qx = np.round(np.nan_to_num(data["pos_x"]) / KEY_RESOLUTION).astype(np.int64)
+    qz = np.round(np.nan_to_num(data["pos_z"]) / KEY_RESOLUTION).astype(np.int64)
+    return (qx << 32) ^ (qz & 0xFFFFFFFF)
+
+
+def diff_layers(a: BrushLayer, b: BrushLayer, name: str = "height") -> LayerDiff:
+    """
+    Match strokes of a and b without relying on list order.
+
+    Byte-identical strokes pair up first; of the rest, strokes at the same
+    centre (x, z to KEY_RESOLUTION) are "modified", the remainder removed
+    (only in a) or added (only in b). Duplicates pair in list order.
+    """
+    da, db = a.data, b.data
+    if len(da) == len(db) and _layer_digest(a) == _layer_digest(b):
+        return LayerDiff(name, unchanged=len(da))
+
+    same_a, same_b = _match(_row_ids(da), _row_ids(db))
+    rest_a = np.setdiff1d(np.arange(len(da)), same_a, assume_unique=True)
+    rest_b = np.setdiff1d(np.arange(len(db)), same_b, assume_unique=True)
+
+    ia, ib = _match(_spot_ids(da[rest_a]), _spot_ids(db[rest_b]))
+    order = np.argsort(rest_a[ia], kind="stable")
+    modified = np.stack([rest_a[ia][order], rest_b[ib][order]], axis=1).astype(np.int64)
+    removed = np.setdiff1d(rest_a, rest_a[ia], assume_unique=True).astype(np.int64)
+    added = np.setdiff1d(rest_b, rest_b[ib], assume_unique=True).astype(np.int64)
+
+    fields = {}
+    if len(modified):
+        ma, mb = da[modified[:, 0]], db[modified[:, 1]]
+        for f in BRUSH_DTYPE.names:
+            n = int(np.count_nonzero((ma[f] != mb[f]) & ~(np.isnan(ma[f]) & np.isnan(mb[f]))
+                                     if ma[f].dtype.kind == "f" else ma[f] != mb[f]))
+            if n:
+                fields[f] = n
+    return LayerDiff(name, added, removed, modified, len(same_a), fields)
+
+
+# ---- courses ----
+
+@dataclass
+class CourseDiff:
+    """Everything that differs between two courses' CourseDescription data"""
+    # (kind, path) outside the brush layers; kind is "added", "removed" or "changed"
+    paths: List[Tuple[str, str]]
+    layers: Dict[str, LayerDiff]
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.paths) or any(d.changed for d in self.layers.values())
+
+    def lines(self, limit: Optional[int] = None) -> List[str]:
+        """Readable report: one line per layer, then one per changed path"""
+        out = [d.summary() for d in self.layers.values() if d.changed]
+        marks = {"added": "+", "removed": "-", "changed": "~"}
+        shown = self.paths if limit is None else self.paths[:limit]
+        out.extend(f"{marks[kind]} {path}" for kind, path in shown)
+        if limit is not None and len(self.paths) > limit:
+            out.append(f"... ({len(self.paths) - limit} more)")
+        return out
+
+
+def _brush_layer(course: CourseFile, name: str) -> Optional[BrushLayer]:
+    """
+    Strokes of `name` as a BrushLayer, without touching the course: a JSON
+    list is converted into a copy that is not stored back. None if the
+    course has no such array or it does not convert (the tree diff takes it).
+    """
+    current = course.course_data.get(name)
+    if current is None or isinstance(current, BrushLayer):
+        return current
+    try:
+        return BrushLayer.from_entries(current)
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        return None
+
+
+def diff_courses(a: CourseFile, b: CourseFile, layers: Sequence[str] = BRUSH_LAYERS) -> CourseDiff:
+    """
+    Diff the CourseDescription of a against b.
+
+    Brush arrays in `layers` are converted to BrushLayers (copies; neither
+    course is modified) and diffed stroke by stroke; everything else,
+    including brush arrays that do not convert, is walked as a JSON tree
+    that skips identical subtrees by hash.
+    """
+    layer_diffs = {}
+    for name in layers:
+        la, lb = _brush_layer(a, name), _brush_layer(b, name)
+        if la is not None and lb is not None:
+            layer_diffs[name] = diff_layers(la, lb, name)
+
+    paths: List[Tuple[str, str]] = []
+    ca, cb = a.course_data, b.course_data
+    rest_a = {k: v for k, v in ca.items() if k not in layer_diffs}
+    rest_b = {k: v for k, v in cb.items() if k not in layer_diffs}
+    if subtree_digest(rest_a) != subtree_digest(rest_b):
+        _diff_tree(rest_a, rest_b, "", paths)
+    return CourseDiff(paths, layer_diffs)
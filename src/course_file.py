@@ -4,11 +4,20 @@ Handles reading and writing PGA 2K course files
 """
 import json
 import base64
+import codecs
 import gzip
+import math
+import os
+import re
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple, Union
 from enum import Enum
 
+import numpy as np
+
 
 class GameVersion(Enum):
     TGC2019 = "2K19"
@@ -16,23 +25,875 @@ class GameVersion(Enum):
     PGA2K25 = "2K25"
 
 
+# Brush stroke arrays in CourseDescription that hold tool/position/rotation/scale entries
+BRUSH_LAYERS = ("height", "terrainHeight")
+
+# One packed record per stroke (86 bytes) instead of a dict tree per stroke
+BRUSH_DTYPE = np.dtype([
+    ("tool", np.int16),
+    ("type", np.int16),
+    ("value", np.float64),
+    ("pos_x", np.float64),
+    ("pos_y", np.float64),
+    ("pos_z", np.float64),
+    ("rot_x", np.float64),
+    ("rot_y", np.float64),
+    ("rot_z", np.float64),
+    ("scale_x", np.float64),
+    ("scale_y", np.float64),
+    ("scale_z", np.float64),
+    ("holeId", np.int16),
+])
+
+_STROKE_KEYS = {"tool", "position", "rotation", "scale", "type", "value", "holeId"}
+
+# Float column -> precision group used by BrushLayer.to_json
+_FIELD_GROUPS = {
+    "value": "value",
+    **{f"pos_{a}": "position" for a in "xyz"},
+    **{f"rot_{a}": "rotation" for a in "xyz"},
+    **{f"scale_{a}": "scale" for a in "xyz"},
+}
+
+# Decimal places for compact saves: millimetres for positions, values and scales
+DEFAULT_BRUSH_PRECISION = {"position": 3, "rotation": 3, "scale": 3, "value": 3}
+
+
+def _json_float(v: float) -> Union[float, str]:
+    """Non-finite floats are written as strings ("-Infinity"), as the game does"""
+    if math.isfinite(v):
+        return v
+    if math.isnan(v):
+        return "NaN"
+    return "Infinity" if v > 0 else "-Infinity"
+
+
+class BrushLayer:
+    """
+    Columnar brush strokes backed by a NumPy structured array (BRUSH_DTYPE).
+
+    Converts to/from the JSON list-of-dicts form only when asked (load/save);
+    bulk edits in between are array operations.
+    """
+
+    def __init__(self, data: Optional[np.ndarray] = None):
+        if data is None:
+            data = np.zeros(0, dtype=BRUSH_DTYPE)
+        if data.dtype != BRUSH_DTYPE:
+            raise ValueError(f"BrushLayer needs dtype {BRUSH_DTYPE}, got {data.dtype}")
+        self._buf = data
+        self._size = len(data)
+
+    @property
+    def data(self) -> np.ndarray:
+        """Live view of the strokes; edits to fields write through"""
+        return self._buf[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, key) -> 'BrushLayer':
+        """Slice, index array or boolean mask -> new layer (copy)"""
+        if isinstance(key, (int, np.integer)):
+            key = slice(key, key + 1 if key != -1 else None)
+        return BrushLayer(np.array(self.data[key], dtype=BRUSH_DTYPE, ndmin=1))
+
+    def __repr__(self) -> str:
+        return f"BrushLayer({self._size} strokes)"
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    # ---- construction ----
+
+    @classmethod
+    def from_entries(cls, entries: Sequence[Dict[str, Any]]) -> 'BrushLayer':
+        """Build from the JSON list form (as found in CourseDescription)"""
+        data = np.zeros(len(entries), dtype=BRUSH_DTYPE)
+        if not entries:
+            return cls(data)
+        for e in entries:
+            extra = set(e) - _STROKE_KEYS
+            if extra:
+                raise ValueError(f"Unsupported brush stroke keys: {sorted(extra)}")
+
+        def _col(getter):
+            return [getter(e) for e in entries]
+
+        data["tool"] = _col(lambda e: e.get("tool", 0))
+        data["type"] = _col(lambda e: e.get("type", 0))
+        data["value"] = _col(lambda e: float(e.get("value", 0.0)))
+        data["holeId"] = _col(lambda e: e.get("holeId", -1))
+        for group, prefix, default in (("position", "pos", 0.0), ("rotation", "rot", 0.0), ("scale", "scale", 1.0)):
+            for axis in ("x", "y", "z"):
+                # float() also parses the "-Infinity" strings used for y positions
+                data[f"{prefix}_{axis}"] = _col(lambda e: float(e.get(group, {}).get(axis, default)))
+        return cls(data)
+
+    @classmethod
+    def from_columns(cls, x, z, value, scale, tool, brush_type,
+                     y=-np.inf, hole_id: int = -1) -> 'BrushLayer':
+        """Build from per-stroke arrays (scalars broadcast), e.g. generated stamps"""
+        x = np.asarray(x, dtype=np.float64)
+        data = np.zeros(len(x), dtype=BRUSH_DTYPE)
+        data["pos_x"] = x
+        data["pos_y"] = y
+        data["pos_z"] = z
+        data["value"] = value
+        data["scale_x"] = scale
+        data["scale_y"] = 1.0
+        data["scale_z"] = scale
+        data["tool"] = tool
+        data["type"] = brush_type
+        data["holeId"] = hole_id
+        return cls(data)
+
+    @classmethod
+    def concat(cls, layers: Sequence['BrushLayer']) -> 'BrushLayer':
+        if not layers:
+            return cls()
+        return cls(np.concatenate([layer.data for layer in layers]))
+
+    def to_entries(self) -> List[Dict[str, Any]]:
+        """JSON list form, in the key order the game writes"""
+        d = self.data
+        cols = []
+        for name in BRUSH_DTYPE.names:
+            col = d[name].tolist()
+            if d[name].dtype.kind == "f" and not np.all(np.isfinite(d[name])):
+                col = [_json_float(v) for v in col]
+            cols.append(col)
+        entries = []
+        for (tool, brush_type, value, px, py, pz, rx, ry, rz, sx, sy, sz, hole) in zip(*cols):
+            entries.append({
+                "tool": tool,
+                "position": {"x": px, "y": py, "z": pz},
+                "rotation": {"x": rx, "y": ry, "z": rz},
+                "scale": {"x": sx, "y": sy, "z": sz},
+                "type": brush_type,
+                "value": value,
+                "holeId": hole,
+            })
+        return entries
+
+    def to_json(self, precision: Optional[Union[int, Dict[str, int]]] = None) -> str:
+        """
+        Compact JSON text of the list form with floats at fixed decimals.
+
+        precision is decimal places, either one int or per group ("position",
+        "rotation", "scale", "value"); default is DEFAULT_BRUSH_PRECISION.
+        Constant columns (rotation, y scale, the "-Infinity" y position, ...)
+        are formatted once into the row template; the rest go through a
+        single %-format per row instead of a dict walk in json.dumps.
+        """
+        if precision is None:
+            precision = DEFAULT_BRUSH_PRECISION
+        elif isinstance(precision, int):
+            precision = {group: precision for group in _FIELD_GROUPS.values()}
+        d = self.data
+        if len(d) == 0:
+            return "[]"
+
+        args = []
+
+        def _field(name: str) -> str:
+            col = d[name]
+            if col.dtype.kind != "f":
+                if np.all(col == col[0]):
+                    return str(int(col[0]))
+                args.append(col.tolist())
+                return "%d"
+            places = precision[_FIELD_GROUPS[name]]
+            if np.all(col == col[0]):
+                return json.dumps(_json_float(round(float(col[0]), places)))
+            if not np.all(np.isfinite(col)):
+                args.append([json.dumps(_json_float(round(v, places))) for v in col.tolist()])
+                return "%s"
+            args.append(col.tolist())
+            return f"%.{places}f"
+
+        def _vec(prefix: str) -> str:
+            return "{" + ",".join(f'"{axis}":{_field(f"{prefix}_{axis}")}' for axis in ("x", "y", "z")) + "}"
+
+        # Same key order as to_entries(); args are appended in template order.
+        template = (
+            f'{{"tool":{_field("tool")},"position":{_vec("pos")},"rotation":{_vec("rot")},'
+            f'"scale":{_vec("scale")},"type":{_field("type")},"value":{_field("value")},'
+            f'"holeId":{_field("holeId")}}}'
+        )
+        if not args:
+            return "[" + ",".join([template] * len(d)) + "]"
+        return "[" + ",".join(map(template.__mod__, zip(*args))) + "]"
+
+    # ---- bulk edits ----
+
+    def append(self, strokes: Union['BrushLayer', np.ndarray]):
+        """Append strokes in bulk (amortized, the buffer grows geometrically)"""
+        new = strokes.data if isinstance(strokes, BrushLayer) else np.asarray(strokes, dtype=BRUSH_DTYPE)
+        need = self._size + len(new)
+        if need > len(self._buf):
+            grown = np.zeros(max(need, 2 * len(self._buf), 16), dtype=BRUSH_DTYPE)
+            grown[:self._size] = self.data
+            self._buf = grown
+        self._buf[self._size:need] = new
+        self._size = need
+
+    def filter(self, mask: np.ndarray) -> 'BrushLayer':
+        """New layer with only the strokes where mask is True"""
+        return BrushLayer(self.data[np.asarray(mask, dtype=bool)].copy())
+
+    def remove(self, mask: np.ndarray):
+        """Drop the strokes where mask is True, in place"""
+        kept = self.data[~np.asarray(mask, dtype=bool)].copy()
+        self._buf = kept
+        self._size = len(kept)
+
+    def sort(self, keys: Sequence[str] = ("pos_x", "pos_z")):
+        """Stable in-place sort; the first key is the primary one"""
+        d = self.data
+        order = np.lexsort([d[k] for k in reversed(keys)])
+        self._buf = d[order]
+        self._size = len(order)
+
+    def in_rect(self, min_x: float, min_z: float, max_x: float, max_z: float) -> np.ndarray:
+        """Mask of strokes whose centre lies inside the rectangle (inclusive)"""
+        d = self.data
+        return (d["pos_x"] >= min_x) & (d["pos_x"] <= max_x) & (d["pos_z"] >= min_z) & (d["pos_z"] <= max_z)
+
+    def crop(self, min_x: float, min_z: float, max_x: float, max_z: float) -> 'BrushLayer':
+        return self.filter(self.in_rect(min_x, min_z, max_x, max_z))
+
+
+def _encode_brush_layers(obj):
+    """json.dumps default= hook: BrushLayer values in course_data serialize as their list form"""
+    if isinstance(obj, BrushLayer):
+        return obj.to_entries()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps_compact_layers(course_data: Dict[str, Any], precision: Union[int, Dict[str, int]]) -> str:
+    """json.dumps of course_data with brush arrays written by BrushLayer.to_json"""
+    data = dict(course_data)
+    arrays = {}
+    for name in BRUSH_LAYERS:
+        value = data.get(name)
+        if isinstance(value, list):
+            try:
+                value = BrushLayer.from_entries(value)
+            except (ValueError, TypeError, AttributeError):
+                continue  # unfamiliar stroke layout: leave it to json.dumps
+        if isinstance(value, BrushLayer):
+            data[name] = _blob_placeholder(len(arrays))
+            arrays[json.dumps(data[name])] = value.to_json(precision)
+    text = json.dumps(data, default=_encode_brush_layers)
+    for placeholder, array_text in arrays.items():
+        text = text.replace(placeholder, array_text, 1)
+    return text
+
+
+# Uncompressed bytes per block; each block is compressed by one thread.
+GZIP_BLOCK_SIZE = 1 << 20
+
+# Deflate window: each block is primed with this much of the preceding data.
+GZIP_DICT_SIZE = 32 * 1024
+
+# Below this the thread hand-off costs more than it saves.
+GZIP_PARALLEL_MIN_BYTES = 2 * GZIP_BLOCK_SIZE
+
+_GZIP_HEADER = b'\x1f\x8b\x08\x00' + struct.pack('<I', 0) + b'\x00\xff'
+
+
+def _deflate_block(data: memoryview, start: int, end: int, level: int, last: bool) -> bytes:
+    """Raw deflate of data[start:end], byte-aligned so blocks can be concatenated"""
+    if start > 0:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, 9,
+                                zdict=bytes(data[max(0, start - GZIP_DICT_SIZE):start]))
+    else:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, 9)
+    out = comp.compress(data[start:end])
+    # SYNC_FLUSH ends on a byte boundary with an empty stored block; only the
+    # final block closes the stream.
+    return out + comp.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def gzip_blocks(data: bytes, level: int = 9, threads: Optional[int] = None,
+                block_size: int = GZIP_BLOCK_SIZE) -> bytes:
+    """
+    gzip-compress data, splitting it across threads when it is large.
+
+    The result is a single standard gzip member (readable by gzip.decompress
+    and the game). Each block is primed with the previous 32 KiB as a preset
+    dictionary, so the ratio stays close to single-threaded gzip.
+
+    Args:
+        level: zlib level 1 (fast) .. 9 (small)
+        threads: Worker threads; None uses all cores, 1 compresses serially
+    """
+    if threads is None:
+        threads = os.cpu_count() or 1
+    if threads <= 1 or len(data) < GZIP_PARALLEL_MIN_BYTES:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, 9)
+        body = comp.compress(data) + comp.flush()
+    else:
+        view = memoryview(data)
+        starts = list(range(0, len(data), block_size))
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            # zlib releases the GIL while compressing, so threads scale.
+            blocks = pool.map(
+                lambda s: _deflate_block(view, s, min(s + block_size, len(data)), level,
+                                         s + block_size >= len(data)),
+                starts,
+            )
+            body = b"".join(blocks)
+    trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+    return _GZIP_HEADER + body + trailer
+
+
+# save() compression profiles -> zlib level. "default" is plain gzip.compress (level 9,
+# single-threaded), as save() always did.
+COMPRESSION_PROFILES = {"default": 9, "fast": 1, "small": 9}
+
+# (memLevel, strategy) pairs "small" tries, keeping the smallest. The first is gzip.compress's
+# own setting, so no payload comes out larger than with "default".
+SMALL_SETTINGS = ((8, zlib.Z_DEFAULT_STRATEGY), (9, zlib.Z_DEFAULT_STRATEGY), (9, zlib.Z_FILTERED))
+
+
+def gzip_smallest(data: bytes, level: int = 9) -> bytes:
+    """
+    Smallest single-member gzip of data over SMALL_SETTINGS, serial (block
+    splitting would cost ratio). memLevel 9 helps large payloads, Z_FILTERED
+    the text-heavy CourseDescription; on a 150k-stroke course the result is
+    ~15 KB (0.2%) under gzip.compress, at about 3x its time.
+    """
+    best = None
+    for mem_level, strategy in SMALL_SETTINGS:
+        comp = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS, mem_level, strategy)
+        out = comp.compress(data) + comp.flush()
+        if best is None or len(out) < len(best):
+            best = out
+    return best
+
+
+def compress_payload(data: bytes, compression: str = "default", threads: Optional[int] = None) -> bytes:
+    """gzip one save() layer with a compression profile"""
+    if compression not in COMPRESSION_PROFILES:
+        raise ValueError(f"Unknown compression profile '{compression}'; expected one of {list(COMPRESSION_PROFILES)}")
+    if compression == "default":
+        return gzip.compress(data)
+    if compression == "small":
+        return gzip_smallest(data, COMPRESSION_PROFILES[compression])
+    return gzip_blocks(data, COMPRESSION_PROFILES[compression], threads)
+
+
+# Lazy loads keep outer binaryData strings (base64 blobs) as raw source text until accessed.
+_BLOB_PREFIX = "\x00courseforge-blob:"
+# End of a key and the opening quote of its string value; json.dumps writes '": "', the game '":"'.
+_BLOB_SEPARATOR = re.compile(r'"[ \t\n\r]*:[ \t\n\r]*"')
+
+
+def _blob_placeholder(index: int) -> str:
+    return f"{_BLOB_PREFIX}{index}"
+
+
+class LazyBlob:
+    """
+    A binaryData string kept as its JSON source text, unparsed.
+
+    Saving splices the same text back, so an untouched blob round-trips
+    byte-for-byte.
+    """
+    __slots__ = ("source",)
+
+    def __init__(self, source: str):
+        self.source = source
+
+    def __len__(self) -> int:
+        return len(self.source)
+
+    def __repr__(self) -> str:
+        return f"LazyBlob({len(self.source)} chars)"
+
+    def text(self) -> str:
+        """The string value (JSON escapes resolved; base64 has none)"""
+        if '\\' in self.source:
+            return json.loads(f'"{self.source}"')
+        return self.source
+
+    def decode(self) -> bytes:
+        """The base64-decoded payload"""
+        return base64.b64decode(self.text())
+
+
+class LazyBinaryData(dict):
+    """binaryData mapping that turns LazyBlob values into str on first access"""
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, LazyBlob):
+            value = value.text()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def raw(self, key) -> Union[str, LazyBlob]:
+        """Stored value without materializing it"""
+        return super().__getitem__(key)
+
+    def raw_items(self):
+        return super().items()
+
+
+def _scan_binary_data(json_str: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse outer JSON, lifting binaryData string values out as LazyBlobs.
+
+    Only the small skeleton left after cutting the blobs out goes through
+    json.loads. Returns None when the layout is not the plain one this fast
+    path understands, so the caller can parse eagerly instead.
+    """
+    start = json_str.find('"binaryData"')
+    if start < 0:
+        return None
+
+    parts, blobs = [json_str[:start]], []
+    pos = start
+    while True:
+        sep = _BLOB_SEPARATOR.search(json_str, pos)
+        if sep is None:
+            break
+        value_start = sep.end()
+        value_end = json_str.find('"', value_start)
+        while value_end > 0 and json_str[value_end - 1] == '\\':
+            # Escaped quote (odd run of backslashes) -> keep looking.
+            segment = json_str[value_start:value_end]
+            if (len(segment) - len(segment.rstrip('\\'))) % 2 == 0:
+                break
+            value_end = json_str.find('"', value_end + 1)
+        if value_end < 0:
+            return None
+        parts.append(json_str[pos:value_start])
+        parts.append(json.dumps(_blob_placeholder(len(blobs)))[1:-1])
+        blobs.append(LazyBlob(json_str[value_start:value_end]))
+        pos = value_end
+    parts.append(json_str[pos:])
+
+    outer = _restore_blobs(json.loads("".join(parts)), blobs)
+    binary = outer.get('binaryData')
+    if not isinstance(binary, dict):
+        return None
+    outer['binaryData'] = LazyBinaryData(binary)
+    # Strings lifted outside binaryData (keys after it) are plain values again.
+    for key, value in outer.items():
+        if key != 'binaryData':
+            outer[key] = _materialize(value)
+    return outer
+
+
+def _restore_blobs(value, blobs: List[LazyBlob]):
+    """Swap placeholder strings back for their LazyBlobs"""
+    if isinstance(value, str) and value.startswith(_BLOB_PREFIX):
+        return blobs[int(value[len(_BLOB_PREFIX):])]
+    if isinstance(value, dict):
+        return {k: _restore_blobs(v, blobs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_restore_blobs(v, blobs) for v in value]
+    return value
+
+
+def _materialize(value):
+    if isinstance(value, LazyBlob):
+        return value.text()
+    if isinstance(value, dict):
+        return {k: _materialize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_materialize(v) for v in value]
+    return value
+
+
+def _decode_course_description(b64: Union[str, bytes]) -> Dict[str, Any]:
+    """CourseDescription blob: base64 -> gzip -> UTF-16-LE JSON (BOM optional)"""
+    course_desc_compressed = base64.b64decode(b64)
+    course_desc_data = gzip.decompress(course_desc_compressed)
+
+    # Skip BOM if present
+    if course_desc_data[:2] == b'\xff\xfe':
+        course_desc_data = course_desc_data[2:]
+
+    return json.loads(course_desc_data.decode('utf-16-le'))
+
+
+# ---- streaming reads ----
+
+# Compressed bytes read per step when streaming a course.
+STREAM_CHUNK = 1 << 20
+
+_DESCRIPTION_KEY = re.compile(r'"CourseDescription"\s*:\s*"')
+_JSON_SPACE = re.compile(r'[ \t\n\r]*')
+# Runs the skip scanner jumps over: outside strings, and inside one (escapes as pairs).
+_JSON_STRUCTURE = re.compile(r'[^"\[\]{}]*')
+_JSON_NUMBER_CHARS = frozenset("0123456789+-.eE")
+_JSON_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+
+
+def _gunzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Decompress a gzip byte stream piece by piece (concatenated members are read on, like gzip.decompress)"""
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            out = inflater.decompress(chunk)
+            if out:
+                yield out
+            if inflater.eof:
+                chunk = inflater.unused_data
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                chunk = b""
+    tail = inflater.flush()
+    if tail:
+        yield tail
+
+
+def _utf16_stream(chunks: Iterator[bytes]) -> Iterator[str]:
+    """UTF-16 text of a byte stream (a BOM picks the byte order; little-endian otherwise)"""
+    decoder = None
+    head = b""
+    for chunk in chunks:
+        if decoder is None:
+            # The BOM check needs two bytes, which a first piece may not hold.
+            head += chunk
+            if len(head) < 2:
+                continue
+            codec = 'utf-16' if head[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE) else 'utf-16-le'
+            decoder = codecs.getincrementaldecoder(codec)()
+            chunk, head = head, b""
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    if decoder is not None:
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+
+def _description_stream(filepath: Path) -> Iterator[str]:
+    """
+    Text of the CourseDescription JSON, streamed: outer gzip -> UTF-16 ->
+    the CourseDescription base64 string -> inner gzip -> UTF-16. Nothing
+    larger than a few chunks is held at any point.
+    """
+    def _file_chunks():
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK), b""):
+                yield chunk
+
+    def _payload():
+        outer = _utf16_stream(_gunzip_stream(_file_chunks()))
+        buf = ""
+        for text in outer:
+            buf += text
+            match = _DESCRIPTION_KEY.search(buf)
+            if match:
+                buf = buf[match.end():]
+                break
+            buf = buf[-64:]
+        else:
+            raise ValueError(f"{filepath}: no CourseDescription found")
+
+        pending = ""
+        while True:
+            end = buf.find('"')
+            b64 = pending + (buf if end < 0 else buf[:end]).replace('\\', '')  # "\/" escapes
+            cut = len(b64) - len(b64) % 4 if end < 0 else len(b64)
+            if cut:
+                yield base64.b64decode(b64[:cut])
+            pending = b64[cut:]
+            if end >= 0:
+                return
+            buf = next(outer, None)
+            if buf is None:
+                raise ValueError(f"{filepath}: CourseDescription is truncated")
+
+    return _utf16_stream(_gunzip_stream(_payload()))
+
+
+class _JsonStream:
+    """Pull-style JSON reader over text chunks that decodes one value at a time"""
+
+    def __init__(self, chunks: Iterator[str]):
+        self.chunks = chunks
+        self.buf = ""
+        self.pos = 0
+        self.done = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, need: int = 0) -> bool:
+        """Append chunks (at least one, then until need chars are buffered past pos); False at the end"""
+        parts = [self.buf[self.pos:]]
+        size = len(parts[0])
+        got = False
+        while not got or size < need:
+            text = next(self.chunks, None)
+            if text is None:
+                self.done = True
+                break
+            parts.append(text)
+            size += len(text)
+            got = True
+        self.buf = "".join(parts)
+        self.pos = 0
+        return got
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at the end)"""
+        while True:
+            self.pos = _JSON_SPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Malformed CourseDescription: expected one of {chars!r}, got {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self) -> Any:
+        """Decode the next complete value (the buffer doubles until it is not cut off by the chunk end)"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number may go on past the chunk end ("1" of "1.5"): only trust a clear stop.
+                if (end < len(self.buf) and self.buf[end] not in _JSON_NUMBER_CHARS) or self.done:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.done:
+                    raise
+            self._fill(2 * (len(self.buf) - self.pos))
+
+    def _scan(self, keep: bool) -> int:
+        """
+        End of the string, array or object starting at pos, found by tracking
+        strings (with escapes) and bracket depth; nothing is decoded. keep=False
+        lets the scanned text go as it refills, so skipping costs no memory.
+        """
+        depth = 0
+        in_string = False
+        i = self.pos
+        while True:
+            if in_string:
+                i = _JSON_STRING_BODY.match(self.buf, i).end()
+                if i < len(self.buf) and self.buf[i] == '"':
+                    in_string = False
+                    i += 1
+                    if depth == 0:
+                        return i
+                    continue
+            else:
+                i = _JSON_STRUCTURE.match(self.buf, i).end()
+                if i < len(self.buf):
+                    c = self.buf[i]
+                    i += 1
+                    if c == '"':
+                        in_string = True
+                    else:
+                        depth += 1 if c in "[{" else -1
+                        if depth == 0:
+                            return i
+                    continue
+            # Cut off by the chunk end (possibly right after a backslash): read on.
+            if not keep:
+                self.pos = i
+            offset = i - self.pos
+            if not self._fill(2 * offset if keep else 0):
+                raise ValueError("Malformed CourseDescription: truncated value")
+            i = offset
+
+    def skip(self):
+        """Step over the next value without decoding it"""
+        if self.peek() in '[{"':
+            self.pos = self._scan(keep=False)
+        else:
+            self.value()  # numbers, true/false/null: a few characters
+
+    def match(self, *patterns: 're.Pattern') -> Optional['re.Match']:
+        """The first pattern matching exactly the next string, array or object (None if none fits)"""
+        self.peek()
+        for pattern in patterns:
+            m = pattern.match(self.buf, self.pos)
+            if m is not None:
+                self.pos = m.end()
+                return m
+        if self.done:
+            return None
+        # Most likely cut off by the chunk end: buffer the whole value and retry.
+        end = self._scan(keep=True)
+        for pattern in patterns:
+            m = pattern.match(self.buf, self.pos, end)
+            if m is not None and m.end() == end:
+                self.pos = end
+                return m
+        return None
+
+    def items(self, close: str) -> Iterator[None]:
+        """Step through a container's members up to `close`; the caller consumes each one"""
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield None
+            if self.expect(',' + close) == close:
+                return
+
+
+# Stroke JSON -> row of number strings, in the order strokes are written: the BRUSH_DTYPE
+# field of each column, the scalar keys, and the x/y/z groups by first column. Defaults
+# match BrushLayer.from_entries.
+_ROW_FIELDS = ("tool", "pos_x", "pos_y", "pos_z", "rot_x", "rot_y", "rot_z",
+               "scale_x", "scale_y", "scale_z", "type", "value", "holeId")
+_ROW_SCALARS = {"tool": 0, "type": 10, "value": 11, "holeId": 12}
+_ROW_GROUPS = {"position": 1, "rotation": 4, "scale": 7}
+_ROW_AXES = {"x": 0, "y": 1, "z": 2}
+_ROW_DEFAULTS = ("0", "0", "0", "0", "0", "0", "0", "1", "1", "1", "0", "0", "-1")
+
+# A stroke as the game and BrushLayer.to_json write it: one match, all 13 fields captured.
+_JSON_NUMBER = r'\s*"?([^\s,{}\[\]"]+)"?\s*'
+_JSON_XYZ = r'\s*\{' + ",".join(rf'\s*"{a}"\s*:{_JSON_NUMBER}' for a in "xyz") + r'\}\s*'
+_STROKE_CANONICAL = re.compile(
+    r'\{\s*"tool"\s*:' + _JSON_NUMBER
+    + "".join(rf',\s*"{g}"\s*:{_JSON_XYZ}' for g in ("position", "rotation", "scale"))
+    + "".join(rf',\s*"{k}"\s*:{_JSON_NUMBER}' for k in ("type", "value", "holeId")) + r'\}'
+)
+# Any stroke object: strings and at most one level of nested {...} (the x/y/z groups).
+_JSON_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_STROKE_OBJECT = re.compile(
+    rf'\{{(?:[^{{}}"]|{_JSON_STRING}|\{{(?:[^{{}}"]|{_JSON_STRING})*\}})*\}}'
+)
+# "key": { | "string" | bare token, in order through one stroke object.
+_STROKE_MEMBER = re.compile(r'"([^"\\]*)"\s*:\s*(?:(\{)|"([^"\\]*)"|([^\s,{}\[\]]+))')
+
+
+def _stroke_row(text: str) -> Tuple[str, ...]:
+    """
+    Row (number strings, _ROW_FIELDS order) of a stroke in any key order or layout.
+
+    Same rules as BrushLayer.from_entries: missing fields take the defaults,
+    unknown axes are ignored and unknown keys are an error.
+    """
+    row = list(_ROW_DEFAULTS)
+    first = None
+    for key, brace, string, token in _STROKE_MEMBER.findall(text, 1):
+        if brace:
+            first = _ROW_GROUPS.get(key)
+            if first is None:
+                raise ValueError(f"Unsupported brush stroke keys: {[key]}")
+        elif key in _ROW_SCALARS:
+            row[_ROW_SCALARS[key]] = string or token
+            first = None
+        elif first is None:
+            raise ValueError(f"Unsupported brush stroke keys: {[key]}")
+        elif key in _ROW_AXES:
+            row[first + _ROW_AXES[key]] = string or token
+    return tuple(row)
+
+
+def _rows_to_array(rows: List[Tuple[str, ...]]) -> np.ndarray:
+    """BRUSH_DTYPE array of number-string rows, converted a column at a time"""
+    data = np.zeros(len(rows), dtype=BRUSH_DTYPE)
+    for name, column in zip(_ROW_FIELDS, zip(*rows)):
+        # float() also parses the "-Infinity" strings used for y positions
+        data[name] = np.fromiter(map(float, column), np.float64, len(rows))
+    return data
+
+
+def _iter_layer_rows(filepath: Path, layer: str) -> Iterator[Tuple[str, ...]]:
+    """
+    Rows (number strings, _ROW_FIELDS order) of one top-level CourseDescription array, one at a time.
+
+    Other top-level values are skipped by scanning their brackets and strings
+    without decoding them, so only one stroke's text is ever held at once.
+    """
+    stream = _JsonStream(_description_stream(filepath))
+    stream.expect('{')
+    for _ in stream.items('}'):
+        key = stream.value()
+        stream.expect(':')
+        if key != layer or stream.peek() != '[':
+            stream.skip()
+            continue
+        stream.pos += 1
+        for _ in stream.items(']'):
+            m = stream.match(_STROKE_CANONICAL, _STROKE_OBJECT) if stream.peek() == '{' else None
+            if m is None:
+                raise ValueError(f"Malformed CourseDescription: {layer} entry is not a brush stroke")
+            yield m.groups() if m.re is _STROKE_CANONICAL else _stroke_row(m.group(0))
+        return
+
+
 class CourseFile:
     """Represents a PGA 2K course file"""
     
-    def __init__(self, course_data: Dict[str, Any], outer_data: Dict[str, Any], version: GameVersion):
+    def __init__(self, course_data: Optional[Dict[str, Any]], outer_data: Dict[str, Any],
+                 version: Optional[GameVersion]):
         """
         Args:
-            course_data: The inner CourseDescription JSON
+            course_data: The inner CourseDescription JSON; None decodes it from
+                outer_data on first access (lazy loads)
             outer_data: The outer JSON with metadata/thumbnail
-            version: Game version
+            version: Game version; None detects it from course_data when needed
         """
-        self.course_data = course_data
+        self._course_data = course_data
         self.outer_data = outer_data
-        self.version = version
-    
+        self._version = version
+        self._indexes: Dict[str, Any] = {}
+
+    @property
+    def course_data(self) -> Dict[str, Any]:
+        if self._course_data is None:
+            binary = self.outer_data['binaryData']
+            blob = binary.raw('CourseDescription') if isinstance(binary, LazyBinaryData) \
+                else binary['CourseDescription']
+            self._course_data = _decode_course_description(
+                blob.text() if isinstance(blob, LazyBlob) else blob
+            )
+        return self._course_data
+
+    @course_data.setter
+    def course_data(self, value: Dict[str, Any]):
+        self._course_data = value
+
+    @property
+    def version(self) -> GameVersion:
+        if self._version is None:
+            self._version = self._detect_version(self.course_data)
+        return self._version
+
+    @version.setter
+    def version(self, value: GameVersion):
+        self._version = value
+
     @classmethod
-    def load(cls, filepath: Path) -> 'CourseFile':
-        """Load a .course file from disk"""
+    def load(cls, filepath: Path, lazy: bool = False) -> 'CourseFile':
+        """
+        Load a .course file from disk.
+
+        lazy=True keeps the outer binaryData blobs (thumbnail, metadata,
+        CourseDescription) as undecoded bytes: CourseDescription is parsed on
+        first use of course_data, the others on access, and save() writes
+        untouched blobs back byte-for-byte. Much cheaper for metadata scans.
+        """
         with open(filepath, 'rb') as f:
             compressed_data = f.read()
         
@@ -44,26 +905,44 @@ class CourseFile:
             json_str = decompressed.decode('utf-16')
         except:
             json_str = decompressed.decode('utf-16-le')
+
+        if lazy:
+            outer_json = _scan_binary_data(json_str)
+            if outer_json is not None:
+                # Version comes from course_data on first use, as in the eager path (a BOM alone
+                # does not make a file 2K25).
+                return cls(None, outer_json, None)
         
         outer_json = json.loads(json_str)
         
         # Decode CourseDescription
-        course_desc_b64 = outer_json['binaryData']['CourseDescription']
-        course_desc_compressed = base64.b64decode(course_desc_b64)
-        course_desc_data = gzip.decompress(course_desc_compressed)
-        
-        # Skip BOM if present
-        if course_desc_data[:2] == b'\xff\xfe':
-            course_desc_data = course_desc_data[2:]
-        
-        course_desc_str = course_desc_data.decode('utf-16-le')
-        course_data = json.loads(course_desc_str)
+        course_data = _decode_course_description(outer_json['binaryData']['CourseDescription'])
         
         # Detect version
         version = cls._detect_version(course_data)
         
         return cls(course_data, outer_json, version)
     
+    @staticmethod
+    def iter_strokes(filepath: Path, layer: str = "height", batch_size: int = 8192) -> Iterator[np.ndarray]:
+        """
+        Stream one brush array (e.g. "height") of a .course file as BRUSH_DTYPE
+        batches of up to batch_size strokes, without loading the course.
+
+        Both gzip layers, the base64 payload and the JSON are decoded
+        incrementally. Everything but `layer` is skipped undecoded and each
+        stroke is read straight into a BRUSH_DTYPE row, so memory stays flat
+        however many strokes the file holds. A missing layer yields nothing.
+        """
+        rows = []
+        for row in _iter_layer_rows(Path(filepath), layer):
+            rows.append(row)
+            if len(rows) >= batch_size:
+                yield _rows_to_array(rows)
+                rows = []
+        if rows:
+            yield _rows_to_array(rows)
+
     @staticmethod
     def _detect_version(data: Dict[str, Any]) -> GameVersion:
         """Detect which game version based on structure"""
@@ -76,19 +955,49 @@ class CourseFile:
         else:
             return GameVersion.PGA2K25
     
-    def save(self, filepath: Path):
-        """Save course file to disk"""
-        # Re-encode CourseDescription
-        inner_json_str = json.dumps(self.course_data)
-        inner_utf16 = inner_json_str.encode('utf-16-le')
-        inner_compressed = gzip.compress(inner_utf16)
-        inner_b64 = base64.b64encode(inner_compressed).decode('ascii')
-        
-        # Update outer structure
-        self.outer_data['binaryData']['CourseDescription'] = inner_b64
+    def save(self, filepath: Path, compression: str = "default", threads: Optional[int] = None,
+             brush_precision: Optional[Union[int, Dict[str, int]]] = None):
+        """
+        Save course file to disk.
+
+        Args:
+            compression: "default" (gzip level 9), "fast" (level 1, multi-threaded;
+                for iterate-and-load loops) or "small" (level 9, best of a few
+                memLevel/strategy settings; smallest, slowest)
+            threads: Compression threads for "fast"; None uses all cores
+            brush_precision: Write height/terrainHeight floats at fixed decimals
+                (int, or per group as in DEFAULT_BRUSH_PRECISION) with the
+                compact BrushLayer.to_json encoder; None keeps full precision
+        """
+        binary = self.outer_data['binaryData']
+        if self._course_data is not None:
+            # Re-encode CourseDescription
+            if brush_precision is None:
+                inner_json_str = json.dumps(self._course_data, default=_encode_brush_layers)
+            else:
+                inner_json_str = _dumps_compact_layers(self._course_data, brush_precision)
+            inner_utf16 = inner_json_str.encode('utf-16-le')
+            inner_compressed = compress_payload(inner_utf16, compression, threads)
+            inner_b64 = base64.b64encode(inner_compressed).decode('ascii')
+            
+            # Update outer structure
+            binary['CourseDescription'] = inner_b64
         
-        # Encode outer JSON
-        outer_json_str = json.dumps(self.outer_data)
+        # Encode outer JSON; lazy blobs go in as placeholders and are spliced back as raw bytes
+        blobs: List[LazyBlob] = []
+        outer = self.outer_data
+        if isinstance(binary, LazyBinaryData):
+            placeholders = {}
+            for key, value in binary.raw_items():
+                if isinstance(value, LazyBlob):
+                    placeholders[key] = _blob_placeholder(len(blobs))
+                    blobs.append(value)
+                else:
+                    placeholders[key] = value
+            outer = dict(self.outer_data, binaryData=placeholders)
+        outer_json_str = json.dumps(outer)
+        for i, blob in enumerate(blobs):
+            outer_json_str = outer_json_str.replace(json.dumps(_blob_placeholder(i)), f'"{blob.source}"', 1)
         
         # 2K25 uses UTF-16 with BOM
         if self.version == GameVersion.PGA2K25:
@@ -97,12 +1006,54 @@ class CourseFile:
             outer_utf16 = outer_json_str.encode('utf-16-le')
         
         # Final compression
-        final_compressed = gzip.compress(outer_utf16)
+        final_compressed = compress_payload(outer_utf16, compression, threads)
         
         # Write to file
         with open(filepath, 'wb') as f:
             f.write(final_compressed)
     
+    def get_metadata(self) -> Dict[str, Any]:
+        """CourseMetadata blob (ratings etc.) decoded from base64 -> gzip -> UTF-16 JSON"""
+        binary = self.outer_data['binaryData']
+        blob = binary.raw('CourseMetadata') if isinstance(binary, LazyBinaryData) else binary['CourseMetadata']
+        raw = gzip.decompress(base64.b64decode(blob.text() if isinstance(blob, LazyBlob) else blob))
+        return json.loads(raw.decode('utf-16'))
+
+    def layer(self, name: str = "height") -> BrushLayer:
+        """
+        Brush strokes of `name` as a BrushLayer.
+
+        Converted from the JSON list on first access and stored back into
+        course_data in its place, so edits to the layer are what gets saved.
+        """
+        current = self.course_data.get(name)
+        if isinstance(current, BrushLayer):
+            return current
+        layer = BrushLayer.from_entries(current or [])
+        self.course_data[name] = layer
+        return layer
+
+    def set_layer(self, name: str, layer: BrushLayer):
+        """Replace the strokes of `name` (e.g. "height") with a BrushLayer"""
+        self.course_data[name] = layer
+
+    def spatial_index(self, name: str = "height", cell_size: Optional[float] = None):
+        """
+        StrokeIndex over layer `name`, built on first use and kept with the course.
+
+        Edits made through the index stay in sync; strokes appended to the
+        layer directly are picked up here, and a replaced layer is re-indexed.
+        """
+        from src.spatial_index import StrokeIndex
+
+        layer = self.layer(name)
+        index = self._indexes.get(name)
+        if index is None or index.layer is not layer or (cell_size and cell_size != index.cell_size):
+            index = self._indexes[name] = StrokeIndex(layer, cell_size)
+        else:
+            index.refresh()
+        return index
+
     def get_name(self) -> str:
         """Get course name"""
         return self.course_data.get('name', 'Unnamed Course')
@@ -122,4 +1073,4 @@ class CourseFile:
     def export_json(self, filepath: Path):
         """Export course data as readable JSON for debugging"""
         with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.course_data, f, indent=2)
\ No newline at end of file
+            json.dump(self.course_data, f, indent=2, default=_encode_brush_layers)
\ No newline at end of file
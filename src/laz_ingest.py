@@ -0,0 +1,204 @@
+"""
+CourseForge - LAZ Ingest Module
+Streams LiDAR tiles chunk by chunk and bins ground points into a height grid
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import laspy
+
+from src.binning import GridAccumulator
+
+
+DEFAULT_CHUNK_SIZE = 2_000_000
+GROUND_CLASS = 2
+
+# Calibration: 150 ft ~= 45.72 value => brush VALUE IS METERS.
+# A vertical range above this many units in one tile is assumed to be feet.
+FEET_RANGE_THRESHOLD = 800.0
+FEET_TO_METERS = 0.3048
+
+# Resolution of the z histogram used to estimate source percentiles.
+Z_HISTOGRAM_BINS = 8192
+
+
+@dataclass
+class LazScan:
+    """Bounds and counts gathered by the first streaming pass over a tile"""
+    point_count: int
+    ground_count: int
+    use_ground: bool
+    min_x: float
+    max_x: float
+    min_y: float
+    max_y: float
+    min_z: float
+    max_z: float
+
+
+@dataclass
+class BinnedTile:
+    """Per-cell accumulators for one tile plus the diagnostics the pipeline prints"""
+    accumulator: GridAccumulator
+    scan: LazScan
+    z_scale: float
+    units_note: str
+    src_min: float
+    src_max: float
+    src_p05: float
+    src_p95: float
+
+    @property
+    def sum_grid(self) -> Optional[np.ndarray]:
+        return self.accumulator.sum_grid
+
+    @property
+    def count_grid(self) -> np.ndarray:
+        return self.accumulator.count_grid
+
+    def aggregate(self, mode: str = "mean") -> np.ndarray:
+        """Per-cell elevation (float32) for a bin mode, NaN where no points landed"""
+        return self.accumulator.result(mode)
+
+    def mean_grid(self) -> np.ndarray:
+        """Average elevation per cell (float32), NaN where no points landed"""
+        return self.aggregate("mean")
+
+
+def _has_classification(points) -> bool:
+    return "classification" in points.point_format.dimension_names
+
+
+def iter_chunks(laz_file: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yield (x, y, z, ground_mask) arrays per chunk without reading the whole tile.
+
+    ground_mask is None when the point format has no classification field.
+    """
+    with laspy.open(laz_file) as reader:
+        for points in reader.chunk_iterator(chunk_size):
+            x = np.asarray(points.x, dtype=np.float64)
+            y = np.asarray(points.y, dtype=np.float64)
+            z = np.asarray(points.z, dtype=np.float64)
+            ground = None
+            if _has_classification(points):
+                ground = np.asarray(points.classification) == GROUND_CLASS
+            yield x, y, z, ground
+
+
+def scan_laz(laz_file: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> LazScan:
+    """
+    First pass: count points and find bounds of the points that will be binned.
+
+    Ground points (class 2) are preferred; if a tile has none, every point is used,
+    matching the behavior of the original whole-tile loader.
+    """
+    inf = float("inf")
+    all_bounds = [inf, -inf, inf, -inf, inf, -inf]
+    ground_bounds = [inf, -inf, inf, -inf, inf, -inf]
+    point_count = 0
+    ground_count = 0
+
+    def _update(bounds, x, y, z):
+        bounds[0] = min(bounds[0], float(np.min(x)))
+        bounds[1] = max(bounds[1], float(np.max(x)))
+        bounds[2] = min(bounds[2], float(np.min(y)))
+        bounds[3] = max(bounds[3], float(np.max(y)))
+        bounds[4] = min(bounds[4], float(np.min(z)))
+        bounds[5] = max(bounds[5], float(np.max(z)))
+
+    for x, y, z, ground in iter_chunks(laz_file, chunk_size):
+        if len(z) == 0:
+            continue
+        point_count += len(z)
+        _update(all_bounds, x, y, z)
+        if ground is not None and np.any(ground):
+            ground_count += int(np.count_nonzero(ground))
+            _update(ground_bounds, x[ground], y[ground], z[ground])
+
+    use_ground = ground_count > 0
+    bounds = ground_bounds if use_ground else all_bounds
+    return LazScan(point_count, ground_count, use_ground, *bounds)
+
+
+def unit_scale_for_range(z_min: float, z_max: float) -> Tuple[float, str]:
+    """
+    Pick the z multiplier that makes brush values meters.
+
+    Heuristic:
+      - If vertical range > ~800 units in one tile, likely feet -> convert to meters.
+    """
+    if (z_max - z_min) > FEET_RANGE_THRESHOLD:
+        return FEET_TO_METERS, "feet->meters (heuristic)"
+    return 1.0, "meters (heuristic)"
+
+
+def _histogram_percentile(hist: np.ndarray, lo: float, hi: float, pct: float) -> float:
+    total = int(hist.sum())
+    if total == 0:
+        return float("nan")
+    cdf = np.cumsum(hist)
+    target = pct / 100.0 * (total - 1)
+    idx = int(np.searchsorted(cdf, target, side="right"))
+    width = (hi - lo) / len(hist)
+    return lo + (idx + 0.5) * width
+
+
+def bin_laz_streaming(laz_file: Path, grid_size: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      modes: Iterable[str] = ("mean",)) -> BinnedTile:
+    """
+    Bin a tile's ground points into grid_size x grid_size per-cell accumulators.
+
+    Two streaming passes (bounds, then binning) keep peak memory bounded by
+    chunk_size instead of tile size. The binning math and accumulation order are
+    the same as the whole-tile loader, so the resulting grid matches it exactly.
+    Source p05/p95 are estimated from a fine z histogram.
+    """
+    scan = scan_laz(laz_file, chunk_size)
+    if scan.point_count == 0:
+        raise ValueError(f"No points in LAZ file: {laz_file}")
+
+    z_scale, units_note = unit_scale_for_range(scan.min_z, scan.max_z)
+    src_min = scan.min_z * z_scale
+    src_max = scan.max_z * z_scale
+
+    min_x, max_x = scan.min_x, scan.max_x
+    min_y, max_y = scan.min_y, scan.max_y
+    if max_x == min_x or max_y == min_y:
+        raise ValueError(f"Invalid bounds in LAZ file: {laz_file}")
+
+    accumulator = GridAccumulator((grid_size, grid_size), modes)
+    z_hist = np.zeros(Z_HISTOGRAM_BINS, dtype=np.int64)
+    hist_range = (src_min, src_max if src_max > src_min else src_min + 1.0)
+
+    for x, y, z, ground in iter_chunks(laz_file, chunk_size):
+        if scan.use_ground:
+            if ground is None or not np.any(ground):
+                continue
+            x, y, z = x[ground], y[ground], z[ground]
+        if len(z) == 0:
+            continue
+
+        z_m = z * z_scale
+
+        xi = np.floor((x - min_x) / (max_x - min_x) * (grid_size - 1)).astype(np.int32)
+        yi = np.floor((y - min_y) / (max_y - min_y) * (grid_size - 1)).astype(np.int32)
+        xi = np.clip(xi, 0, grid_size - 1)
+        yi = np.clip(yi, 0, grid_size - 1)
+
+        accumulator.add_cells(yi, xi, z_m)
+
+        z_hist += np.histogram(z_m, bins=Z_HISTOGRAM_BINS, range=hist_range)[0]
+
+    return BinnedTile(
+        accumulator=accumulator,
+        scan=scan,
+        z_scale=z_scale,
+        units_note=units_note,
+        src_min=src_min,
+        src_max=src_max,
+        src_p05=_histogram_percentile(z_hist, *hist_range, 5.0),
+        src_p95=_histogram_percentile(z_hist, *hist_range, 95.0),
+    )
@@ -0,0 +1,281 @@
+"""
+CourseForge - LAZ Mosaic Module
+Bins many LiDAR tiles into one georeferenced grid with a fixed cell size
+"""
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import laspy
+
+from src.binning import GridAccumulator
+from src.laz_ingest import DEFAULT_CHUNK_SIZE, iter_chunks, unit_scale_for_range
+
+
+# (min_x, min_y, max_x, max_y) in the tiles' horizontal CRS units
+BBox = Tuple[float, float, float, float]
+
+
+@dataclass
+class GridSpec:
+    """
+    Georeferenced raster layout.
+
+    Cell (row, col) covers x in [min_x + col * cell, min_x + (col + 1) * cell)
+    and y in [min_y + row * cell, ...), so row 0 is the southern edge.
+    """
+    min_x: float
+    min_y: float
+    cell_size: float
+    width: int
+    height: int
+
+    @property
+    def max_x(self) -> float:
+        return self.min_x + self.width * self.cell_size
+
+    @property
+    def max_y(self) -> float:
+        return self.min_y + self.height * self.cell_size
+
+    @property
+    def bbox(self) -> BBox:
+        return (self.min_x, self.min_y, self.max_x, self.max_y)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (self.height, self.width)
+
+    @classmethod
+    def from_bbox(cls, bbox: BBox, cell_size: float) -> 'GridSpec':
+        """Smallest grid with the given cell size that covers bbox"""
+        min_x, min_y, max_x, max_y = bbox
+        width = max(1, int(math.ceil((max_x - min_x) / cell_size)))
+        height = max(1, int(math.ceil((max_y - min_y) / cell_size)))
+        return cls(min_x, min_y, cell_size, width, height)
+
+    def window(self, bbox: BBox) -> Tuple[int, int, int, int]:
+        """(row0, row1, col0, col1) slice bounds of the cells touched by bbox"""
+        col0 = int(math.floor((bbox[0] - self.min_x) / self.cell_size))
+        row0 = int(math.floor((bbox[1] - self.min_y) / self.cell_size))
+        col1 = int(math.floor((bbox[2] - self.min_x) / self.cell_size)) + 1
+        row1 = int(math.floor((bbox[3] - self.min_y) / self.cell_size)) + 1
+        return (
+            max(0, row0), min(self.height, row1),
+            max(0, col0), min(self.width, col1),
+        )
+
+
+@dataclass
+class TileResult:
+    """Partial accumulators for the window of the mosaic one tile touches"""
+    path: Path
+    window: Tuple[int, int, int, int]
+    accumulator: GridAccumulator
+    used_ground: bool
+    min_z: float
+    max_z: float
+
+
+@dataclass
+class MosaicGrid:
+    """Merged accumulators for every tile that intersects the target extent"""
+    spec: GridSpec
+    accumulator: GridAccumulator
+    z_scale: float
+    units_note: str
+    src_min: float
+    src_max: float
+    tiles_used: List[Path] = field(default_factory=list)
+    tiles_skipped: List[Path] = field(default_factory=list)
+
+    @property
+    def sum_grid(self) -> Optional[np.ndarray]:
+        return self.accumulator.sum_grid
+
+    @property
+    def count_grid(self) -> np.ndarray:
+        return self.accumulator.count_grid
+
+    def aggregate(self, mode: str = "mean") -> np.ndarray:
+        """Per-cell elevation in meters (float32) for a bin mode, NaN where no points landed"""
+        scale = 1.0 if mode == "count" else self.z_scale
+        return self.accumulator.result(mode, scale=scale)
+
+    def mean_grid(self) -> np.ndarray:
+        """Average elevation per cell in meters (float32), NaN where no points landed"""
+        return self.aggregate("mean")
+
+
+def tile_bounds(laz_file: Path) -> BBox:
+    """Horizontal bounds from the LAS header only (no point decoding)"""
+    with laspy.open(laz_file) as reader:
+        mins = reader.header.mins
+        maxs = reader.header.maxs
+    return (float(mins[0]), float(mins[1]), float(maxs[0]), float(maxs[1]))
+
+
+def union_bbox(bounds: Sequence[BBox]) -> BBox:
+    return (
+        min(b[0] for b in bounds),
+        min(b[1] for b in bounds),
+        max(b[2] for b in bounds),
+        max(b[3] for b in bounds),
+    )
+
+
+def bbox_intersects(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _accumulate_window(laz_file: Path, spec: GridSpec, window, chunk_size: int, modes: Tuple[str, ...]):
+    """
+    Bin one tile's points inside window, in a single decode.
+
+    As in scan_laz, the ground/all-points choice is made per tile: if the
+    tile has any class 2 point anywhere, only ground points are binned (cells
+    of the window without ground stay empty for the fill stage); a tile
+    without classification or without a single ground point uses every point.
+    An all-points accumulator runs alongside only until the first ground
+    point turns up.
+    """
+    row0, row1, col0, col1 = window
+    shape = (row1 - row0, col1 - col0)
+    ground_acc = GridAccumulator(shape, modes)
+    all_acc: Optional[GridAccumulator] = GridAccumulator(shape, modes)
+    ground_z = [float("inf"), float("-inf")]
+    all_z = [float("inf"), float("-inf")]
+
+    def _add(acc: GridAccumulator, z_range, x, y, z):
+        cols = np.floor((x - spec.min_x) / spec.cell_size).astype(np.int64)
+        rows = np.floor((y - spec.min_y) / spec.cell_size).astype(np.int64)
+        cols = np.clip(cols, col0, col1 - 1) - col0
+        rows = np.clip(rows, row0, row1 - 1) - row0
+        acc.add_cells(rows, cols, z)
+        z_range[0] = min(z_range[0], float(np.min(z)))
+        z_range[1] = max(z_range[1], float(np.max(z)))
+
+    for x, y, z, ground in iter_chunks(laz_file, chunk_size):
+        if all_acc is not None and ground is not None and np.any(ground):
+            all_acc = None  # the tile has ground: earlier chunks had none to bin
+        keep = (x >= spec.min_x) & (x <= spec.max_x) & (y >= spec.min_y) & (y <= spec.max_y)
+        if all_acc is None:
+            keep &= ground
+            if np.any(keep):
+                _add(ground_acc, ground_z, x[keep], y[keep], z[keep])
+        elif np.any(keep):
+            _add(all_acc, all_z, x[keep], y[keep], z[keep])
+
+    if all_acc is None:
+        return ground_acc, ground_z[0], ground_z[1], True
+    return all_acc, all_z[0], all_z[1], False
+
+
+def _bin_tile(job) -> TileResult:
+    """Worker: bin one tile's points that fall inside the mosaic extent"""
+    laz_file, spec, bounds, chunk_size, modes = job
+    window = spec.window(bounds)
+    accumulator, min_z, max_z, used_ground = _accumulate_window(laz_file, spec, window, chunk_size, modes)
+    return TileResult(laz_file, window, accumulator, used_ground, min_z, max_z)
+
+
+def build_mosaic(
+    laz_files: Sequence[Path],
+    cell_size: Optional[float] = None,
+    bbox: Optional[BBox] = None,
+    grid_size: int = 1024,
+    horizontal_unit_m: float = 1.0,
+    z_scale: Optional[float] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: Optional[int] = None,
+    modes: Iterable[str] = ("mean",),
+) -> MosaicGrid:
+    """
+    Bin every tile that intersects the target extent into one shared grid.
+
+    Args:
+        laz_files: Candidate tiles; tiles whose header bounds miss bbox are skipped
+            without decoding any points
+        cell_size: Cell size in meters; None fits the longest side of the extent
+            into grid_size cells
+        bbox: Target extent in tile CRS units; None uses the union of all tiles
+        grid_size: Only used when cell_size is None
+        horizontal_unit_m: Length of one horizontal CRS unit in meters
+            (0.3048 for foot-based CRSs)
+        z_scale: Multiplier to meters for z; None applies the feet heuristic to
+            the merged z range
+        chunk_size: Points per streamed chunk inside each worker
+        workers: Process count; None uses all cores, 1 runs inline
+        modes: Per-cell reductions to keep (see src.binning.BIN_MODES)
+    """
+    laz_files = list(laz_files)
+    if not laz_files:
+        raise ValueError("No LAZ files given to mosaic")
+
+    bounds = {f: tile_bounds(f) for f in laz_files}
+    if bbox is None:
+        bbox = union_bbox(list(bounds.values()))
+    if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
+        raise ValueError(f"Invalid mosaic bbox: {bbox}")
+
+    if cell_size is None:
+        cell_units = max(bbox[2] - bbox[0], bbox[3] - bbox[1]) / grid_size
+    else:
+        cell_units = cell_size / horizontal_unit_m
+    spec = GridSpec.from_bbox(bbox, cell_units)
+
+    used = [f for f in laz_files if bbox_intersects(bounds[f], spec.bbox)]
+    skipped = [f for f in laz_files if f not in used]
+    if not used:
+        raise ValueError(f"No LAZ tiles intersect bbox {bbox}")
+
+    modes = tuple(modes)
+    jobs = [(f, spec, bounds[f], chunk_size, modes) for f in used]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+
+    accumulator = GridAccumulator(spec.shape, modes)
+    min_z, max_z = float("inf"), float("-inf")
+
+    def _merge(result: TileResult):
+        nonlocal min_z, max_z
+        accumulator.merge_window(result.accumulator, result.window)
+        if result.accumulator.count.any():
+            min_z = min(min_z, result.min_z)
+            max_z = max(max_z, result.max_z)
+
+    # map() keeps merge order fixed so float sums are reproducible run to run.
+    if workers == 1:
+        for job in jobs:
+            _merge(_bin_tile(job))
+    else:
+        # spawn, not fork: lazrs keeps a native thread pool that does not survive fork.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            for result in pool.map(_bin_tile, jobs):
+                _merge(result)
+
+    if not np.any(accumulator.count):
+        raise ValueError(f"No points from {len(used)} tile(s) fell inside bbox {bbox}")
+
+    if z_scale is None:
+        z_scale, units_note = unit_scale_for_range(min_z, max_z)
+    else:
+        units_note = f"x{z_scale} (explicit)"
+
+    return MosaicGrid(
+        spec=spec,
+        accumulator=accumulator,
+        z_scale=z_scale,
+        units_note=units_note,
+        src_min=min_z * z_scale,
+        src_max=max_z * z_scale,
+        tiles_used=used,
+        tiles_skipped=skipped,
+    )
@@ -0,0 +1,190 @@
+"""
+CourseForge - Metrics Module
+Per-stage wall time, peak RSS and array sizes, written as JSON lines next to the output
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, is_dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+_MB = 1024.0 * 1024.0
+_PROC_STATUS = Path("/proc/self/status")
+_PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+def _proc_status_kb(field_name: str) -> Optional[int]:
+    try:
+        for line in _PROC_STATUS.read_text().splitlines():
+            if line.startswith(field_name + ":"):
+                return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss_bytes() -> Optional[int]:
+    kb = _proc_status_kb("VmRSS")
+    if kb is not None:
+        return kb * 1024
+    if psutil is not None:
+        return int(psutil.Process().memory_info().rss)
+    return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Process high-water RSS (since the last reset_peak_rss where supported)"""
+    kb = _proc_status_kb("VmHWM")
+    if kb is not None:
+        return kb * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, "peak_wset", None)  # Windows
+        if peak is not None:
+            return int(peak)
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes.
+        return int(peak) if sys.platform == "darwin" else int(peak) * 1024
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """Reset the high-water mark so the next peak is per stage (Linux only); False if unsupported"""
+    try:
+        _PROC_CLEAR_REFS.write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def array_summary(arrays: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """shape/dtype/MB of every ndarray in a mapping"""
+    out = {}
+    for name, a in arrays.items():
+        if isinstance(a, np.ndarray):
+            out[name] = {"shape": list(a.shape), "dtype": str(a.dtype), "mb": round(a.nbytes / _MB, 3)}
+    return out
+
+
+def _jsonable(value):
+    if isinstance(value, (np.generic,)):
+        return value.item()
+    if isinstance(value, Path):
+        return str(value)
+    if is_dataclass(value) and not isinstance(value, type):
+        return asdict(value)
+    return repr(value)
+
+
+@dataclass
+class StageMetrics:
+    """What one timed block measured; fill arrays/extra inside the with-block"""
+    stage: str
+    seconds: float = 0.0
+    rss_start_mb: Optional[float] = None
+    rss_end_mb: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    peak_is_per_stage: bool = False
+    arrays: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def record_arrays(self, arrays: Dict[str, Any]):
+        self.arrays.update(array_summary(arrays))
+
+
+class MetricsRecorder:
+    """
+    Collects stage timings and diagnostics for one run and writes them as JSON lines.
+
+    Every record carries the run id (UTC start time) and a "type": "stage"
+    for timed blocks, "diagnostics" for pipeline numbers, "run" for the
+    summary. Peak RSS is per stage on Linux (the high-water mark is reset at
+    each stage start); elsewhere it is the process peak so far.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path is not None else None
+        self.started = datetime.now(timezone.utc)
+        self.run_id = self.started.strftime("%Y%m%dT%H%M%S.%fZ")
+        self._t0 = time.perf_counter()
+        self.records: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        m = StageMetrics(stage=name)
+        m.peak_is_per_stage = reset_peak_rss()
+        rss = current_rss_bytes()
+        m.rss_start_mb = None if rss is None else round(rss / _MB, 1)
+        t0 = time.perf_counter()
+        try:
+            yield m
+        finally:
+            m.seconds = time.perf_counter() - t0
+            rss, peak = current_rss_bytes(), peak_rss_bytes()
+            m.rss_end_mb = None if rss is None else round(rss / _MB, 1)
+            m.peak_rss_mb = None if peak is None else round(peak / _MB, 1)
+            record = asdict(m)
+            record.update(record.pop("extra"))
+            self.emit("stage", **record)
+
+    def emit(self, record_type: str, **fields):
+        """Add one record (non-finite floats become null when written)"""
+        record = {"run": self.run_id, "type": record_type}
+        record.update(fields)
+        self.records.append(record)
+
+    def stage_records(self) -> List[Dict[str, Any]]:
+        return [r for r in self.records if r["type"] == "stage"]
+
+    def write(self, path: Optional[Path] = None, **summary) -> Optional[Path]:
+        """Emit the run summary and write all records, replacing any previous run's file"""
+        path = Path(path) if path is not None else self.path
+        stages = self.stage_records()
+        self.emit(
+            "run",
+            started=self.started.isoformat(),
+            seconds=time.perf_counter() - self._t0,
+            peak_rss_mb=max((s["peak_rss_mb"] for s in stages if s["peak_rss_mb"] is not None), default=None),
+            pid=os.getpid(),
+            **summary,
+        )
+        if path is None:
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            for record in self.records:
+                f.write(json.dumps(_clean(record), default=_jsonable) + "\n")
+        os.replace(tmp, path)
+        return path
+
+
+def _clean(value):
+    """Replace non-finite floats (not valid JSON) with None, recursively"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    return value
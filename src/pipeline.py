@@ -0,0 +1,994 @@
+"""
+CourseForge - Pipeline Module
+LiDAR -> landscaping stamps as named stages, each cached on disk by inputs and knobs
+"""
+import dataclasses
+import gc
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.ndimage import (
+    binary_closing,
+    binary_fill_holes,
+    distance_transform_edt,
+    gaussian_filter,
+)
+
+from src import binning, brush_sim, compaction, laz_ingest, laz_mosaic, quadtree, stamp_solver
+from src import stamps as stamps_module
+from src.binning import GridAccumulator
+from src.compaction import CompactionReport, compact_layer
+from src.brush_sim import SimGrid, sample_target, simulate_heightfield
+from src.course_file import BRUSH_DTYPE, BrushLayer, CourseFile
+from src import inpaint
+from src.inpaint import fill_nan_pushpull
+from src.laz_ingest import bin_laz_streaming
+from src.laz_mosaic import build_mosaic
+from src.metrics import MetricsRecorder
+from src.quadtree import quadtree_nodes, quadtree_stamps
+from src.restamp import RestampReport, StampTarget, dirty_mask, dirty_regions, splice_stamps, target_path
+from src.stage_cache import StageCache, StageOutput, StageResult, stage_key
+from src.stamp_solver import SolveReport, solve_stamp_values
+from src.stamps import (
+    lattice,
+    mask_lattice,
+    percentile_auto_gain,
+    sample_bilinear,
+    shape_relief,
+    stamp_values,
+)
+from src.template_cache import export_json_if_changed, file_key, shared_cache
+from src.tiled import (
+    Workspace,
+    chunked_rows,
+    closing_halo,
+    gaussian_halo,
+    tiled_fill_nearest,
+    tiled_map,
+)
+
+
+STAGES = ("ingest", "bin", "fill", "relief", "recognition", "water", "stamp", "compact", "write")
+
+# Knobs each stage depends on; together with its inputs' keys they form the stage's cache key.
+STAGE_KNOBS = {
+    "ingest": ("grid_size", "bin_mode", "mosaic_bbox", "mosaic_cell_size_m", "mosaic_horizontal_unit_m"),
+    "bin": ("bin_mode",),
+    "fill": ("fill_method",),
+    "relief": ("pin_min_to_zero", "relief_mult", "sigma_land", "sigma_water", "force_zero_mean_stamps"),
+    "recognition": ("recognition_mode", "macro_sigma", "macro_gain", "detail_gain", "post_shape_sigma"),
+    "water": (
+        "fill_method", "enable_water_floor", "water_floor_percentile", "water_surface_band", "water_mask_close_iters",
+        "water_flat_blend", "use_tgc_compat_profile", "elevate_buffer_height", "clip_lowest_value",
+    ),
+    "stamp": (
+        "stamp_placement", "stamp_solver", "brush_spacing", "brush_scale", "brush_type", "stamp_tool",
+        "stamp_eps", "overlap_gain", "target_abs_percentile", "target_stamp_at_percentile", "max_stamp_abs",
+        "relief_gamma", "positive_relief_boost", "negative_relief_scale",
+        "quadtree_max_stamps", "quadtree_max_size", "quadtree_min_size", "quadtree_residual_m",
+        "quadtree_scale_per_size", "enable_water_drain_stamps", "water_drain_spacing", "water_drain_scale",
+        "water_drain_value", "water_drain_double_pass",
+    ),
+    "compact": ("compact_stamps", "compact_tolerance_m", "compact_error_resolution_m"),
+    "write": (
+        "save_compression", "save_brush_precision", "disable_procedural_terrain", "course_name",
+        "incremental_stamps", "incremental_tolerance_m",
+    ),
+}
+
+
+@dataclass
+class PipelineConfig:
+    """
+    Every knob of the LiDAR pipeline. Field names are the lower-cased knob
+    names of tests/test_process_laz.py, which builds one with from_knobs().
+    """
+    grid_size: int = 1024
+    laz_chunk_size: int = 2_000_000
+    mosaic_bbox: Optional[Tuple[float, float, float, float]] = None
+    mosaic_cell_size_m: Optional[float] = None
+    mosaic_horizontal_unit_m: float = 1.0
+    mosaic_workers: Optional[int] = None
+    bin_mode: str = "mean"
+    fill_method: str = "pushpull"
+    use_tgc_compat_profile: bool = False
+    brush_spacing: float = 150.0
+    brush_scale: float = 460.0
+    brush_type: int = 54
+    stamp_tool: int = 1
+    sigma_land: float = 0.8
+    sigma_water: float = 3.0
+    stamp_eps: float = 0.01
+    relief_mult: float = 0.35
+    overlap_gain: float = 1.4
+    target_abs_percentile: float = 95.0
+    target_stamp_at_percentile: float = 12.0
+    max_stamp_abs: float = 60.0
+    stamp_solver: str = "autogain"
+    stamp_placement: str = "lattice"
+    quadtree_max_stamps: int = 600
+    quadtree_max_size: float = 250.0
+    quadtree_min_size: float = 31.25
+    quadtree_residual_m: float = 0.05
+    quadtree_scale_per_size: float = 4.0
+    relief_gamma: float = 1.00
+    positive_relief_boost: float = 1.15
+    negative_relief_scale: float = 0.25
+    pin_min_to_zero: bool = False
+    force_zero_mean_stamps: bool = True
+    disable_procedural_terrain: bool = False
+    recognition_mode: bool = True
+    macro_sigma: float = 24.0
+    macro_gain: float = 3.0
+    detail_gain: float = 0.03
+    post_shape_sigma: float = 9.0
+    enable_water_floor: bool = True
+    water_floor_percentile: float = 12.0
+    water_floor_blend: float = 0.85
+    water_surface_band: float = 0.45
+    water_mask_close_iters: int = 4
+    water_flat_blend: float = 0.995
+    enable_water_drain_stamps: bool = True
+    water_drain_spacing: float = 80.0
+    water_drain_scale: float = 300.0
+    water_drain_value: float = -5.0
+    water_drain_double_pass: bool = True
+    compact_stamps: bool = False
+    compact_tolerance_m: float = 0.25
+    compact_error_resolution_m: float = 4.0
+    land_only_mode: bool = False
+    save_compression: str = "default"
+    save_brush_precision: Optional[int] = None
+    incremental_stamps: bool = False
+    incremental_tolerance_m: float = 0.05
+    simulate_preview: bool = False
+    simulate_resolution_m: float = 4.0
+    template_cache_max_mb: int = 256
+    dump_template_json: bool = False
+    stage_cache: bool = True
+    stage_cache_max_mb: int = 2048
+    write_metrics: bool = True
+    raster_tile_size: Optional[int] = None
+    raster_workers: Optional[int] = 1
+    raster_work_dir: Optional[str] = None
+    elevate_buffer_height: float = 10.0
+    clip_lowest_value: float = -2.0
+    course_name: str = "TEST - LAZ LANDSCAPING (METERS) V5"
+
+    @classmethod
+    def from_knobs(cls, knobs: Dict[str, Any]) -> 'PipelineConfig':
+        """Build from a namespace of UPPER_CASE knobs (e.g. a script's globals())"""
+        names = {f.name for f in fields(cls)}
+        return cls(**{k.lower(): v for k, v in knobs.items() if k.isupper() and k.lower() in names})
+
+    def replace(self, **changes) -> 'PipelineConfig':
+        return dataclasses.replace(self, **changes)
+
+    def effective(self) -> 'PipelineConfig':
+        """Apply the profile overrides (TGC compat, land-only) the knobs imply"""
+        config = self
+        if config.use_tgc_compat_profile:
+            config = config.replace(
+                brush_type=10,           # "soft_circle" in TGC definitions
+                stamp_tool=0,            # TGC importer uses tool 0 for height stamps
+                force_zero_mean_stamps=False,
+                recognition_mode=False,
+            )
+        if config.land_only_mode:
+            config = config.replace(enable_water_floor=False, enable_water_drain_stamps=False)
+        return config
+
+    def with_knobs(self, knobs: Dict[str, Any]) -> 'PipelineConfig':
+        """Copy with KNOB or knob names applied; unknown names raise ValueError"""
+        return self.replace(**normalize_knobs(knobs))
+
+    def stage_params(self, stage: str) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in STAGE_KNOBS[stage]}
+
+
+def normalize_knobs(knobs: Dict[str, Any]) -> Dict[str, Any]:
+    """Accept KNOB or knob names; reject anything PipelineConfig does not have"""
+    names = {f.name for f in fields(PipelineConfig)}
+    out = {}
+    for key, value in knobs.items():
+        name = key.lower()
+        if name not in names:
+            raise ValueError(f"Unknown knob '{key}'")
+        out[name] = value
+    return out
+
+
+# ---- helpers ----
+def fill_nan_nearest(grid: np.ndarray) -> np.ndarray:
+    """
+    Fill NaNs by nearest-neighbor (distance transform).
+    Keeps edges sane without introducing new extrema.
+    """
+    mask = np.isnan(grid)
+    if not np.any(mask):
+        return grid
+    _, indices = distance_transform_edt(mask, return_indices=True)
+    filled = grid[tuple(indices)]
+    return filled.astype(grid.dtype)
+
+
+def fill_nans(config: PipelineConfig, grid: np.ndarray, ws: Optional[Workspace] = None,
+              name: str = "fill") -> np.ndarray:
+    """FILL_METHOD gap fill; with a tiled workspace the result is a memmap `name` in it"""
+    if config.fill_method not in ("pushpull", "nearest"):
+        raise ValueError(f"Unknown FILL_METHOD '{config.fill_method}'; expected 'pushpull' or 'nearest'")
+    if ws is None:
+        return fill_nan_pushpull(grid) if config.fill_method == "pushpull" else fill_nan_nearest(grid)
+    out = ws.create(name, grid.shape, grid.dtype)
+    if config.fill_method == "pushpull":
+        # Banded over the full-resolution rows; the pyramid levels below are at most 1/4 size.
+        return fill_nan_pushpull(grid, out)
+    if config.raster_workers != 1:
+        grid = ws.ensure(f"{name}.input", grid)
+    tiled_fill_nearest(grid, out, tile_size=config.raster_tile_size, workers=config.raster_workers)
+    return out
+
+
+def _workspace(config: PipelineConfig) -> Optional[Workspace]:
+    """Scratch memmaps for the tiled raster path, None for whole-array stages"""
+    if not config.raster_tile_size:
+        return None
+    return Workspace(Path(config.raster_work_dir or tempfile.mkdtemp(prefix="courseforge-tiles-")))
+
+
+def _tiled(config: PipelineConfig, ws: Workspace, name: str, fn: Callable[..., np.ndarray],
+           inputs: Dict[str, np.ndarray], halo: int, dtype) -> np.ndarray:
+    return tiled_map(ws, name, fn, inputs, halo, dtype, config.raster_tile_size, config.raster_workers)
+
+
+def laz_fingerprint(laz_files: Sequence[Path]) -> list:
+    """Name, size and mtime of every input tile; any change re-runs ingest"""
+    out = []
+    for f in laz_files:
+        st = Path(f).stat()
+        out.append([Path(f).name, st.st_size, st.st_mtime_ns])
+    return out
+
+
+def _single_tile(config: PipelineConfig, laz_files: Sequence[Path]) -> bool:
+    return len(laz_files) == 1 and config.mosaic_bbox is None and config.mosaic_cell_size_m is None
+
+
+# ---- stages ----
+def stage_ingest(config: PipelineConfig, laz_files: Sequence[Path]) -> StageOutput:
+    """Stream the LAZ tile(s) into per-cell accumulators for BIN_MODE"""
+    modes = (config.bin_mode,)
+    if _single_tile(config, laz_files):
+        binned = bin_laz_streaming(laz_files[0], config.grid_size, chunk_size=config.laz_chunk_size, modes=modes)
+        scan = binned.scan
+        meta = {
+            "kind": "tile", "source": Path(laz_files[0]).name, "scale": 1.0,
+            "use_ground": scan.use_ground, "ground_count": scan.ground_count,
+            "src_p05": binned.src_p05, "src_p95": binned.src_p95,
+        }
+    else:
+        binned = build_mosaic(
+            laz_files,
+            cell_size=config.mosaic_cell_size_m,
+            bbox=config.mosaic_bbox,
+            grid_size=config.grid_size,
+            horizontal_unit_m=config.mosaic_horizontal_unit_m,
+            chunk_size=config.laz_chunk_size,
+            workers=config.mosaic_workers,
+            modes=modes,
+        )
+        spec = binned.spec
+        meta = {
+            "kind": "mosaic", "tiles": len(laz_files), "scale": binned.z_scale,
+            "tiles_used": len(binned.tiles_used), "tiles_skipped": len(binned.tiles_skipped),
+            "width": spec.width, "height": spec.height, "cell_size": spec.cell_size, "bbox": list(spec.bbox),
+        }
+    meta.update(
+        shape=list(binned.accumulator.shape), modes=list(modes), units_note=binned.units_note,
+        src_min=binned.src_min, src_max=binned.src_max,
+    )
+    return binned.accumulator.arrays(), meta
+
+
+def stage_bin(config: PipelineConfig, ingest: StageResult) -> StageOutput:
+    """BIN_MODE elevation per cell (meters), NaN where no returns landed"""
+    acc = GridAccumulator.from_arrays(ingest.meta["shape"], ingest.meta["modes"], ingest.arrays)
+    return {"grid": acc.result(config.bin_mode, scale=ingest.meta["scale"])}, {}
+
+
+def stage_fill(config: PipelineConfig, binned: StageResult) -> StageOutput:
+    """Fill gaps (sparse/no returns, often water) for continuity"""
+    grid = np.asarray(binned.arrays["grid"])
+    meta = {"fill_method": config.fill_method}
+    ws = _workspace(config)
+    if ws is None:
+        missing = np.isnan(grid)
+        return {"grid": fill_nans(config, grid), "missing": missing}, meta
+    missing = ws.create("fill.missing", grid.shape, bool)
+    for rows in chunked_rows(grid.shape, grid.itemsize):
+        missing[rows] = np.isnan(grid[rows])
+    return {"grid": fill_nans(config, grid, ws, "fill.grid"), "missing": missing}, meta
+
+
+def _relief_block(grid: np.ndarray, missing: np.ndarray, base_elev: float, relief_mult: float,
+                  sigma_land: float, sigma_water: Optional[float]) -> np.ndarray:
+    height_grid = (grid - base_elev) * relief_mult  # meters
+
+    # smooth: global + extra on missing zones (blocky nearest-neighbour fill only)
+    height_grid = gaussian_filter(height_grid, sigma=sigma_land, mode="nearest")
+    if sigma_water is not None and np.any(missing):
+        height_smooth_more = gaussian_filter(height_grid, sigma=sigma_water, mode="nearest")
+        height_grid[missing] = height_smooth_more[missing]
+    return height_grid
+
+
+def stage_relief(config: PipelineConfig, filled: StageResult) -> StageOutput:
+    """Relative heights in meters, scaled and smoothed (extra smoothing on missing zones)"""
+    grid = np.asarray(filled.arrays["grid"])
+    missing = np.asarray(filled.arrays["missing"])
+
+    if config.pin_min_to_zero:
+        base_elev = float(np.min(grid))
+    else:
+        # Centering around median yields signed cut/fill stamps and reduces net upward bias.
+        base_elev = float(np.median(grid))
+
+    # Push-pull fills gaps with a smooth membrane already; SIGMA_WATER only softens nearest-fill plateaus.
+    sigma_water = config.sigma_water if filled.meta.get("fill_method", "nearest") == "nearest" else None
+    relief = partial(_relief_block, base_elev=base_elev, relief_mult=config.relief_mult,
+                     sigma_land=config.sigma_land, sigma_water=sigma_water)
+    ws = _workspace(config)
+    if ws is None:
+        height_grid = relief(grid=grid, missing=missing)
+        median = None
+        if config.force_zero_mean_stamps:
+            median = float(np.median(height_grid))
+            height_grid = height_grid - median
+        return {"height": height_grid}, {"base_elev": base_elev, "median_shift": median}
+
+    halo = gaussian_halo(config.sigma_land) + (gaussian_halo(sigma_water) if sigma_water is not None else 0)
+    height_grid = _tiled(config, ws, "relief.height", relief, {"grid": grid, "missing": missing}, halo, grid.dtype)
+    median = None
+    if config.force_zero_mean_stamps:
+        median = float(np.median(height_grid))
+        for rows in chunked_rows(height_grid.shape, height_grid.itemsize):
+            height_grid[rows] -= median
+    return {"height": height_grid}, {"base_elev": base_elev, "median_shift": median}
+
+
+def _recognition_block(height: np.ndarray, macro_sigma: float, macro_gain: float, detail_gain: float,
+                       post_shape_sigma: float) -> np.ndarray:
+    macro = gaussian_filter(height, sigma=macro_sigma, mode="nearest")
+    detail = height - macro
+    height = macro * macro_gain + detail * detail_gain
+    return gaussian_filter(height, sigma=post_shape_sigma, mode="nearest")
+
+
+def stage_recognition(config: PipelineConfig, relief: StageResult) -> StageOutput:
+    """Boost broad contours and suppress micro undulation for easier visual matching"""
+    height_grid = np.asarray(relief.arrays["height"])
+    if config.recognition_mode:
+        recognize = partial(_recognition_block, macro_sigma=config.macro_sigma, macro_gain=config.macro_gain,
+                            detail_gain=config.detail_gain, post_shape_sigma=config.post_shape_sigma)
+        ws = _workspace(config)
+        if ws is None:
+            height_grid = recognize(height=height_grid)
+        else:
+            halo = gaussian_halo(config.macro_sigma) + gaussian_halo(config.post_shape_sigma)
+            height_grid = _tiled(config, ws, "recognition.height", recognize, {"height": height_grid}, halo,
+                                 height_grid.dtype)
+    return {"height": height_grid}, {}
+
+
+def _water_mask_block(height: np.ndarray, limit: float, iterations: int) -> np.ndarray:
+    return binary_closing(height < limit, iterations=iterations)
+
+
+def _water_flatten_block(height: np.ndarray, water_mask: np.ndarray, water_floor: float,
+                         flat_blend: float) -> np.ndarray:
+    height = height.copy()
+    height[water_mask] = (1.0 - flat_blend) * height[water_mask] + flat_blend * water_floor
+    # Gentle blend after flattening to avoid hard shoreline edges.
+    return gaussian_filter(height, sigma=2.0, mode="nearest")
+
+
+def stage_water(config: PipelineConfig, recognition: StageResult) -> StageOutput:
+    """Flatten lowland basins into water floors, then the optional TGC elevate/clip"""
+    ws = _workspace(config)
+    height_grid = np.asarray(recognition.arrays["height"])
+    arrays = {}
+    meta = {"water_floor": None, "water_coverage": None}
+    if config.enable_water_floor:
+        water_floor = float(np.percentile(height_grid, config.water_floor_percentile))
+        close = partial(_water_mask_block, limit=water_floor + config.water_surface_band,
+                        iterations=config.water_mask_close_iters)
+        if ws is None:
+            water_mask = close(height=height_grid)
+        else:
+            water_mask = _tiled(config, ws, "water.closed", close, {"height": height_grid},
+                                closing_halo(config.water_mask_close_iters), bool)
+        # Whole-array even when tiled: whether a basin is enclosed depends on the entire (1 byte/cell) mask.
+        water_mask = binary_fill_holes(water_mask)
+        meta.update(water_floor=water_floor, water_coverage=float(np.mean(water_mask)))
+        if np.any(water_mask):
+            flatten = partial(_water_flatten_block, water_floor=water_floor, flat_blend=config.water_flat_blend)
+            if ws is None:
+                height_grid = flatten(height=height_grid, water_mask=water_mask)
+            else:
+                height_grid = _tiled(config, ws, "water.height", flatten,
+                                     {"height": height_grid, "water_mask": water_mask}, gaussian_halo(2.0),
+                                     height_grid.dtype)
+        arrays["water_mask"] = water_mask
+
+    if config.use_tgc_compat_profile:
+        # Mimic tgc_tools.elevate_terrain behavior: shift to a positive buffer and clip very low values.
+        elevate_shift = -float(np.min(height_grid)) + config.elevate_buffer_height
+        if ws is None:
+            height_grid = height_grid + elevate_shift
+            height_grid = np.where(height_grid >= config.clip_lowest_value, height_grid, np.nan)
+            if np.any(np.isnan(height_grid)):
+                height_grid = fill_nans(config, height_grid.astype(np.float32)).astype(np.float32)
+        else:
+            elevated = ws.create("water.elevated", height_grid.shape, np.float32)
+            clipped = False
+            for rows in chunked_rows(height_grid.shape, height_grid.itemsize):
+                block = height_grid[rows] + elevate_shift
+                elevated[rows] = np.where(block >= config.clip_lowest_value, block, np.nan)
+                clipped = clipped or bool(np.any(np.isnan(elevated[rows])))
+            height_grid = elevated
+            if clipped:
+                height_grid = fill_nans(config, elevated, ws, "water.refilled")
+
+    arrays["height"] = height_grid
+    return arrays, meta
+
+
+def stage_stamp(config: PipelineConfig, water: StageResult) -> StageOutput:
+    """Landscaping stamps ("height" layer) sampled or solved from the final height field"""
+    height_grid = np.asarray(water.arrays["height"])
+    water_mask = water.arrays.get("water_mask")
+    meta: Dict[str, Any] = {"auto_gain": None, "pctl_abs": None, "solve": None}
+
+    # A mosaic extent need not be square; its grid is stretched onto the plot.
+    shaping = (config.relief_gamma, config.positive_relief_boost, config.negative_relief_scale)
+    if config.stamp_placement == "quadtree":
+        target_grid = shape_relief(height_grid, *shaping)
+        nodes = quadtree_nodes(
+            target_grid, config.quadtree_max_stamps, config.quadtree_min_size,
+            config.quadtree_max_size, config.quadtree_residual_m,
+        )
+        land = quadtree_stamps(nodes, config.quadtree_scale_per_size, config.stamp_tool, config.brush_type)
+        stamp_vals, solve_report = solve_stamp_values(land, target_grid, config.max_stamp_abs)
+        land.data["value"] = stamp_vals
+        sampled_count = len(land)
+        clip_count = solve_report.at_bound
+        layers = [land[np.abs(stamp_vals) > config.stamp_eps]]
+    elif config.stamp_placement == "lattice":
+        lattice_x, lattice_z = lattice(config.brush_spacing)
+        raw_vals = sample_bilinear(height_grid, lattice_x, lattice_z)  # meters
+        sampled_count = len(raw_vals)
+
+        auto_gain, pctl_abs = percentile_auto_gain(
+            raw_vals, config.target_abs_percentile, config.target_stamp_at_percentile
+        )
+        meta.update(auto_gain=auto_gain, pctl_abs=pctl_abs)
+        shaped = shape_relief(raw_vals, *shaping)
+        stamp_vals, clipped = stamp_values(shaped, auto_gain, config.overlap_gain, config.max_stamp_abs)
+        clip_count = int(np.count_nonzero(clipped))
+
+        solve_report = None
+        if config.stamp_solver == "lsq":
+            target_grid = shape_relief(height_grid, *shaping)
+            land = BrushLayer.from_columns(
+                lattice_x, lattice_z, stamp_vals, config.brush_scale, config.stamp_tool, config.brush_type
+            )
+            stamp_vals, solve_report = solve_stamp_values(
+                land, target_grid, config.max_stamp_abs, warm_start=stamp_vals
+            )
+            clip_count = solve_report.at_bound
+        elif config.stamp_solver != "autogain":
+            raise ValueError(f"Unknown STAMP_SOLVER '{config.stamp_solver}'; expected 'autogain' or 'lsq'")
+        keep = np.abs(stamp_vals) > config.stamp_eps
+
+        layers = [
+            BrushLayer.from_columns(
+                lattice_x[keep], lattice_z[keep], stamp_vals[keep],
+                config.brush_scale, config.stamp_tool, config.brush_type,
+            )
+        ]
+    else:
+        raise ValueError(
+            f"Unknown STAMP_PLACEMENT '{config.stamp_placement}'; expected 'lattice' or 'quadtree'"
+        )
+
+    # Optional second pass to suppress residual islands inside detected water bodies.
+    water_drain_count = 0
+    if config.enable_water_drain_stamps and (water_mask is not None):
+        pass_offsets = [(0.0, 0.0)]
+        if config.water_drain_double_pass:
+            pass_offsets.append((config.water_drain_spacing * 0.5, config.water_drain_spacing * 0.5))
+        drain_x, drain_z = mask_lattice(np.asarray(water_mask), config.water_drain_spacing, pass_offsets)
+        layers.append(BrushLayer.from_columns(
+            drain_x, drain_z, config.water_drain_value, config.water_drain_scale, 1, 54
+        ))
+        water_drain_count = len(drain_x)
+
+    stamps = BrushLayer.concat(layers)
+    if solve_report is not None:
+        meta["solve"] = dataclasses.asdict(solve_report)
+    meta.update(sampled_count=sampled_count, clip_count=clip_count, water_drain_count=water_drain_count)
+    return {"stamps": stamps.data}, meta
+
+
+def stage_compact(config: PipelineConfig, stamp: StageResult) -> StageOutput:
+    """Stamps with identical strokes merged and redundant ones absorbed by their neighbours (COMPACT_STAMPS)"""
+    stamps = np.asarray(stamp.arrays["stamps"])
+    if not config.compact_stamps:
+        return {"stamps": stamps}, {"compaction": None}
+    compacted, report = compact_layer(
+        BrushLayer(np.array(stamps, dtype=BRUSH_DTYPE)), config.compact_tolerance_m,
+        config.compact_error_resolution_m, max_abs=config.max_stamp_abs,
+    )
+    return {"stamps": compacted.data}, {"compaction": dataclasses.asdict(report)}
+
+
+# Helpers whose source is part of a stage's cache key (the stage function's own source always is).
+STAGE_DEPS = {
+    "ingest": (_single_tile, laz_ingest, laz_mosaic, binning),
+    "bin": (binning,),
+    "fill": (fill_nans, fill_nan_nearest, inpaint),
+    "relief": (_relief_block,),
+    "recognition": (_recognition_block,),
+    "water": (_water_mask_block, _water_flatten_block, fill_nans, fill_nan_nearest, inpaint),
+    "stamp": (stamps_module, quadtree, stamp_solver, brush_sim),
+    "compact": (compaction, stamp_solver, brush_sim),
+}
+
+
+# ---- console reports (same lines whether a stage ran or was cached) ----
+def _report_ingest(config: PipelineConfig, result: StageResult, log: Callable[[str], None]):
+    m = result.meta
+    if m["kind"] == "tile":
+        log(f"Loading LAZ: {m['source']}")
+        # Prefer ground points (class 2)
+        if m["use_ground"]:
+            log(f"Using ground points: {m['ground_count']}")
+        else:
+            log("No ground classification found; using all points.")
+        # Units converted per chunk so that brush "value" is meters
+        log(f"Z units: {m['units_note']}")
+        log(
+            f"Source LiDAR range: {m['src_min']:.2f} to {m['src_max']:.2f} m "
+            f"(full {m['src_max'] - m['src_min']:.2f} m, p95-p05 ~{m['src_p95'] - m['src_p05']:.2f} m)"
+        )
+    else:
+        log(f"Mosaicking {m['tiles']} LAZ tiles")
+        log(f"Tiles used: {m['tiles_used']}, skipped (outside bbox): {m['tiles_skipped']}")
+        log(
+            f"Mosaic grid: {m['width']}x{m['height']} cells at {m['cell_size']:.3f} units/cell, "
+            f"bbox {tuple(m['bbox'])}"
+        )
+        log(f"Z units: {m['units_note']}")
+        log(f"Source LiDAR range: {m['src_min']:.2f} to {m['src_max']:.2f} m")
+
+
+def _report_water(config: PipelineConfig, result: StageResult, log: Callable[[str], None]):
+    height_grid = np.asarray(result.arrays["height"])
+    log(f"Height range (meters): {float(np.nanmin(height_grid)):.2f} to {float(np.nanmax(height_grid)):.2f}")
+    hg_p05 = float(np.nanpercentile(height_grid, 5))
+    hg_p95 = float(np.nanpercentile(height_grid, 95))
+    log(f"Height p95-p05 (meters): {hg_p95 - hg_p05:.2f}")
+
+
+def _report_stamp(config: PipelineConfig, result: StageResult, water: StageResult,
+                  log: Callable[[str], None]):
+    m = result.meta
+    vals = result.arrays["stamps"]["value"]
+    pos_count = int(np.count_nonzero(vals > 0.0))
+    neg_count = int(np.count_nonzero(vals < 0.0))
+    v_p05 = float(np.percentile(vals, 5))
+    v_p95 = float(np.percentile(vals, 95))
+    sampled_count, clip_count = m["sampled_count"], m["clip_count"]
+    log(f"Created {len(vals)} landscaping brush strokes")
+    log(f"Brush value range written (meters): {float(np.min(vals)):.4f} to {float(np.max(vals)):.4f}")
+    log(f"Brush value p95-p05 (meters): {v_p95 - v_p05:.4f}")
+    log(f"Mean |stamp| (meters): {float(np.mean(np.abs(vals))):.4f}")
+    log(f"Stamp sign counts: +{pos_count} / -{neg_count} (mean {float(np.mean(vals)):.6f})")
+    if config.stamp_placement == "lattice":
+        log(f"Auto-gain: {m['auto_gain']:.5f} (p{config.target_abs_percentile:.0f} |h| = {m['pctl_abs']:.5f} m)")
+    if m["solve"] is not None:
+        log(f"LSQ solve: {SolveReport(**m['solve']).summary()}")
+    log(f"Clipped stamps: {clip_count}/{sampled_count} ({(100.0 * clip_count / max(1, sampled_count)):.1f}%)")
+    if config.stamp_placement == "quadtree":
+        log(
+            f"Quadtree placement: {sampled_count} stamps (cap {config.quadtree_max_stamps}), cell "
+            f"{config.quadtree_min_size}-{config.quadtree_max_size} m, scale/size {config.quadtree_scale_per_size}"
+        )
+    else:
+        log(f"Brush spacing: {config.brush_spacing}, brush scale: {config.brush_scale}")
+    log(f"Overlap gain: {config.overlap_gain}, max abs stamp: {config.max_stamp_abs}")
+    log(f"Stamp tool/type: {config.stamp_tool}/{config.brush_type}")
+    log(
+        f"Relief shaping: gamma={config.relief_gamma}, +boost={config.positive_relief_boost}, "
+        f"-scale={config.negative_relief_scale}"
+    )
+    log(
+        f"Recognition mode: {config.recognition_mode} (macro_sigma={config.macro_sigma}, "
+        f"macro_gain={config.macro_gain}, detail_gain={config.detail_gain}, post_sigma={config.post_shape_sigma})"
+    )
+    log(
+        f"Water floor: {config.enable_water_floor} (pct={config.water_floor_percentile}, "
+        f"level={water.meta['water_floor']}, band={config.water_surface_band}, "
+        f"flat_blend={config.water_flat_blend}, coverage={water.meta['water_coverage']})"
+    )
+    log(
+        f"Water drain pass: {config.enable_water_drain_stamps} "
+        f"(count={m['water_drain_count']}, spacing={config.water_drain_spacing}, "
+        f"scale={config.water_drain_scale}, value={config.water_drain_value}, "
+        f"double_pass={config.water_drain_double_pass})"
+    )
+    if config.use_tgc_compat_profile:
+        log(f"TGC compat: True (buffer={config.elevate_buffer_height}, clip_low={config.clip_lowest_value})")
+    log(f"Pin min to zero: {config.pin_min_to_zero}, force zero mean: {config.force_zero_mean_stamps}")
+
+
+def pipeline_diagnostics(results: Dict[str, StageResult]) -> Dict[str, Any]:
+    """The printed diagnostics as a flat dict (for sweeps and logs); missing stages are skipped"""
+    out: Dict[str, Any] = {}
+    water = results.get("water")
+    if water is not None:
+        height_grid = np.asarray(water.arrays["height"])
+        out.update(
+            height_min=float(np.nanmin(height_grid)),
+            height_max=float(np.nanmax(height_grid)),
+            height_p95_p05=float(np.nanpercentile(height_grid, 95) - np.nanpercentile(height_grid, 5)),
+            water_floor=water.meta["water_floor"],
+            water_coverage=water.meta["water_coverage"],
+        )
+    stamp = results.get("stamp")
+    if stamp is not None:
+        m = stamp.meta
+        vals = np.asarray(stamp.arrays["stamps"]["value"])
+        out.update(
+            strokes=len(vals),
+            sampled=m["sampled_count"],
+            clipped=m["clip_count"],
+            clipped_pct=100.0 * m["clip_count"] / max(1, m["sampled_count"]),
+            water_drain_count=m["water_drain_count"],
+            auto_gain=m["auto_gain"],
+        )
+        if len(vals):
+            out.update(
+                value_min=float(np.min(vals)),
+                value_max=float(np.max(vals)),
+                value_p95_p05=float(np.percentile(vals, 95) - np.percentile(vals, 5)),
+                mean_abs_value=float(np.mean(np.abs(vals))),
+                positive=int(np.count_nonzero(vals > 0.0)),
+                negative=int(np.count_nonzero(vals < 0.0)),
+            )
+        if m["solve"] is not None:
+            out.update(lsq_rms_before=m["solve"]["rms_before"], lsq_rms_after=m["solve"]["rms_after"])
+    compact = results.get("compact")
+    if compact is not None and compact.meta["compaction"] is not None:
+        c = compact.meta["compaction"]
+        out.update(
+            strokes_compacted=c["strokes_after"],
+            compact_max_error_m=c["max_error_m"],
+            compact_rms_error_m=c["rms_error_m"],
+        )
+    return out
+
+
+def simulate_preview(config: PipelineConfig, stamps: BrushLayer, height_grid: np.ndarray,
+                     sim_path: Path, log: Callable[[str], None] = print):
+    """Rasterize the stamps with the soft-circle simulator and compare to the target field"""
+    sim_grid = SimGrid(resolution=config.simulate_resolution_m)
+    simulated = simulate_heightfield(stamps, sim_grid)
+    target = sample_target(height_grid, sim_grid)
+    # Compare shape, not absolute level: the game adds stamps onto the template terrain.
+    err = (simulated - simulated.mean()) - (target - target.mean())
+    corr = float(np.corrcoef(simulated.ravel(), target.ravel())[0, 1]) if simulated.std() > 0 else 0.0
+    log(
+        f"Simulated preview @ {config.simulate_resolution_m} m: range {float(simulated.min()):.2f} to "
+        f"{float(simulated.max()):.2f}, RMS vs target {float(np.sqrt(np.mean(err ** 2))):.3f} m, corr {corr:.3f}"
+    )
+    sim_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(sim_path, simulated.astype(np.float32))
+    log(f"Saved simulated raster to: {sim_path}")
+
+
+def write_course(config: PipelineConfig, stamps: BrushLayer, template_file: Path, output_file: Path,
+                 cache_dir: Path, log: Callable[[str], None] = print):
+    """Put the stamps into a copy of the template and save it to output_file"""
+    template_cache = shared_cache(cache_dir / "templates", config.template_cache_max_mb * 1024 * 1024)
+    course = template_cache.load(template_file)
+    log(f"Template: {template_file.name} ({'cached' if template_cache.last_hit else 'decoded'})")
+
+    # OPTIONAL debug dump
+    if config.dump_template_json:
+        dump_path = output_file.parent / "template_dump.json"
+        if export_json_if_changed(course, template_cache.last_key, dump_path):
+            log(f"Dumped template JSON to: {dump_path}")
+
+    # IMPORTANT: Use LANDSCAPING stamps
+    course.set_layer("height", stamps)
+    course.course_data["terrainHeight"] = []  # keep empty
+    _save_course(config, course, output_file)
+
+
+def _save_course(config: PipelineConfig, course: CourseFile, output_file: Path):
+    """Apply the course-level knobs and save atomically"""
+    if config.disable_procedural_terrain:
+        # Turn off procedural hills/noise so only LiDAR stamps shape the plot.
+        course.course_data["hillsAmount"] = 0.0
+        course.course_data["hillsHeight"] = 0.0
+        if "terrainNoise" in course.course_data and isinstance(course.course_data["terrainNoise"], dict):
+            course.course_data["terrainNoise"]["scale"] = 0.0
+        if "perturbationNoise" in course.course_data and isinstance(course.course_data["perturbationNoise"], dict):
+            course.course_data["perturbationNoise"]["scale"] = 0.0
+
+    course.set_name(config.course_name)
+    # Save next to the target and rename, so a crash never leaves a truncated .course behind.
+    tmp = output_file.with_name(output_file.name + ".tmp")
+    try:
+        course.save(tmp, compression=config.save_compression, brush_precision=config.save_brush_precision)
+        os.replace(tmp, output_file)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def restamp_course(config: PipelineConfig, stamps: BrushLayer, target: StampTarget, output_file: Path,
+                   log: Callable[[str], None] = print) -> Optional[RestampReport]:
+    """
+    Update the existing output_file in place of a full write: only stamps
+    whose footprints touch cells where target differs from the field the
+    course was built from (its .target.npz) are regenerated from stamps.
+
+    Returns None, leaving the course alone, when a full write is needed:
+    no course or saved target yet, another grid size, template or stamp/write
+    knobs, a moved whole-field scalar (auto-gain, relief base/median), a
+    global solve (STAMP_SOLVER "lsq", STAMP_PLACEMENT "quadtree") where any
+    change moves every stamp, or COMPACT_STAMPS, whose refits spread a
+    stroke's share across region borders.
+    """
+    if config.stamp_solver == "lsq" or config.stamp_placement == "quadtree":
+        log("Incremental restamp: stamp values are solved globally, writing in full")
+        return None
+    if config.compact_stamps:
+        log("Incremental restamp: compacted stamps are refit globally, writing in full")
+        return None
+    previous = StampTarget.load(target_path(output_file))
+    if not output_file.exists() or previous is None:
+        log("Incremental restamp: no previous course/target, writing in full")
+        return None
+    if previous.stamp_key != target.stamp_key or previous.height.shape != target.height.shape:
+        log("Incremental restamp: template, stamp knobs or grid size changed, writing in full")
+        return None
+    if previous.scalars != target.scalars:
+        log("Incremental restamp: auto-gain or relief level changed, writing in full")
+        return None
+
+    dirty = dirty_mask(previous, target.height, target.water_mask, config.incremental_tolerance_m)
+    regions = dirty_regions(dirty)
+    course = CourseFile.load(output_file)
+    report = splice_stamps(course.layer("height"), stamps, regions)
+    report.dirty_cells = int(np.count_nonzero(dirty))
+    log(
+        f"Incremental restamp: {report.dirty_cells} dirty cells in {len(regions)} regions, "
+        f"{report.replaced} replaced, {report.added} added, {report.removed} removed, {report.kept} kept"
+    )
+    if regions:
+        _save_course(config, course, output_file)
+    return report
+
+
+def run_pipeline(
+    config: PipelineConfig,
+    laz_files: Sequence[Path],
+    template_file: Path,
+    output_file: Path,
+    cache_dir: Optional[Path] = None,
+    upto: str = "write",
+    log: Callable[[str], None] = print,
+    metrics: Optional[MetricsRecorder] = None,
+) -> Dict[str, StageResult]:
+    """
+    Run the stages in order up to and including upto.
+
+    Each raster stage is looked up in the stage cache (cache_dir/stages,
+    default next to output_file) by a hash of its knobs and its inputs' keys,
+    so changing a late knob such as RELIEF_GAMMA only recomputes the stamp
+    and write stages. Returns the StageResults by name; "write" is absent if
+    no stamps were produced.
+
+    With RASTER_TILE_SIZE set, the fill/relief/recognition/water stages run
+    tile by tile over memory-mapped scratch files (cache_dir/tiles/run-*,
+    removed afterwards; ones left by killed runs are swept after
+    STALE_RUN_SECONDS), RASTER_WORKERS tiles at a time; results match the
+    whole-array stages (see src/tiled.py), so the knob is not part of the
+    cache keys.
+
+    With WRITE_METRICS every stage's wall time, peak RSS and output array
+    sizes plus all diagnostics go to <output>.metrics.jsonl (or to the given
+    recorder).
+    """
+    if upto not in STAGES:
+        raise ValueError(f"Unknown stage '{upto}'; expected one of {STAGES}")
+    config = config.effective()
+    output_file = Path(output_file)
+    cache_dir = Path(cache_dir) if cache_dir is not None else output_file.parent / "cache"
+    if metrics is None and config.write_metrics:
+        metrics = MetricsRecorder(output_file.with_suffix(".metrics.jsonl"))
+    work_dir = None
+    if config.raster_tile_size and config.raster_work_dir is None:
+        # Per run, so concurrent runs (sweep workers) never share scratch memmaps.
+        (cache_dir / "tiles").mkdir(parents=True, exist_ok=True)
+        _sweep_stale_runs(cache_dir / "tiles")
+        work_dir = tempfile.mkdtemp(dir=cache_dir / "tiles", prefix="run-")
+        config = config.replace(raster_work_dir=work_dir)
+    results: Dict[str, StageResult] = {}
+    error = None
+    try:
+        _run_stages(config, laz_files, Path(template_file), output_file, cache_dir, upto, log, metrics, results)
+    except BaseException as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        if work_dir is not None:
+            _release_work_dir(results, Path(work_dir))
+        if metrics is not None:
+            metrics.emit("diagnostics", **pipeline_diagnostics(results), **_stage_meta(results))
+            metrics.write(
+                output=str(output_file), upto=upto, error=error,
+                cached=[name for name, r in results.items() if r.cached],
+                config=dataclasses.asdict(config),
+            )
+    return results
+
+
+# Tile scratch directories (cache_dir/tiles/run-*) untouched this long belong to no live run.
+STALE_RUN_SECONDS = 24 * 3600
+
+
+def _mapped_file(a: np.ndarray) -> Optional[Path]:
+    """File behind a memmap (or any view of one), else None"""
+    while a is not None and not isinstance(a, np.memmap):
+        a = getattr(a, "base", None)
+    filename = getattr(a, "filename", None)
+    return Path(filename) if filename else None
+
+
+def _release_work_dir(results: Dict[str, StageResult], work_dir: Path):
+    """
+    Remove a run's tile scratch directory. Stage outputs still mapped from it
+    (stage cache off) are copied into memory first: Windows cannot delete a
+    file while a map of it is open.
+    """
+    root = work_dir.resolve()
+    for result in results.values():
+        for name, array in result.arrays.items():
+            path = _mapped_file(array)
+            if path is not None and root in path.resolve().parents:
+                result.arrays[name] = np.array(array)
+    gc.collect()  # close the dropped maps now, not whenever their cycles are collected
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _sweep_stale_runs(tiles_dir: Path, max_age: float = STALE_RUN_SECONDS):
+    """Delete run-* scratch left by crashed or killed runs (nothing in them touched for max_age seconds)"""
+    now = time.time()
+    for run in tiles_dir.glob("run-*"):
+        try:
+            newest = max([run.stat().st_mtime] + [f.stat().st_mtime for f in run.iterdir()])
+        except OSError:
+            continue
+        if now - newest > max_age:
+            shutil.rmtree(run, ignore_errors=True)
+
+
+def _stage_meta(results: Dict[str, StageResult]) -> Dict[str, Any]:
+    """Stage metadata worth logging (source LiDAR, relief base, water, stamp/solve details)"""
+    out: Dict[str, Any] = {}
+    for name in ("ingest", "relief", "stamp", "compact"):
+        if name in results:
+            out[name] = dict(results[name].meta)
+    return out
+
+
+def _run_stages(config: PipelineConfig, laz_files: Sequence[Path], template_file: Path, output_file: Path,
+                cache_dir: Path, upto: str, log: Callable[[str], None],
+                metrics: Optional[MetricsRecorder], results: Dict[str, StageResult]):
+    laz_files = [Path(f) for f in laz_files]
+    cache = StageCache(
+        cache_dir / "stages", max_disk_bytes=config.stage_cache_max_mb * 1024 * 1024, enabled=config.stage_cache
+    )
+
+    @contextmanager
+    def _timed(name: str):
+        if metrics is None:
+            yield None
+        else:
+            with metrics.stage(name) as m:
+                yield m
+
+    def _run(name: str, fn: Callable[..., StageOutput], inputs: Sequence[StageResult] = (),
+             extra: Optional[Dict[str, Any]] = None, persist: bool = True) -> bool:
+        params = dict(config.stage_params(name), **(extra or {}))
+        with _timed(name) as m:
+            result = cache.run(name, params, fn, inputs, persist=persist, deps=STAGE_DEPS.get(name, ()))
+            if m is not None:
+                m.record_arrays(result.arrays)
+                m.extra.update(cached=result.cached, key=result.key)
+        results[name] = result
+        log(f"[stage] {name}: {result.seconds:.2f} s{' (cached)' if result.cached else ''}")
+        return name == upto
+
+    ingest_params = {"laz": laz_fingerprint(laz_files), "single_tile": _single_tile(config, laz_files)}
+    if _run("ingest", partial(stage_ingest, config, laz_files), extra=ingest_params):
+        return
+    _report_ingest(config, results["ingest"], log)
+    for name, fn, source in (
+        ("bin", stage_bin, "ingest"),
+        ("fill", stage_fill, "bin"),
+        ("relief", stage_relief, "fill"),
+        ("recognition", stage_recognition, "relief"),
+        ("water", stage_water, "recognition"),
+    ):
+        if _run(name, partial(fn, config), [results[source]]):
+            return
+    _report_water(config, results["water"], log)
+
+    if _run("stamp", partial(stage_stamp, config), [results["water"]]):
+        return
+    if len(results["stamp"].arrays["stamps"]) == 0:
+        log("WARNING: No terrain entries were created. Check STAMP_EPS / RELIEF_MULT.")
+        return
+    _report_stamp(config, results["stamp"], results["water"], log)
+
+    if _run("compact", partial(stage_compact, config), [results["stamp"]]):
+        return
+    compaction = results["compact"].meta["compaction"]
+    if compaction is not None:
+        log(f"Compaction: {CompactionReport(**compaction).summary()}")
+    stamps = BrushLayer(np.array(results["compact"].arrays["stamps"], dtype=BRUSH_DTYPE))
+
+    if config.simulate_preview:
+        height_grid = np.asarray(results["water"].arrays["height"])
+        with _timed("simulate"):
+            simulate_preview(config, stamps, height_grid, output_file.with_suffix(".sim.npy"), log)
+
+    def _write(stamp: StageResult) -> StageOutput:
+        meta: Dict[str, Any] = {}
+        if config.incremental_stamps:
+            water = results["water"].arrays
+            knobs = dict(config.stage_params("stamp"), **config.stage_params("compact"),
+                         **config.stage_params("write"), template=file_key(template_file))
+            relief = results["relief"].meta
+            target = StampTarget(
+                np.asarray(water["height"]),
+                np.asarray(water["water_mask"]) if "water_mask" in water else None,
+                stage_key("stamp", knobs),
+                {"auto_gain": results["stamp"].meta.get("auto_gain"), "base_elev": relief.get("base_elev"),
+                 "median_shift": relief.get("median_shift")},
+            )
+            report = restamp_course(config, stamps, target, output_file, log)
+            meta["restamp"] = report.as_dict() if report is not None else None
+            if report is None:
+                write_course(config, stamps, template_file, output_file, cache_dir, log)
+            target.save(target_path(output_file))
+        else:
+            write_course(config, stamps, template_file, output_file, cache_dir, log)
+        meta["bytes"] = output_file.stat().st_size
+        return {}, meta
+
+    # Side effect (the .course file), so it always runs; the template decode is cached instead.
+    _run("write", _write, [results["compact"]], persist=False)
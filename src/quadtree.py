@@ -0,0 +1,158 @@
+"""
+CourseForge - Quadtree Placement Module
+Adaptive stamp placement: large stamps on smooth terrain, small ones where it bends
+"""
+import heapq
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.course_file import BrushLayer
+from src.stamps import PLOT_MAX, PLOT_MIN, plot_to_grid
+
+
+@dataclass
+class QuadNode:
+    """Square plot region [x0, x0 + size) x [z0, z0 + size); one stamp at its centre"""
+    x0: float
+    z0: float
+    size: float
+    score: float = 0.0
+
+    @property
+    def centre(self) -> Tuple[float, float]:
+        return (self.x0 + 0.5 * self.size, self.z0 + 0.5 * self.size)
+
+    def children(self) -> List['QuadNode']:
+        h = 0.5 * self.size
+        return [QuadNode(self.x0 + dx, self.z0 + dz, h) for dz in (0.0, h) for dx in (0.0, h)]
+
+
+class PlaneResidual:
+    """
+    RMS residual of the best-fit plane over any grid rectangle in O(1).
+
+    A plane is what a smooth patch of overlapping stamps reproduces well, so
+    the residual is a curvature measure in meters. Integral images hold z,
+    u*z, v*z and z^2; the pure-coordinate sums are closed form.
+    """
+
+    def __init__(self, grid: np.ndarray, extra: Optional[np.ndarray] = None):
+        g = np.asarray(grid, dtype=np.float64)
+        self.shape = g.shape
+        rows, cols = g.shape
+        v, u = np.mgrid[0:rows, 0:cols].astype(np.float64)
+        # Centre the coordinates so the normal equations stay well conditioned.
+        u -= 0.5 * (cols - 1)
+        v -= 0.5 * (rows - 1)
+        self._sat = {name: self._integral(a) for name, a in (
+            ("z", g), ("uz", u * g), ("vz", v * g), ("zz", g * g),
+        )}
+        # Optional residual map (e.g. |simulated - target| of a previous solve).
+        self._extra = None if extra is None else self._integral(np.asarray(extra, dtype=np.float64) ** 2)
+        self._u0 = -0.5 * (cols - 1)
+        self._v0 = -0.5 * (rows - 1)
+
+    @staticmethod
+    def _integral(a: np.ndarray) -> np.ndarray:
+        out = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+        np.cumsum(np.cumsum(a, axis=0), axis=1, out=out[1:, 1:])
+        return out
+
+    @staticmethod
+    def _rect(sat: np.ndarray, r0: int, r1: int, c0: int, c1: int) -> float:
+        return sat[r1, c1] - sat[r0, c1] - sat[r1, c0] + sat[r0, c0]
+
+    @staticmethod
+    def _sums(a: float, b: int) -> Tuple[float, float]:
+        """(sum, sum of squares) of a, a+1, ..., a+b-1"""
+        k = np.arange(b, dtype=np.float64) + a
+        return float(k.sum()), float((k * k).sum())
+
+    def __call__(self, r0: int, r1: int, c0: int, c1: int) -> float:
+        h, w = r1 - r0, c1 - c0
+        n = h * w
+        if n <= 0:
+            return 0.0
+        su, suu = self._sums(self._u0 + c0, w)
+        sv, svv = self._sums(self._v0 + r0, h)
+        ata = np.array([
+            [n, h * su, w * sv],
+            [h * su, h * suu, su * sv],
+            [w * sv, su * sv, w * svv],
+        ])
+        atz = np.array([self._rect(self._sat[k], r0, r1, c0, c1) for k in ("z", "uz", "vz")])
+        zz = self._rect(self._sat["zz"], r0, r1, c0, c1)
+        coef = np.linalg.lstsq(ata, atz, rcond=None)[0]
+        score = np.sqrt(max(zz - float(coef @ atz), 0.0) / n)
+        if self._extra is not None:
+            score = max(score, np.sqrt(max(self._rect(self._extra, r0, r1, c0, c1), 0.0) / n))
+        return float(score)
+
+
+def _node_window(node: QuadNode, shape: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    r0, c0 = plot_to_grid(np.array(node.x0), np.array(node.z0), shape)
+    r1, c1 = plot_to_grid(np.array(node.x0 + node.size), np.array(node.z0 + node.size), shape)
+    r0, c0 = int(np.floor(r0)), int(np.floor(c0))
+    r1, c1 = int(np.ceil(r1)) + 1, int(np.ceil(c1)) + 1
+    return max(r0, 0), min(r1, shape[0]), max(c0, 0), min(c1, shape[1])
+
+
+def quadtree_nodes(
+    height_grid: np.ndarray,
+    max_stamps: int,
+    min_size: float,
+    max_size: float,
+    residual_m: float,
+    residual_map: Optional[np.ndarray] = None,
+    plot_min: float = PLOT_MIN,
+    plot_max: float = PLOT_MAX,
+) -> List[QuadNode]:
+    """
+    Refine the plot worst plane-fit residual first; every node gets a stamp.
+
+    Starts from a uniform cover of max_size squares. Coarse nodes lay down the
+    broad shape and their children add detail on top, which overlaps far
+    better than stamping leaves only. A node is split while its residual
+    exceeds residual_m, its children are at least min_size wide and the four
+    extra stamps fit within max_stamps.
+    """
+    span = plot_max - plot_min
+    n0 = max(1, int(np.ceil(span / max_size)))
+    size0 = span / n0
+    if n0 * n0 > max_stamps:
+        raise ValueError(
+            f"max_stamps={max_stamps} is below the {n0 * n0} roots needed at max_size={max_size}"
+        )
+
+    scorer = PlaneResidual(height_grid, residual_map)
+    nodes: List[QuadNode] = []
+    heap = []
+
+    def _push(node: QuadNode):
+        node.score = scorer(*_node_window(node, height_grid.shape))
+        nodes.append(node)
+        heapq.heappush(heap, (-node.score, len(nodes), node))
+
+    for i in range(n0):
+        for j in range(n0):
+            _push(QuadNode(plot_min + i * size0, plot_min + j * size0, size0))
+
+    while heap and len(nodes) + 4 <= max_stamps:
+        neg_score, _, node = heapq.heappop(heap)
+        if -neg_score <= residual_m:
+            break
+        if 0.5 * node.size < min_size:
+            continue
+        for child in node.children():
+            _push(child)
+    return nodes
+
+
+def quadtree_stamps(nodes: List[QuadNode], scale_per_size: float, tool: int,
+                    brush_type: int) -> BrushLayer:
+    """One stamp per node, centred, with scale proportional to node size (values left at 0)"""
+    x, z = np.array([node.centre for node in nodes]).reshape(-1, 2).T
+    scale = np.array([node.size * scale_per_size for node in nodes])
+    return BrushLayer.from_columns(x, z, 0.0, scale, tool, brush_type)
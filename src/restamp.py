@@ -0,0 +1,152 @@
+"""
+CourseForge - Restamp Module
+Incremental re-stamping: find where the target height field changed and splice only those stamps
+"""
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.course_diff import diff_layers
+from src.course_file import BRUSH_DTYPE, BrushLayer
+from src.spatial_index import StrokeIndex
+from src.stamps import PLOT_MAX, PLOT_MIN
+
+
+# Dirty cells are gathered into square blocks of this many cells before querying stamps.
+DIRTY_BLOCK = 32
+
+Rect = Tuple[float, float, float, float]
+
+
+@dataclass
+class StampTarget:
+    """
+    The field a course's stamps were generated from, saved next to the course.
+
+    scalars holds the whole-field numbers every stamp value depends on
+    (auto-gain, relief base and median shift): when one moves, all stamps
+    change even where the field itself moved less than the tolerance.
+    """
+    height: np.ndarray
+    water_mask: Optional[np.ndarray]
+    stamp_key: str
+    scalars: Dict[str, Any] = field(default_factory=dict)
+
+    def save(self, path: Path):
+        arrays = {"height": np.asarray(self.height, dtype=np.float32)}
+        if self.water_mask is not None:
+            arrays["water_mask"] = np.asarray(self.water_mask, dtype=bool)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp, stamp_key=np.array(self.stamp_key),
+                 scalars=np.array(json.dumps(self.scalars, sort_keys=True)), **arrays)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['StampTarget']:
+        """The saved target, or None if missing or unreadable"""
+        try:
+            with np.load(path) as z:
+                mask = z["water_mask"] if "water_mask" in z.files else None
+                scalars = json.loads(str(z["scalars"])) if "scalars" in z.files else {}
+                return cls(z["height"], mask, str(z["stamp_key"]), scalars)
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+@dataclass
+class RestampReport:
+    regions: List[Rect] = field(default_factory=list)
+    dirty_cells: int = 0
+    replaced: int = 0
+    added: int = 0
+    removed: int = 0
+    kept: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "regions": len(self.regions), "dirty_cells": self.dirty_cells, "replaced": self.replaced,
+            "added": self.added, "removed": self.removed, "kept": self.kept,
+        }
+
+
+def target_path(output_file: Path) -> Path:
+    return output_file.with_suffix(".target.npz")
+
+
+def dirty_mask(old: StampTarget, height: np.ndarray, water_mask: Optional[np.ndarray],
+               tolerance: float) -> np.ndarray:
+    """Cells whose target height moved by more than tolerance, or whose water flag flipped"""
+    old_h = np.asarray(old.height, dtype=np.float32)
+    new_h = np.asarray(height, dtype=np.float32)
+    dirty = ~(np.abs(new_h - old_h) <= tolerance)  # NaN on either side counts as changed
+    if (old.water_mask is None) != (water_mask is None):
+        dirty |= np.asarray(old.water_mask if water_mask is None else water_mask, dtype=bool)
+    elif water_mask is not None:
+        dirty |= np.asarray(old.water_mask, dtype=bool) != np.asarray(water_mask, dtype=bool)
+    return dirty
+
+
+def dirty_regions(dirty: np.ndarray, block: int = DIRTY_BLOCK,
+                  plot_min: float = PLOT_MIN, plot_max: float = PLOT_MAX) -> List[Rect]:
+    """
+    Plot rectangles (min_x, min_z, max_x, max_z) covering the dirty cells.
+
+    Cells are reduced to block x block tiles, and horizontal runs of dirty
+    tiles become one rectangle. Each rectangle is widened by one cell, since a
+    bilinear sample reads the neighbouring cells.
+    """
+    rows, cols = dirty.shape
+    br, bc = -(-rows // block), -(-cols // block)
+    padded = np.zeros((br * block, bc * block), dtype=bool)
+    padded[:rows, :cols] = dirty
+    tiles = padded.reshape(br, block, bc, block).any(axis=(1, 3))
+
+    step_x = (plot_max - plot_min) / max(cols - 1, 1)
+    step_z = (plot_max - plot_min) / max(rows - 1, 1)
+    regions = []
+    for r in np.flatnonzero(tiles.any(axis=1)):
+        run = np.diff(np.r_[0, tiles[r].astype(np.int8), 0])
+        for c0, c1 in zip(np.flatnonzero(run == 1), np.flatnonzero(run == -1)):
+            regions.append((
+                plot_min + (c0 * block - 1) * step_x,
+                plot_min + (r * block - 1) * step_z,
+                plot_min + min(c1 * block, cols) * step_x,
+                plot_min + min((r + 1) * block, rows) * step_z,
+            ))
+    return regions
+
+
+def _touching(index: StrokeIndex, regions: List[Rect]) -> np.ndarray:
+    if not regions:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate([index.overlapping_bbox(*rect) for rect in regions]))
+
+
+def splice_stamps(layer: BrushLayer, stamps: BrushLayer, regions: List[Rect]) -> RestampReport:
+    """
+    Bring layer in line with stamps inside regions, in place.
+
+    Strokes of layer whose footprint touches a region are matched (by
+    position) against the stamps touching a region: changed ones are
+    overwritten in their slot, unmatched old ones removed, new ones appended.
+    Everything else in layer, hand edits included, is left as it is.
+    """
+    report = RestampReport(regions=list(regions))
+    old_index = StrokeIndex(layer)
+    old_pos = _touching(old_index, regions)
+    new_pos = _touching(StrokeIndex(stamps), regions)
+
+    diff = diff_layers(BrushLayer(layer.data[old_pos].copy()), BrushLayer(stamps.data[new_pos].copy()))
+    if len(diff.modified):
+        layer.data[old_pos[diff.modified[:, 0]]] = stamps.data[new_pos[diff.modified[:, 1]]]
+    old_index.remove(old_pos[diff.removed])
+    old_index.add(np.ascontiguousarray(stamps.data[new_pos[diff.added]], dtype=BRUSH_DTYPE))
+
+    report.replaced = len(diff.modified)
+    report.added = len(diff.added)
+    report.removed = len(diff.removed)
+    report.kept = len(layer) - report.replaced - report.added
+    return report
@@ -0,0 +1,225 @@
+"""
+CourseForge - Spatial Index Module
+Grid-hash index over brush stroke centres and footprints for radius, box, k-nearest and overlap queries
+"""
+import math
+from typing import Optional, Union
+
+import numpy as np
+
+from src.brush_sim import RADIUS_PER_SCALE
+from src.course_file import BRUSH_DTYPE, BrushLayer
+
+
+# Cell coordinates are offset into [0, 2**21) and packed as row << 21 | col.
+_CELL_BITS = 21
+_CELL_OFFSET = 1 << (_CELL_BITS - 1)
+
+# Appended strokes are scanned linearly until there are this many (or n/8), then merged in.
+MIN_PENDING_MERGE = 1024
+
+
+def footprint_radius(data: np.ndarray) -> np.ndarray:
+    """Radius (meters) of each stroke's footprint; scale.x/z is the diameter, as in brush_sim"""
+    return np.maximum(np.abs(data["scale_x"]), np.abs(data["scale_z"])) * RADIUS_PER_SCALE
+
+
+class StrokeIndex:
+    """
+    Uniform grid hash over the (x, z) centres of one BrushLayer.
+
+    Cells are kept as a sorted key array plus the stroke positions in that
+    order, so a query is a few searchsorted calls per cell row followed by an
+    exact distance test on the candidates. Footprint queries widen the search
+    by the largest footprint radius. Results are positions into the layer,
+    ascending (nearest() returns them by distance).
+
+    Changes made through add() / remove() / moved() update the index
+    incrementally: appended strokes sit in a small pending list that every
+    query also checks until it is merged into the sorted arrays, and
+    removals drop and renumber entries without rehashing. For edits made to
+    the layer directly, call refresh() (picks up appended rows) or rebuild().
+    """
+
+    def __init__(self, layer: BrushLayer, cell_size: Optional[float] = None):
+        self.layer = layer
+        self.cell_size = cell_size or self._default_cell_size(layer)
+        self.rebuild()
+
+    @staticmethod
+    def _default_cell_size(layer: BrushLayer) -> float:
+        """About four strokes per occupied cell, never below 1 m"""
+        d = layer.data
+        if len(d) < 2:
+            return 64.0
+        extent = max(float(np.ptp(d["pos_x"])), float(np.ptp(d["pos_z"])), 1.0)
+        return max(extent / math.sqrt(len(d) / 4.0), 1.0)
+
+    # ---- maintenance ----
+
+    def _keys(self, positions: np.ndarray) -> np.ndarray:
+        d = self.layer.data
+        lim = _CELL_OFFSET - 1
+        cx = np.clip(np.floor(np.nan_to_num(d["pos_x"][positions]) / self.cell_size), -lim, lim).astype(np.int64)
+        cz = np.clip(np.floor(np.nan_to_num(d["pos_z"][positions]) / self.cell_size), -lim, lim).astype(np.int64)
+        return ((cz + _CELL_OFFSET) << _CELL_BITS) | (cx + _CELL_OFFSET)
+
+    def rebuild(self):
+        """Re-hash every stroke of the layer"""
+        n = len(self.layer)
+        positions = np.arange(n, dtype=np.int64)
+        keys = self._keys(positions)
+        order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[order]
+        self._order = positions[order]
+        self._pending = np.zeros(0, dtype=np.int64)
+        self._indexed = n
+        self.max_radius = float(footprint_radius(self.layer.data).max()) if n else 0.0
+
+    def refresh(self):
+        """Pick up strokes appended to the layer behind the index's back (rebuild if it shrank)"""
+        n = len(self.layer)
+        if n < self._indexed:
+            self.rebuild()
+        elif n > self._indexed:
+            self._track(np.arange(self._indexed, n, dtype=np.int64))
+            self._indexed = n
+
+    def _track(self, positions: np.ndarray):
+        if len(positions):
+            self.max_radius = max(self.max_radius, float(footprint_radius(self.layer.data[positions]).max()))
+        self._pending = np.concatenate([self._pending, positions])
+        if len(self._pending) > max(MIN_PENDING_MERGE, len(self._order) // 8):
+            self._merge_pending()
+
+    def _merge_pending(self):
+        positions = np.sort(self._pending)
+        keys = self._keys(positions)
+        order = np.argsort(keys, kind="stable")
+        at = np.searchsorted(self._sorted_keys, keys[order], side="right")
+        self._sorted_keys = np.insert(self._sorted_keys, at, keys[order])
+        self._order = np.insert(self._order, at, positions[order])
+        self._pending = np.zeros(0, dtype=np.int64)
+
+    def add(self, strokes: Union[BrushLayer, np.ndarray]) -> np.ndarray:
+        """Append strokes to the layer and the index; returns their positions"""
+        start = len(self.layer)
+        self.layer.append(strokes)
+        positions = np.arange(start, len(self.layer), dtype=np.int64)
+        self._indexed = len(self.layer)
+        self._track(positions)
+        return positions
+
+    def remove(self, positions: np.ndarray):
+        """Remove strokes (positions or a boolean mask) from the layer and the index; later positions shift down"""
+        positions = np.asarray(positions)
+        if positions.dtype == bool:
+            positions = np.flatnonzero(positions)
+        positions = np.unique(positions.astype(np.int64))
+        if not len(positions):
+            return
+        mask = np.zeros(len(self.layer), dtype=bool)
+        mask[positions] = True
+        self.layer.remove(mask)
+
+        keep = ~mask[self._order]
+        self._sorted_keys = self._sorted_keys[keep]
+        self._order = self._order[keep]
+        self._pending = self._pending[~mask[self._pending]]
+        # Renumber: every survivor moves down by the removed positions before it.
+        self._order -= np.searchsorted(positions, self._order)
+        self._pending -= np.searchsorted(positions, self._pending)
+        self._indexed = len(self.layer)
+
+    def moved(self, positions: np.ndarray):
+        """Re-hash strokes whose position/scale was edited in place"""
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        keep = ~np.isin(self._order, positions)
+        self._sorted_keys = self._sorted_keys[keep]
+        self._order = self._order[keep]
+        self._pending = self._pending[~np.isin(self._pending, positions)]
+        self._track(positions)
+
+    # ---- queries ----
+
+    def _candidates(self, min_x: float, min_z: float, max_x: float, max_z: float) -> np.ndarray:
+        """Positions of strokes whose centre cell touches the box (a superset), plus pending strokes"""
+        cs = self.cell_size
+        lim = _CELL_OFFSET - 1
+        cx0, cx1 = (int(np.clip(math.floor(v / cs), -lim, lim)) for v in (min_x, max_x))
+        cz0, cz1 = (int(np.clip(math.floor(v / cs), -lim, lim)) for v in (min_z, max_z))
+        if cx1 < cx0 or cz1 < cz0:
+            return self._pending
+        rows = np.arange(cz0, cz1 + 1, dtype=np.int64) + _CELL_OFFSET
+        lo = (rows << _CELL_BITS) | (cx0 + _CELL_OFFSET)
+        hi = (rows << _CELL_BITS) | (cx1 + _CELL_OFFSET)
+        starts = np.searchsorted(self._sorted_keys, lo, side="left")
+        ends = np.searchsorted(self._sorted_keys, hi, side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return self._pending
+        # Concatenated ranges [starts[i], ends[i]) without a Python loop.
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        found = self._order[np.arange(total) + offsets]
+        return np.concatenate([found, self._pending]) if len(self._pending) else found
+
+    def bbox(self, min_x: float, min_z: float, max_x: float, max_z: float) -> np.ndarray:
+        """Strokes whose centre lies inside the rectangle (inclusive, like BrushLayer.in_rect)"""
+        cand = self._candidates(min_x, min_z, max_x, max_z)
+        d = self.layer.data
+        x, z = d["pos_x"][cand], d["pos_z"][cand]
+        return np.sort(cand[(x >= min_x) & (x <= max_x) & (z >= min_z) & (z <= max_z)])
+
+    def radius(self, x: float, z: float, r: float) -> np.ndarray:
+        """Strokes whose centre is within r of (x, z)"""
+        cand = self._candidates(x - r, z - r, x + r, z + r)
+        d = self.layer.data
+        dist2 = (d["pos_x"][cand] - x) ** 2 + (d["pos_z"][cand] - z) ** 2
+        return np.sort(cand[dist2 <= r * r])
+
+    def nearest(self, x: float, z: float, k: int = 1) -> np.ndarray:
+        """The k strokes with centres nearest (x, z), nearest first"""
+        n = len(self.layer)
+        k = min(k, n)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        d = self.layer.data
+        r = self.cell_size
+        while True:
+            cand = self._candidates(x - r, z - r, x + r, z + r)
+            dist2 = (d["pos_x"][cand] - x) ** 2 + (d["pos_z"][cand] - z) ** 2
+            inside = dist2 <= r * r
+            # k hits inside the circle are the true k nearest; everything else is farther.
+            if inside.sum() >= k or len(cand) >= n:
+                cand, dist2 = (cand[inside], dist2[inside]) if inside.sum() >= k else (cand, dist2)
+                best = np.argsort(dist2, kind="stable")[:k]
+                return cand[best]
+            r *= 2.0
+
+    def overlapping(self, x: float, z: float, r: float = 0.0) -> np.ndarray:
+        """Strokes whose footprint overlaps the circle (x, z, r); r=0 = stamps that affect the point"""
+        reach = r + self.max_radius
+        cand = self._candidates(x - reach, z - reach, x + reach, z + reach)
+        d = self.layer.data
+        dist2 = (d["pos_x"][cand] - x) ** 2 + (d["pos_z"][cand] - z) ** 2
+        limit = footprint_radius(d[cand]) + r
+        return np.sort(cand[dist2 <= limit * limit])
+
+    def overlapping_bbox(self, min_x: float, min_z: float, max_x: float, max_z: float) -> np.ndarray:
+        """Strokes whose footprint overlaps the rectangle (e.g. a hole's extent)"""
+        reach = self.max_radius
+        cand = self._candidates(min_x - reach, min_z - reach, max_x + reach, max_z + reach)
+        d = self.layer.data
+        x, z = d["pos_x"][cand], d["pos_z"][cand]
+        dx = np.maximum(np.maximum(min_x - x, x - max_x), 0.0)
+        dz = np.maximum(np.maximum(min_z - z, z - max_z), 0.0)
+        limit = footprint_radius(d[cand])
+        return np.sort(cand[dx * dx + dz * dz <= limit * limit])
+
+
+def build_index(strokes: Union[BrushLayer, np.ndarray], cell_size: Optional[float] = None) -> StrokeIndex:
+    """Index a BrushLayer (or a BRUSH_DTYPE array, wrapped in a new layer)"""
+    if not isinstance(strokes, BrushLayer):
+        strokes = BrushLayer(np.asarray(strokes, dtype=BRUSH_DTYPE))
+    return StrokeIndex(strokes, cell_size)
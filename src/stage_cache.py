@@ -0,0 +1,171 @@
+"""
+CourseForge - Stage Cache Module
+Memoizes named pipeline stages as memory-mapped .npy outputs keyed by inputs and parameters
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Bump when the on-disk layout changes so old entries are never reused.
+STAGE_FORMAT = 1
+
+DEFAULT_MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+
+StageOutput = Tuple[Dict[str, np.ndarray], Dict[str, Any]]
+
+
+@dataclass
+class StageResult:
+    """Output of one stage: named arrays (memory-mapped when cached), JSON metadata and timing"""
+    name: str
+    key: str
+    arrays: Dict[str, np.ndarray] = field(default_factory=dict)
+    meta: Dict[str, Any] = field(default_factory=dict)
+    cached: bool = False
+    seconds: float = 0.0
+
+
+def _json_default(value):
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def stage_key(name: str, params: Dict[str, Any], inputs: Sequence[StageResult] = (),
+              fn: Optional[Callable] = None, deps: Sequence[Any] = ()) -> str:
+    """
+    sha256 over the stage name, its parameters, the keys of its inputs and
+    (when given) the source of the stage function plus deps (helper
+    functions or whole modules it calls), so editing a stage body or a
+    helper invalidates it just like changing a knob.
+    """
+    h = hashlib.sha256(f"courseforge-stage-v{STAGE_FORMAT}:{name}\n".encode())
+    h.update(json.dumps(params, sort_keys=True, default=_json_default).encode())
+    for result in inputs:
+        h.update(f"\n{result.name}={result.key}".encode())
+    for obj in ([fn] if fn is not None else []) + list(deps):
+        obj = getattr(obj, "func", obj)  # functools.partial: key on the wrapped function
+        try:
+            h.update(inspect.getsource(obj).encode())
+        except (OSError, TypeError):
+            h.update(getattr(obj, "__qualname__", repr(obj)).encode())
+    return h.hexdigest()
+
+
+class StageCache:
+    """
+    On-disk store of stage outputs under root/<stage>/<key>/.
+
+    Each entry holds one .npy per output array plus meta.json. Hits are
+    opened with mmap_mode="c" (copy-on-write), so downstream code can modify
+    them in place without touching the cache. Entries are LRU-evicted by
+    directory mtime (touched on every hit) to stay within max_disk_bytes.
+    """
+
+    def __init__(self, root: Path, max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES, enabled: bool = True):
+        self.root = Path(root)
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+
+    def _entry(self, name: str, key: str) -> Path:
+        return self.root / name / key
+
+    def run(self, name: str, params: Dict[str, Any], fn: Callable[..., StageOutput],
+            inputs: Sequence[StageResult] = (), persist: bool = True, deps: Sequence[Any] = ()) -> StageResult:
+        """
+        Return the cached output of stage name, or compute fn(*inputs) and store it.
+
+        fn returns (arrays, meta); meta must be JSON serializable. A freshly
+        stored output is handed back as its cache maps, like a hit, so callers
+        never keep fn's own scratch files (e.g. tile memmaps) open. With
+        persist=False (stages with side effects, e.g. writing the course) the
+        stage always runs and only its timing is recorded.
+        """
+        t0 = time.perf_counter()
+        key = stage_key(name, params, inputs, fn, deps)
+        if self.enabled and persist:
+            hit = self._read(name, key)
+            if hit is not None:
+                arrays, meta = hit
+                return StageResult(name, key, arrays, meta, True, time.perf_counter() - t0)
+
+        arrays, meta = fn(*inputs)
+        if self.enabled and persist:
+            self._write(name, key, arrays, meta)
+            stored = self._read(name, key)
+            if stored is not None:
+                arrays = stored[0]
+        return StageResult(name, key, arrays, meta, False, time.perf_counter() - t0)
+
+    def _read(self, name: str, key: str) -> Optional[StageOutput]:
+        entry = self._entry(name, key)
+        meta_path = entry / "meta.json"
+        if not meta_path.exists():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text())
+            arrays = {
+                array_name: np.load(entry / f"{array_name}.npy", mmap_mode="c")
+                for array_name in meta.pop("__arrays__")
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(entry)  # LRU: mtime is the last use
+        except OSError:
+            pass
+        return arrays, meta
+
+    def _write(self, name: str, key: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        stage_dir = self.root / name
+        stage_dir.mkdir(parents=True, exist_ok=True)
+        # Build the entry in a temp dir and rename it into place, so readers never see half an entry.
+        tmp = Path(tempfile.mkdtemp(dir=stage_dir, prefix=".tmp-"))
+        try:
+            for array_name, array in arrays.items():
+                np.save(tmp / f"{array_name}.npy", np.ascontiguousarray(array), allow_pickle=False)
+            stored = dict(meta, __arrays__=sorted(arrays))
+            (tmp / "meta.json").write_text(json.dumps(stored, indent=1, default=_json_default))
+            try:
+                os.replace(tmp, self._entry(name, key))
+            except OSError:
+                # Another process stored the same key first; its entry is identical.
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self._evict(keep=self._entry(name, key))
+
+    def _evict(self, keep: Optional[Path] = None):
+        """Drop least recently used entries until the cache fits max_disk_bytes"""
+        entries = []
+        total = 0
+        for entry in self.root.glob("*/*"):
+            if not entry.is_dir() or entry.name.startswith(".tmp-"):
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+            total += size
+            if entry != keep:
+                entries.append((entry.stat().st_mtime, size, entry))
+        for _, size, entry in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self, name: Optional[str] = None):
+        """Remove every entry, or only those of one stage"""
+        target = self.root / name if name else self.root
+        shutil.rmtree(target, ignore_errors=True)
@@ -0,0 +1,206 @@
+"""
+CourseForge - Stamp Solver Module
+Solves stamp amplitudes by bounded least squares against a target height field
+"""
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import lsmr
+
+from src.brush_sim import (
+    DELTA_TOOL,
+    RADIUS_PER_SCALE,
+    SOFT_CIRCLE_HARDNESS,
+    SOFT_CIRCLE_TYPE,
+    SimGrid,
+    sample_target,
+    soft_circle_profile,
+)
+from src.course_file import BrushLayer
+
+
+# Upper bound on operator non-zeros; the solver grid is coarsened until it fits.
+DEFAULT_NNZ_BUDGET = 6_000_000
+
+# Finest solver grid considered (meters per cell).
+MIN_SOLVER_RESOLUTION = 2.0
+
+# Stamps per block when assembling the operator (bounds temporary memory).
+ASSEMBLY_BLOCK = 2048
+
+# Active-set passes; each is one LSMR solve over the stamps not pinned at a bound.
+MAX_OUTER_ITERATIONS = 20
+
+
+@dataclass
+class SolveReport:
+    """Fit quality of a solve, in meters on the solver grid"""
+    stamps: int
+    cells: int
+    resolution: float
+    nnz: int
+    passes: int
+    iterations: int
+    rms_before: float
+    rms_after: float
+    max_abs_after: float
+    at_bound: int
+    seconds: float
+
+    def summary(self) -> str:
+        return (
+            f"{self.stamps} stamps x {self.cells} cells @ {self.resolution:.1f} m (nnz {self.nnz:,}); "
+            f"RMS {self.rms_before:.3f} -> {self.rms_after:.3f} m, max |r| {self.max_abs_after:.3f} m, "
+            f"{self.at_bound} at bound, {self.passes} passes / {self.iterations} LSMR it, {self.seconds:.1f} s"
+        )
+
+
+def solver_grid(layer: BrushLayer, nnz_budget: int = DEFAULT_NNZ_BUDGET,
+                min_resolution: float = MIN_SOLVER_RESOLUTION) -> SimGrid:
+    """Finest SimGrid whose expected operator size stays within nnz_budget"""
+    d = layer.data
+    footprint = float(np.sum(math.pi * (d["scale_x"] * RADIUS_PER_SCALE) * (d["scale_z"] * RADIUS_PER_SCALE)))
+    res = math.sqrt(footprint / max(nnz_budget, 1)) if footprint > 0 else min_resolution
+    return SimGrid(resolution=max(min_resolution, res))
+
+
+def build_operator(layer: BrushLayer, grid: SimGrid,
+                   hardness: float = SOFT_CIRCLE_HARDNESS) -> sparse.csr_matrix:
+    """
+    Sparse (cells x stamps) matrix of unit-value stamp footprints on grid.
+
+    Column j holds the soft-circle weight of stamp j at every cell centre it
+    covers, evaluated at the exact (sub-cell) stamp position, so A @ values is
+    the simulated height field flattened row-major.
+    """
+    d = layer.data
+    n = grid.size
+    rows_all, cols_all, vals_all = [], [], []
+
+    keys = np.stack([d["scale_x"], d["scale_z"]], axis=1)
+    footprints, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    for i, (scale_x, scale_z) in enumerate(footprints.tolist()):
+        rx = max(scale_x * RADIUS_PER_SCALE / grid.resolution, 1e-6)
+        rz = max(scale_z * RADIUS_PER_SCALE / grid.resolution, 1e-6)
+        kx, kz = int(math.ceil(rx)), int(math.ceil(rz))
+        dz, dx = np.mgrid[-kz:kz + 2, -kx:kx + 2]
+        dz, dx = dz.ravel(), dx.ravel()
+
+        idx = np.flatnonzero(inverse == i)
+        for start in range(0, len(idx), ASSEMBLY_BLOCK):
+            block = idx[start:start + ASSEMBLY_BLOCK]
+            fc = (d["pos_x"][block] - grid.plot_min) / grid.resolution
+            fr = (d["pos_z"][block] - grid.plot_min) / grid.resolution
+            c = np.floor(fc).astype(np.int64)[:, None] + dx[None, :]
+            r = np.floor(fr).astype(np.int64)[:, None] + dz[None, :]
+            t = np.sqrt(((c - fc[:, None]) / rx) ** 2 + ((r - fr[:, None]) / rz) ** 2)
+            w = soft_circle_profile(t, hardness)
+            ok = (w > 0.0) & (r >= 0) & (r < n) & (c >= 0) & (c < n)
+            rows_all.append((r * n + c)[ok])
+            cols_all.append(np.broadcast_to(block[:, None], ok.shape)[ok])
+            vals_all.append(w[ok])
+
+    rows = np.concatenate(rows_all) if rows_all else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols_all) if cols_all else np.zeros(0, dtype=np.int64)
+    vals = np.concatenate(vals_all) if vals_all else np.zeros(0)
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(n * n, len(d)))
+
+
+def solve_stamp_values(
+    layer: BrushLayer,
+    target: np.ndarray,
+    max_abs: float,
+    warm_start: Optional[np.ndarray] = None,
+    grid: Optional[SimGrid] = None,
+    nnz_budget: int = DEFAULT_NNZ_BUDGET,
+    hardness: float = SOFT_CIRCLE_HARDNESS,
+    max_outer: int = MAX_OUTER_ITERATIONS,
+    tol: float = 1e-6,
+    rtol: float = 1e-4,
+):
+    """
+    Stamp values in [-max_abs, max_abs] whose summed footprints best match target.
+
+    Bounds are handled with an active set: stamps at a bound whose gradient
+    pushes outward are pinned, the rest are re-solved with LSMR and clipped,
+    until the set settles and the RMS stops improving by more than rtol. A
+    warm start with the right stamps already saturated converges in a pass
+    or two.
+
+    Args:
+        layer: Stamp positions/scales; existing values are ignored unless used
+            as the warm start
+        target: Height field in meters, stretched over the plot like height_grid
+        max_abs: Per-stamp amplitude bound (MAX_STAMP_ABS)
+        warm_start: Initial values (e.g. auto-gain stamps or a previous solve);
+            None starts from layer's current values
+        grid: Solver raster; None picks the finest grid within nnz_budget
+
+    Returns:
+        (values, SolveReport)
+    """
+    t0 = time.perf_counter()
+    d = layer.data
+    if len(d) == 0:
+        raise ValueError("No stamps to solve")
+    usable = np.isin(d["tool"], (DELTA_TOOL,)) & np.isin(d["type"], (SOFT_CIRCLE_TYPE,))
+    if not np.all(usable):
+        raise ValueError(f"Solver models tool {DELTA_TOOL}/type {SOFT_CIRCLE_TYPE} stamps only")
+
+    if grid is None:
+        grid = solver_grid(layer, nnz_budget)
+    A = build_operator(layer, grid, hardness).tocsc()
+    b = sample_target(target, grid).ravel()
+    # Column scaling: footprints of mixed sizes differ in norm by orders of magnitude,
+    # which stalls LSMR; solving in unit-norm columns keeps iteration counts flat.
+    col_norm = np.sqrt(np.asarray(A.multiply(A).sum(axis=0)).ravel())
+    col_norm[col_norm == 0.0] = 1.0
+    A_unit = (A @ sparse.diags(1.0 / col_norm)).tocsc()
+
+    x = d["value"].copy() if warm_start is None else np.asarray(warm_start, dtype=np.float64).copy()
+    x = np.clip(x, -max_abs, max_abs)
+    r = b - A @ x
+    rms_before = rms = float(np.sqrt(np.mean(r ** 2)))
+
+    pinned = None
+    passes = iterations = 0
+    for passes in range(1, max_outer + 1):
+        g = A.T @ r
+        new_pinned = ((x >= max_abs) & (g > 0)) | ((x <= -max_abs) & (g < 0))
+        free = ~new_pinned
+        if not np.any(free):
+            break
+        step, _, it = lsmr(A_unit[:, free], r, atol=tol, btol=tol)[:3]
+        iterations += int(it)
+        proposed = x[free] + step / col_norm[free]
+        clipped = bool(np.any(np.abs(proposed) > max_abs))
+        x[free] = np.clip(proposed, -max_abs, max_abs)
+        r = b - A @ x
+
+        prev_rms, rms = rms, float(np.sqrt(np.mean(r ** 2)))
+        settled = pinned is not None and np.array_equal(new_pinned, pinned)
+        pinned = new_pinned
+        # An unclipped step is already the LSMR optimum over the free stamps.
+        if not clipped or (settled and prev_rms - rms <= rtol * max(prev_rms, 1e-12)):
+            break
+
+    report = SolveReport(
+        stamps=len(d),
+        cells=A.shape[0],
+        resolution=grid.resolution,
+        nnz=A.nnz,
+        passes=passes,
+        iterations=iterations,
+        rms_before=rms_before,
+        rms_after=rms,
+        max_abs_after=float(np.max(np.abs(r))),
+        at_bound=int(np.count_nonzero(np.abs(x) >= max_abs)),
+        seconds=time.perf_counter() - t0,
+    )
+    return x, report
@@ -0,0 +1,85 @@
+"""
+CourseForge - Stamp Generation Module
+Builds landscaping brush stamps from a height grid with array operations
+"""
+from typing import Sequence, Tuple
+
+import numpy as np
+from scipy.ndimage import map_coordinates
+
+
+# Plot extent in meters; matches config.COURSE_MIN_COORD / COURSE_MAX_COORD.
+PLOT_MIN = -1000.0
+PLOT_MAX = 1000.0
+
+
+def lattice(spacing: float, offset: Tuple[float, float] = (0.0, 0.0),
+            plot_min: float = PLOT_MIN, plot_max: float = PLOT_MAX) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stamp centres every `spacing` meters from plot_min + offset up to plot_max inclusive.
+
+    Returned flat in x-major order (x outer, z inner), the same order as the
+    original nested while loops.
+    """
+    def _axis(start):
+        n = int(np.floor((plot_max - start) / spacing + 1e-9)) + 1
+        return start + np.arange(max(n, 0)) * spacing
+
+    xs, zs = np.meshgrid(_axis(plot_min + offset[0]), _axis(plot_min + offset[1]), indexing="ij")
+    return xs.ravel(), zs.ravel()
+
+
+def plot_to_grid(x: np.ndarray, z: np.ndarray, shape: Tuple[int, int],
+                 plot_min: float = PLOT_MIN, plot_max: float = PLOT_MAX) -> Tuple[np.ndarray, np.ndarray]:
+    """Map plot coords to fractional (row, col) grid coords; grid is [row=z][col=x]"""
+    rows, cols = shape
+    span = plot_max - plot_min
+    return (z - plot_min) / span * (rows - 1), (x - plot_min) / span * (cols - 1)
+
+
+def sample_bilinear(grid: np.ndarray, x: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """Bilinear height at plot coords, clamped to the grid edges"""
+    rows, cols = plot_to_grid(x, z, grid.shape)
+    # Interpolate in float64 like the scalar sampler did; map_coordinates keeps the input dtype.
+    return map_coordinates(np.asarray(grid, dtype=np.float64), [rows, cols], order=1, mode="nearest")
+
+
+def sample_mask(mask: np.ndarray, x: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """Boolean mask value of the cell each plot coord truncates into"""
+    rows, cols = plot_to_grid(x, z, mask.shape)
+    r = np.clip(rows.astype(np.int64), 0, mask.shape[0] - 1)
+    c = np.clip(cols.astype(np.int64), 0, mask.shape[1] - 1)
+    return mask[r, c]
+
+
+def shape_relief(h: np.ndarray, gamma: float, positive_boost: float, negative_scale: float) -> np.ndarray:
+    """
+    Nonlinear contrast: make subtle land relief more visible while keeping lows restrained.
+    """
+    shaped = np.abs(h) ** gamma
+    return np.where(h >= 0.0, shaped * positive_boost, -shaped * negative_scale)
+
+
+def percentile_auto_gain(h: np.ndarray, percentile: float, target: float) -> Tuple[float, float]:
+    """(gain, |h| at percentile) so that the percentile amplitude maps to target"""
+    pctl_abs = float(np.percentile(np.abs(h), percentile))
+    return target / max(pctl_abs, 1e-6), pctl_abs
+
+
+def stamp_values(shaped: np.ndarray, gain: float, overlap_gain: float,
+                 max_abs: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(clipped stamp values, mask of stamps that hit the +/- max_abs clamp)"""
+    raw = (shaped * gain) / overlap_gain
+    return np.clip(raw, -max_abs, max_abs), np.abs(raw) > max_abs
+
+
+def mask_lattice(mask: np.ndarray, spacing: float,
+                 offsets: Sequence[Tuple[float, float]] = ((0.0, 0.0),)) -> Tuple[np.ndarray, np.ndarray]:
+    """Lattice points (one lattice per offset, concatenated) that land inside mask"""
+    xs_all, zs_all = [], []
+    for offset in offsets:
+        xs, zs = lattice(spacing, offset)
+        hit = sample_mask(mask, xs, zs)
+        xs_all.append(xs[hit])
+        zs_all.append(zs[hit])
+    return np.concatenate(xs_all), np.concatenate(zs_all)
@@ -0,0 +1,179 @@
+"""
+CourseForge - Sweep Module
+Runs many knob variants of the pipeline, sharing upstream stages and fanning out the rest
+"""
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from src.pipeline import STAGES, PipelineConfig, pipeline_diagnostics, run_pipeline
+
+
+@dataclass
+class SweepVariant:
+    """One configuration of a sweep and where its course goes"""
+    index: int
+    knobs: Dict[str, Any]
+    config: PipelineConfig
+    output_file: Path
+
+
+@dataclass
+class SweepResult:
+    """Diagnostics of one finished variant (error is set instead if it failed)"""
+    index: int
+    knobs: Dict[str, Any]
+    output_file: Path
+    seconds: float
+    diagnostics: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def expand_grid(grid: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """Cartesian product of knob values: {"A": [1, 2], "B": [3]} -> [{A:1,B:3}, {A:2,B:3}]"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def shared_stage(configs: Sequence[PipelineConfig]) -> Optional[str]:
+    """Last stage whose knobs (and all upstream knobs) are identical across configs"""
+    effective = [c.effective() for c in configs]
+    last = None
+    for stage in STAGES:
+        params = [c.stage_params(stage) for c in effective]
+        if any(p != params[0] for p in params[1:]):
+            break
+        last = stage
+    return last
+
+
+def plan_sweep(base: PipelineConfig, variants: Union[Dict[str, Sequence[Any]], Sequence[Dict[str, Any]]],
+               out_dir: Path, prefix: str = "sweep") -> List[SweepVariant]:
+    """
+    Resolve a grid ({knob: values}) or a list of knob dicts into numbered variants.
+
+    Each variant writes <out_dir>/<prefix>_<NNN>.course and gets the number in
+    its in-game name, so the variants can be told apart in the course list.
+    """
+    if isinstance(variants, dict):
+        variants = expand_grid(variants)
+    planned = []
+    for i, knobs in enumerate(variants, start=1):
+        config = base.with_knobs(knobs)
+        config = config.replace(course_name=f"{config.course_name} #{i:03d}")
+        planned.append(SweepVariant(i, dict(knobs), config, Path(out_dir) / f"{prefix}_{i:03d}.course"))
+    return planned
+
+
+def _run_variant(job) -> SweepResult:
+    """Process-pool entry point: one full pipeline run, upstream stages served from the cache"""
+    variant, laz_files, template_file, cache_dir = job
+    t0 = time.perf_counter()
+    try:
+        results = run_pipeline(
+            variant.config, laz_files, template_file, variant.output_file,
+            cache_dir=cache_dir, log=lambda line: None,
+        )
+    except Exception as exc:  # one bad variant should not sink the sweep
+        return SweepResult(variant.index, variant.knobs, variant.output_file,
+                           time.perf_counter() - t0, error=f"{type(exc).__name__}: {exc}")
+    error = None if "write" in results else "no stamps created"
+    return SweepResult(variant.index, variant.knobs, variant.output_file, time.perf_counter() - t0,
+                       pipeline_diagnostics(results), error)
+
+
+def write_sweep_csv(results: Sequence[SweepResult], path: Path):
+    """One row per variant: index, file, swept knobs, seconds, error, then every diagnostic"""
+    knob_cols: List[str] = []
+    diag_cols: List[str] = []
+    for r in results:
+        knob_cols += [k for k in r.knobs if k not in knob_cols]
+        diag_cols += [k for k in r.diagnostics if k not in diag_cols]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["variant", "file"] + knob_cols + ["seconds", "error"] + diag_cols)
+        for r in sorted(results, key=lambda r: r.index):
+            writer.writerow(
+                [r.index, r.output_file.name]
+                + [r.knobs.get(k, "") for k in knob_cols]
+                + [f"{r.seconds:.3f}", r.error or ""]
+                + ["" if r.diagnostics.get(k) is None else r.diagnostics[k] for k in diag_cols]
+            )
+
+
+def run_sweep(
+    base: PipelineConfig,
+    variants: Union[Dict[str, Sequence[Any]], Sequence[Dict[str, Any]]],
+    laz_files: Sequence[Path],
+    template_file: Path,
+    out_dir: Path,
+    cache_dir: Optional[Path] = None,
+    workers: Optional[int] = None,
+    prefix: str = "sweep",
+    log=print,
+) -> List[SweepResult]:
+    """
+    Generate one course per variant plus <out_dir>/<prefix>.csv of their diagnostics.
+
+    The stages every variant agrees on are computed once in this process and
+    land in the stage cache; the variants then run in a process pool where
+    those stages are memory-mapped cache hits, so only the differing
+    downstream stages (typically shaping, stamping and save) are paid per
+    variant.
+    """
+    out_dir = Path(out_dir)
+    cache_dir = Path(cache_dir) if cache_dir is not None else out_dir.parent / "cache"
+    # The cache is what carries the shared stages into the workers.
+    base = base.replace(stage_cache=True, simulate_preview=False, dump_template_json=False)
+    planned = plan_sweep(base, variants, out_dir, prefix)
+    if not planned:
+        raise ValueError("Sweep has no variants")
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    t0 = time.perf_counter()
+    shared = shared_stage([v.config for v in planned])
+    if shared is not None:
+        upto = STAGES[min(STAGES.index(shared), STAGES.index("stamp"))]
+        log(f"Sweep: {len(planned)} variants; computing shared stages up to '{upto}' once")
+        run_pipeline(planned[0].config.replace(write_metrics=False), laz_files, template_file, planned[0].output_file,
+                     cache_dir=cache_dir, upto=upto, log=lambda line: None)
+    else:
+        log(f"Sweep: {len(planned)} variants; no stage is shared")
+
+    jobs = [(v, [Path(f) for f in laz_files], Path(template_file), cache_dir) for v in planned]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+    results: List[SweepResult] = []
+    if workers == 1:
+        for job in jobs:
+            results.append(_run_variant(job))
+            _log_variant(results[-1], len(jobs), log)
+    else:
+        # spawn, not fork: lazrs keeps a native thread pool that does not survive fork.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            for result in pool.map(_run_variant, jobs):
+                results.append(result)
+                _log_variant(result, len(jobs), log)
+
+    csv_path = out_dir / f"{prefix}.csv"
+    write_sweep_csv(results, csv_path)
+    failed = sum(1 for r in results if r.error)
+    log(f"Sweep done: {len(results) - failed}/{len(results)} courses in {time.perf_counter() - t0:.1f} s")
+    log(f"Diagnostics: {csv_path}")
+    return results
+
+
+def _log_variant(result: SweepResult, total: int, log):
+    knobs = ", ".join(f"{k}={v}" for k, v in result.knobs.items())
+    status = f"ERROR {result.error}" if result.error else result.output_file.name
+    log(f"  [{result.index:03d}/{total:03d}] {knobs}: {status} ({result.seconds:.2f} s)")
+
@@ -0,0 +1,176 @@
+"""
+CourseForge - Template Cache Module
+Content-addressed cache of decoded .course templates (memory + on-disk pickles)
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.course_file import CourseFile, GameVersion
+
+
+# Bump when the decoded form changes so stale pickles are never reused.
+CACHE_FORMAT = 1
+
+DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_MEMORY_BYTES = 64 * 1024 * 1024
+
+
+def file_key(path: Path) -> str:
+    """sha256 of the file bytes (plus cache format), so edits or swaps invalidate"""
+    h = hashlib.sha256(f"courseforge-template-v{CACHE_FORMAT}:".encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class TemplateCache:
+    """
+    Decoded templates keyed by file content hash.
+
+    A hit returns a fresh CourseFile unpickled from the cached bytes, so
+    callers can mutate it freely and warm runs skip the gzip, base64, UTF-16
+    and JSON decoding. Both tiers are LRU with a byte budget: memory by
+    insertion/access order, disk by file mtime (touched on every hit).
+    """
+
+    def __init__(self, cache_dir: Path, max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+                 max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.last_key: Optional[str] = None
+        self.last_hit = False
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pkl"
+
+    def load(self, path: Path) -> CourseFile:
+        """CourseFile.load(path), served from the cache when the content was seen before"""
+        key = file_key(path)
+        self.last_key = key
+
+        blob = self._memory.get(key)
+        if blob is not None:
+            self._memory.move_to_end(key)
+        else:
+            blob = self._read_disk(key)
+            if blob is not None:
+                self._remember(key, blob)
+
+        self.last_hit = blob is not None
+        if blob is None:
+            self.misses += 1
+            course = CourseFile.load(path)
+            blob = pickle.dumps(
+                (course.course_data, course.outer_data, course.version.value),
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+            self._write_disk(key, blob)
+            self._remember(key, blob)
+        else:
+            self.hits += 1
+
+        course_data, outer_data, version = pickle.loads(blob)
+        return CourseFile(course_data, outer_data, GameVersion(version))
+
+    def clear(self):
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self.cache_dir.exists():
+            for f in self.cache_dir.glob("*.pkl"):
+                f.unlink(missing_ok=True)
+
+    # ---- memory tier ----
+
+    def _remember(self, key: str, blob: bytes):
+        if len(blob) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = blob
+        self._memory_bytes += len(blob)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # ---- disk tier ----
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        p = self._disk_path(key)
+        try:
+            blob = p.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(p)  # LRU: mtime is the last use
+        except OSError:
+            pass
+        return blob
+
+    def _write_disk(self, key: str, blob: bytes):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so a crashed run never leaves a truncated pickle behind.
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, self._disk_path(key))
+        self._evict_disk(keep=self._disk_path(key))
+
+    def _evict_disk(self, keep: Optional[Path] = None):
+        """Drop least recently used pickles until the directory fits max_disk_bytes"""
+        entries = []
+        for f in self.cache_dir.glob("*.pkl"):
+            if f == keep:
+                continue
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+        total = sum(size for _, size, _ in entries) + (keep.stat().st_size if keep else 0)
+        for _, size, f in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+
+
+# One cache per directory for the life of the process, so the memory tier survives across runs.
+_SHARED: Dict[Path, TemplateCache] = {}
+
+
+def shared_cache(cache_dir: Path, max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES) -> TemplateCache:
+    """The process-wide TemplateCache for cache_dir (created on first use; budget updated)"""
+    cache_dir = Path(cache_dir).resolve()
+    cache = _SHARED.get(cache_dir)
+    if cache is None:
+        cache = _SHARED[cache_dir] = TemplateCache(cache_dir, max_disk_bytes=max_disk_bytes)
+    cache.max_disk_bytes = max_disk_bytes
+    return cache
+
+
+def export_json_if_changed(course: CourseFile, key: str, dump_path: Path) -> bool:
+    """
+    export_json only when the template content (key) differs from the last dump.
+
+    The key of the dumped template is kept next to the dump as <dump>.sha256.
+    Returns True if the dump was (re)written.
+    """
+    stamp = dump_path.with_name(dump_path.name + ".sha256")
+    if dump_path.exists() and stamp.exists() and stamp.read_text().strip() == key:
+        return False
+    dump_path.parent.mkdir(parents=True, exist_ok=True)
+    course.export_json(dump_path)
+    stamp.write_text(key)
+    return True
@@ -0,0 +1,285 @@
+"""
+CourseForge - Tiled Raster Module
+Out-of-core, tile-parallel filters over memory-mapped .npy grids with halos sized per filter
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.ndimage import binary_closing, distance_transform_edt, gaussian_filter
+
+
+DEFAULT_TILE_SIZE = 1024
+
+# scipy.ndimage.gaussian_filter's default kernel truncation (in sigmas).
+GAUSSIAN_TRUNCATE = 4.0
+
+Window = Tuple[int, int, int, int]
+
+
+def gaussian_halo(sigma: float, truncate: float = GAUSSIAN_TRUNCATE) -> int:
+    """Kernel radius of gaussian_filter(sigma); a halo this wide makes a tile exact"""
+    return int(truncate * float(sigma) + 0.5)
+
+
+def closing_halo(iterations: int) -> int:
+    """binary_closing with the default cross grows by iterations, then shrinks by iterations"""
+    return 2 * int(iterations)
+
+
+def tile_windows(shape: Tuple[int, int], tile_size: int) -> List[Window]:
+    """Row-major (r0, r1, c0, c1) tiles covering shape"""
+    rows, cols = shape
+    return [
+        (r0, min(r0 + tile_size, rows), c0, min(c0 + tile_size, cols))
+        for r0 in range(0, rows, tile_size)
+        for c0 in range(0, cols, tile_size)
+    ]
+
+
+def _padded(window: Window, halo: int, shape: Tuple[int, int]) -> Tuple[Window, Tuple[slice, slice]]:
+    """Window grown by halo (clipped to the array) and the slice of the original tile inside it"""
+    r0, r1, c0, c1 = window
+    pr0, pr1 = max(r0 - halo, 0), min(r1 + halo, shape[0])
+    pc0, pc1 = max(c0 - halo, 0), min(c1 + halo, shape[1])
+    return (pr0, pr1, pc0, pc1), (slice(r0 - pr0, r1 - pr0), slice(c0 - pc0, c1 - pc0))
+
+
+class Workspace:
+    """Directory of scratch .npy memmaps; names are reused (overwritten) run to run"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, name: str) -> Path:
+        return self.root / f"{name}.npy"
+
+    def create(self, name: str, shape: Tuple[int, ...], dtype) -> np.memmap:
+        self.root.mkdir(parents=True, exist_ok=True)
+        return np.lib.format.open_memmap(self.path(name), mode="w+", dtype=dtype, shape=tuple(shape))
+
+    def store(self, name: str, array: np.ndarray) -> np.memmap:
+        """Copy array into a workspace memmap (row blocks, so no second full copy)"""
+        out = self.create(name, array.shape, array.dtype)
+        step = max(1, (64 << 20) // max(1, array[:1].nbytes))
+        for r in range(0, array.shape[0], step):
+            out[r:r + step] = array[r:r + step]
+        out.flush()
+        return out
+
+    def ensure(self, name: str, array: np.ndarray) -> np.ndarray:
+        """array itself if it is already file backed, else a workspace copy worker processes can open"""
+        return array if _memmap_path(array) else self.store(name, array)
+
+
+def _memmap_path(a: np.ndarray) -> Optional[str]:
+    """
+    Backing .npy path of a whole array opened with np.load(mmap_mode) /
+    open_memmap (or a plain view of one), else None. Copy-on-write ("c")
+    maps count too, so they must not have been modified in memory.
+    """
+    m = a
+    while m is not None and not isinstance(m, np.memmap):
+        m = getattr(m, "base", None)
+    if m is None or getattr(m, "filename", None) is None:
+        return None
+    if m.shape != a.shape or m.__array_interface__["data"][0] != a.__array_interface__["data"][0]:
+        return None  # a slice: the file holds more than this array
+    return m.filename
+
+
+def _worker_count(workers: Optional[int], jobs: int) -> int:
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, jobs))
+
+
+def _flush(*arrays: np.ndarray):
+    for a in arrays:
+        while a is not None and not isinstance(a, np.memmap):
+            a = getattr(a, "base", None)
+        if a is not None and a.mode != "c":
+            a.flush()
+
+
+def _pool_map(fn, jobs: list, workers: int):
+    # spawn, not fork: lazrs keeps a native thread pool that does not survive fork.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        list(pool.map(fn, jobs))
+
+
+def _run_tile(job):
+    """Worker entry point: open the memmaps by path and process one tile"""
+    fn, input_paths, output_paths, window, halo = job
+    inputs = {name: np.load(path, mmap_mode="r") for name, path in input_paths.items()}
+    outputs = {name: np.load(path, mmap_mode="r+") for name, path in output_paths.items()}
+    _apply_tile(fn, inputs, outputs, window, halo)
+    for out in outputs.values():
+        out.flush()
+
+
+def _apply_tile(fn, inputs: Dict[str, np.ndarray], outputs: Dict[str, np.ndarray], window: Window, halo: int):
+    shape = next(iter(inputs.values())).shape
+    (pr0, pr1, pc0, pc1), inner = _padded(window, halo, shape)
+    blocks = {name: np.asarray(a[pr0:pr1, pc0:pc1]) for name, a in inputs.items()}
+    results = fn(**blocks)
+    if not isinstance(results, dict):
+        results = {next(iter(outputs)): results}
+    r0, r1, c0, c1 = window
+    for name, block in results.items():
+        outputs[name][r0:r1, c0:c1] = block[inner]
+
+
+def map_tiles(
+    fn: Callable[..., object],
+    inputs: Dict[str, np.ndarray],
+    outputs: Dict[str, np.ndarray],
+    halo: int,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    workers: Optional[int] = 1,
+):
+    """
+    Run fn(**padded input blocks) tile by tile and write each tile's interior to outputs.
+
+    fn returns one block (for a single output) or {output name: block}, each
+    the shape of the padded inputs. As long as fn only looks halo cells away,
+    every interior cell sees exactly the neighbourhood it would in the
+    whole-array call, and tiles on the array border see the real border, so
+    filters with mode="nearest" match the whole-array result bit for bit.
+
+    With workers > 1 and every array a .npy memmap, tiles run in a spawn
+    process pool that opens the files by path; otherwise they run inline.
+    fn must then be picklable (a module-level function or a partial of one).
+    """
+    shape = next(iter(inputs.values())).shape[:2]
+    windows = tile_windows(shape, tile_size)
+    workers = _worker_count(workers, len(windows))
+
+    paths_in = {name: _memmap_path(a) for name, a in inputs.items()}
+    paths_out = {name: _memmap_path(a) for name, a in outputs.items()}
+    parallel = workers > 1 and all(paths_in.values()) and all(paths_out.values())
+    if not parallel:
+        for window in windows:
+            _apply_tile(fn, inputs, outputs, window, halo)
+        return
+
+    _flush(*inputs.values(), *outputs.values())
+    _pool_map(_run_tile, [(fn, paths_in, paths_out, window, halo) for window in windows], workers)
+
+
+def tiled_map(ws: Workspace, name: str, fn: Callable[..., np.ndarray], inputs: Dict[str, np.ndarray], halo: int,
+              dtype, tile_size: int = DEFAULT_TILE_SIZE, workers: Optional[int] = 1) -> np.memmap:
+    """map_tiles into a new workspace memmap `name`; inputs are spilled to the workspace first if parallel"""
+    shape = next(iter(inputs.values())).shape
+    if _worker_count(workers, len(tile_windows(shape[:2], tile_size))) > 1:
+        inputs = {k: ws.ensure(f"{name}.{k}", a) for k, a in inputs.items()}
+    out = ws.create(name, shape, dtype)
+    map_tiles(fn, inputs, {name: out}, halo, tile_size, workers)
+    return out
+
+
+# ---- tile kernels (module level so worker processes can unpickle them) ----
+def gaussian_block(src: np.ndarray, sigma: float) -> np.ndarray:
+    return gaussian_filter(src, sigma=sigma, mode="nearest")
+
+
+def closing_block(mask: np.ndarray, iterations: int) -> np.ndarray:
+    return binary_closing(mask, iterations=iterations)
+
+
+def tiled_gaussian(src: np.ndarray, out: np.ndarray, sigma: float, tile_size: int = DEFAULT_TILE_SIZE,
+                   workers: Optional[int] = 1):
+    """gaussian_filter(src, sigma, mode="nearest") into out, tile by tile"""
+    map_tiles(partial(gaussian_block, sigma=sigma), {"src": src}, {"out": out},
+              gaussian_halo(sigma), tile_size, workers)
+
+
+def tiled_closing(mask: np.ndarray, out: np.ndarray, iterations: int, tile_size: int = DEFAULT_TILE_SIZE,
+                  workers: Optional[int] = 1):
+    """binary_closing(mask, iterations) into out, tile by tile"""
+    map_tiles(partial(closing_block, iterations=iterations), {"mask": mask}, {"out": out},
+              closing_halo(iterations), tile_size, workers)
+
+
+# ---- nearest-neighbour hole filling ----
+def _fill_nearest_block(grid: np.ndarray, edges: Tuple[bool, bool, bool, bool]):
+    """
+    Nearest-valid fill of one padded block plus a mask of cells whose answer is
+    proven: the nearest valid cell found is no farther than the block edge on
+    every side that is not the real array border.
+    """
+    mask = np.isnan(grid)
+    if not np.any(mask):
+        return grid, np.ones(grid.shape, dtype=bool)
+    if np.all(mask):
+        return grid, np.zeros(grid.shape, dtype=bool)
+    dist, indices = distance_transform_edt(mask, return_indices=True)
+    filled = grid[tuple(indices)].astype(grid.dtype)
+    rows, cols = grid.shape
+    r = np.arange(rows)[:, None]
+    c = np.arange(cols)[None, :]
+    inf = np.inf
+    top, bottom, left, right = edges
+    reach = np.minimum.reduce([
+        np.broadcast_to(inf if top else r + 1.0, grid.shape),
+        np.broadcast_to(inf if bottom else rows - r + 0.0, grid.shape),
+        np.broadcast_to(inf if left else c + 1.0, grid.shape),
+        np.broadcast_to(inf if right else cols - c + 0.0, grid.shape),
+    ])
+    return filled, dist <= reach
+
+
+def _fill_tile(grid: np.ndarray, out: np.ndarray, window: Window, halo: int, max_halo: int):
+    shape = grid.shape
+    h = halo
+    while True:
+        (pr0, pr1, pc0, pc1), inner = _padded(window, h, shape)
+        block = np.asarray(grid[pr0:pr1, pc0:pc1])
+        edges = (pr0 == 0, pr1 == shape[0], pc0 == 0, pc1 == shape[1])
+        filled, proven = _fill_nearest_block(block, edges)
+        if np.all(proven[inner]) or h >= max_halo or all(edges):
+            break
+        h *= 2
+    r0, r1, c0, c1 = window
+    out[r0:r1, c0:c1] = filled[inner]
+
+
+def _run_fill_tile(job):
+    grid_path, out_path, window, halo, max_halo = job
+    out = np.load(out_path, mmap_mode="r+")
+    _fill_tile(np.load(grid_path, mmap_mode="r"), out, window, halo, max_halo)
+    out.flush()
+
+
+def tiled_fill_nearest(grid: np.ndarray, out: np.ndarray, halo: int = 64, tile_size: int = DEFAULT_TILE_SIZE,
+                       workers: Optional[int] = 1, max_halo: Optional[int] = None):
+    """
+    fill_nan_nearest into out, tile by tile.
+
+    Each tile is filled from its padded block; a tile with a cell whose
+    nearest valid cell could lie beyond the halo is redone with the halo
+    doubled (up to the whole array), so the result matches the whole-array
+    fill except where several valid cells are exactly equidistant.
+    """
+    shape = grid.shape
+    max_halo = max_halo or max(shape)
+    windows = tile_windows(shape, tile_size)
+    workers = _worker_count(workers, len(windows))
+    grid_path, out_path = _memmap_path(grid), _memmap_path(out)
+    if workers == 1 or not (grid_path and out_path):
+        for window in windows:
+            _fill_tile(grid, out, window, halo, max_halo)
+        return
+    _flush(grid, out)
+    _pool_map(_run_fill_tile, [(grid_path, out_path, window, halo, max_halo) for window in windows], workers)
+
+
+def chunked_rows(shape: Tuple[int, ...], itemsize: int, budget_bytes: int = 64 << 20) -> Sequence[slice]:
+    """Row slices of about budget_bytes each, for elementwise passes over memmaps"""
+    step = max(1, budget_bytes // max(1, itemsize * int(np.prod(shape[1:]))))
+    return [slice(r, min(r + step, shape[0])) for r in range(0, shape[0], step)]
@@ -7,13 +7,7 @@ REPO_ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(REPO_ROOT))
 
 from src.course_file import CourseFile  # noqa: E402
-
-
-def export_course_json(course_path: Path, out_dir: Path) -> Path:
-    course = CourseFile.load(course_path)
-    out_path = out_dir / f"{course_path.stem}.json"
-    course.export_json(out_path)
-    return out_path
+from src.course_diff import diff_courses  # noqa: E402
 
 
 def first_entry(d, key):
@@ -44,50 +38,6 @@ def summarize(d, label):
     return s
 
 
-def deep_diff(a, b, path=""):
-    """
-    Lightweight deep diff: returns list of changed paths.
-    Does NOT print huge arrays; scans first ~200 list entries only.
-    """
-    changes = []
-
-    if type(a) != type(b):
-        changes.append(path or "<root>")
-        return changes
-
-    if isinstance(a, dict):
-        keys = set(a.keys()) | set(b.keys())
-        for k in sorted(keys):
-            pa = a.get(k, "<MISSING>")
-            pb = b.get(k, "<MISSING>")
-            new_path = f"{path}.{k}" if path else k
-            if pa == "<MISSING>" or pb == "<MISSING>":
-                changes.append(new_path)
-            else:
-                changes.extend(deep_diff(pa, pb, new_path))
-        return changes
-
-    if isinstance(a, list):
-        if len(a) != len(b):
-            changes.append(f"{path} (len {len(a)} -> {len(b)})")
-        n = min(len(a), len(b))
-        scan = min(n, 200)
-        for i in range(scan):
-            changes.extend(deep_diff(a[i], b[i], f"{path}[{i}]"))
-        if n > scan:
-            changes.append(f"{path} (list truncated compare: first {scan} items)")
-        return changes
-
-    if a != b:
-        changes.append(path or "<root>")
-    return changes
-
-
-def load_json(p: Path):
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
 def main():
     samples = REPO_ROOT / "reference" / "samples"
     out_dir = REPO_ROOT / "output" / "inspect"
@@ -113,15 +63,13 @@ def main():
     for k, p in files.items():
         print(f"  {k}: {p.name}")
 
-    # Dump and summarize
-    dumped = {}
+    # Load and summarize (diffing below works on copies, so the loaded courses stay as read)
+    courses = {}
     summaries = {}
 
     for k, p in files.items():
-        dump_path = export_course_json(p, out_dir)
-        dumped[k] = dump_path
-        data = load_json(dump_path)
-        summaries[k] = summarize(data, k)
+        courses[k] = CourseFile.load(p)
+        summaries[k] = summarize(courses[k].course_data, k)
 
     print("\n=== SUMMARY (key fields) ===")
     for k in ["flat", "raise", "lower"]:
@@ -152,24 +100,18 @@ def main():
         else:
             print("  terrainHeight[0]: <none>")
 
-        print(f"  dumped: {dumped[k]}")
-
-    # Diffs: flat -> raise, flat -> lower
-    flat_json = load_json(dumped["flat"])
-    raise_json = load_json(dumped["raise"])
-    lower_json = load_json(dumped["lower"])
-
-    print("\n=== DIFF PATHS (flat -> raise) ===")
-    diffs_fr = deep_diff(flat_json, raise_json)
-    for p in diffs_fr[:200]:
-        print(" ", p)
+    # Diffs: flat -> raise, flat -> lower (strokes matched by position, all of them)
+    print("\n=== DIFF (flat -> raise) ===")
+    diffs_fr = diff_courses(courses["flat"], courses["raise"]).lines()
+    for line in diffs_fr[:200]:
+        print(" ", line)
     if len(diffs_fr) > 200:
         print(f"  ... ({len(diffs_fr)-200} more)")
 
-    print("\n=== DIFF PATHS (flat -> lower) ===")
-    diffs_fl = deep_diff(flat_json, lower_json)
-    for p in diffs_fl[:200]:
-        print(" ", p)
+    print("\n=== DIFF (flat -> lower) ===")
+    diffs_fl = diff_courses(courses["flat"], courses["lower"]).lines()
+    for line in diffs_fl[:200]:
+        print(" ", line)
     if len(diffs_fl) > 200:
         print(f"  ... ({len(diffs_fl)-200} more)")
 
@@ -179,7 +121,6 @@ def main():
         json.dump(
             {
                 "files": {k: str(v) for k, v in files.items()},
-                "dumps": {k: str(v) for k, v in dumped.items()},
                 "summaries": summaries,
                 "diffs": {
                     "flat_to_raise": diffs_fr,
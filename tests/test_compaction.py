@@ -0,0 +1,67 @@
+"""
+Checks for stroke compaction: exact merges cost nothing and absorbed strokes
+stay within the simulated error bound. Run with: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# ---- repo imports ----
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.brush_sim import SimGrid  # noqa: E402
+from src.compaction import compact_layer  # noqa: E402
+from src.course_file import BrushLayer  # noqa: E402
+from src.stamp_solver import build_operator  # noqa: E402
+from src.stamps import lattice, mask_lattice  # noqa: E402
+
+
+def lattice_with_drains() -> BrushLayer:
+    """A stamp lattice plus a water drain pass over one corner, as stage_stamp builds them"""
+    rng = np.random.default_rng(0)
+    x, z = lattice(150.0)
+    layers = [BrushLayer.from_columns(x, z, rng.normal(scale=3.0, size=len(x)), 460.0, 1, 54)]
+    water = np.zeros((64, 64), dtype=bool)
+    water[40:, 40:] = True
+    dx, dz = mask_lattice(water, 80.0, [(0.0, 0.0), (40.0, 40.0)])
+    layers.append(BrushLayer.from_columns(dx, dz, -5.0, 300.0, 1, 54))
+    return BrushLayer.concat(layers)
+
+
+def sim_error(a: BrushLayer, b: BrushLayer, resolution: float) -> float:
+    """Max height difference under the footprint model compaction bounds"""
+    grid = SimGrid(resolution=resolution)
+    height = lambda layer: build_operator(layer, grid) @ layer.data["value"].astype(np.float64)  # noqa: E731
+    return float(np.max(np.abs(height(a) - height(b))))
+
+
+def test_identical_strokes_merge_without_error():
+    layer = lattice_with_drains()
+    doubled = BrushLayer.concat([layer, layer])
+    compacted, report = compact_layer(doubled, tolerance=0.0, resolution=16.0)
+    assert report.merged == len(layer)
+    assert report.absorbed == 0
+    assert len(compacted) == len(layer)
+    assert np.allclose(compacted.data["value"], 2.0 * layer.data["value"])
+    assert sim_error(doubled, compacted, report.resolution_m) < 1e-6
+
+
+def test_absorbed_strokes_stay_within_tolerance():
+    layer = lattice_with_drains()
+    for tolerance in (0.1, 0.5):
+        compacted, report = compact_layer(layer, tolerance=tolerance, resolution=8.0, max_abs=60.0)
+        assert report.strokes_after == len(compacted) == len(layer) - report.absorbed
+        assert report.max_error_m <= tolerance
+        assert sim_error(layer, compacted, report.resolution_m) <= tolerance + 1e-6
+        assert np.all(np.abs(compacted.data["value"]) <= 60.0)
+    assert report.absorbed > 0
+
+
+def test_negligible_strokes_are_absorbed():
+    layer = lattice_with_drains()
+    tiny = layer[:5]
+    tiny.data["value"] = 0.001
+    tiny.data["pos_x"] += 7.0
+    compacted, report = compact_layer(BrushLayer.concat([layer, tiny]), tolerance=0.01, resolution=8.0)
+    assert report.absorbed >= 5
+    assert report.max_error_m <= 0.01
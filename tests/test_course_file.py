@@ -0,0 +1,47 @@
+"""
+Checks for course file round trips: lazy loads of courses this tool saved.
+Run with: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# ---- repo imports ----
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.course_file import CourseFile, GameVersion, LazyBinaryData, LazyBlob  # noqa: E402
+
+TEMPLATE = Path(__file__).parent.parent / "reference" / "samples" / "2k25_flat.course"
+
+
+@pytest.mark.skipif(not TEMPLATE.exists(), reason="sample template not available")
+def test_lazy_reload_of_saved_course(tmp_path):
+    course = CourseFile.load(TEMPLATE)
+    out = tmp_path / "saved.course"
+    course.save(out)
+
+    lazy = CourseFile.load(out, lazy=True)
+    binary = lazy.outer_data["binaryData"]
+    assert isinstance(binary, LazyBinaryData)
+    assert all(isinstance(binary.raw(key), LazyBlob) for key in binary)
+
+    eager = CourseFile.load(out)
+    assert lazy.course_data == eager.course_data
+    assert lazy.version == eager.version
+    assert dict(binary.items()) == eager.outer_data["binaryData"]
+
+
+@pytest.mark.skipif(not TEMPLATE.exists(), reason="sample template not available")
+def test_lazy_version_matches_eager_for_bom_files(tmp_path):
+    course = CourseFile.load(TEMPLATE)
+    # A 2K23-shaped course written with a BOM, which only 2K25 saves normally carry.
+    course.course_data.pop("terrainHeight", None)
+    course.course_data["userLayers2"] = []
+    course.version = GameVersion.PGA2K25
+    out = tmp_path / "bom.course"
+    course.save(out)
+
+    eager = CourseFile.load(out)
+    lazy = CourseFile.load(out, lazy=True)
+    assert eager.version == GameVersion.PGA2K23
+    assert lazy.version == eager.version
@@ -0,0 +1,243 @@
+"""
+Checks for incremental re-stamping: the stroke index it queries, the dirty
+regions it builds and the splice it performs. Run with: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# ---- repo imports ----
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.course_diff import diff_courses, diff_layers  # noqa: E402
+from src.course_file import BRUSH_DTYPE, BrushLayer, CourseFile  # noqa: E402
+from src.pipeline import PipelineConfig, restamp_course, write_course  # noqa: E402
+from src.restamp import StampTarget, dirty_mask, dirty_regions, splice_stamps, target_path  # noqa: E402
+from src.spatial_index import StrokeIndex, footprint_radius  # noqa: E402
+from src.stamps import lattice, sample_bilinear  # noqa: E402
+
+TEMPLATE = Path(__file__).parent.parent / "reference" / "samples" / "2k25_flat.course"
+GRID = 128
+
+
+# ---- helpers ----
+
+def random_strokes(rng: np.random.Generator, n: int) -> np.ndarray:
+    data = np.zeros(n, dtype=BRUSH_DTYPE)
+    data["tool"] = 1
+    data["type"] = 54
+    data["pos_x"] = rng.uniform(-1000, 1000, n)
+    data["pos_y"] = -np.inf
+    data["pos_z"] = rng.uniform(-1000, 1000, n)
+    data["scale_x"] = data["scale_z"] = rng.uniform(5, 120, n)
+    data["scale_y"] = 1.0
+    data["value"] = rng.normal(size=n)
+    data["holeId"] = -1
+    return data
+
+
+def brute_overlapping_bbox(data: np.ndarray, rect) -> np.ndarray:
+    min_x, min_z, max_x, max_z = rect
+    x, z = data["pos_x"], data["pos_z"]
+    dx = np.maximum(np.maximum(min_x - x, x - max_x), 0.0)
+    dz = np.maximum(np.maximum(min_z - z, z - max_z), 0.0)
+    r = footprint_radius(data)
+    return np.flatnonzero(dx * dx + dz * dz <= r * r)
+
+
+def touching_any(data: np.ndarray, regions) -> np.ndarray:
+    mask = np.zeros(len(data), dtype=bool)
+    for rect in regions:
+        mask[brute_overlapping_bbox(data, rect)] = True
+    return mask
+
+
+def field(rng: np.random.Generator) -> np.ndarray:
+    rows, cols = np.mgrid[0:GRID, 0:GRID]
+    return (np.sin(rows / 9.0) * np.cos(cols / 13.0) * 5.0 + rng.normal(scale=0.01, size=(GRID, GRID))).astype(
+        np.float32)
+
+
+def lattice_stamps(height: np.ndarray) -> BrushLayer:
+    """Lattice stamps whose values are the bilinear samples of height (what the autogain path does, gain 1)"""
+    x, z = lattice(50.0)
+    return BrushLayer.from_columns(x, z, sample_bilinear(height, x, z), 120.0, 1, 54)
+
+
+def edited(height: np.ndarray) -> np.ndarray:
+    out = height.copy()
+    out[40:60, 70:95] += 2.0
+    return out
+
+
+# ---- StrokeIndex ----
+
+def test_stroke_index_edits_match_brute_force():
+    rng = np.random.default_rng(0)
+    layer = BrushLayer(random_strokes(rng, 3000))
+    index = StrokeIndex(layer)
+    rects = []
+    for _ in range(25):
+        x0, x1 = np.sort(rng.uniform(-1100, 1100, 2))
+        z0, z1 = np.sort(rng.uniform(-1100, 1100, 2))
+        rects.append((x0, z0, x1, z1))
+
+    def check():
+        assert index._indexed == len(layer)
+        for rect in rects:
+            assert np.array_equal(index.overlapping_bbox(*rect), brute_overlapping_bbox(layer.data, rect))
+        x, z = rng.uniform(-1000, 1000, 2)
+        d2 = (layer.data["pos_x"] - x) ** 2 + (layer.data["pos_z"] - z) ** 2
+        assert np.array_equal(index.radius(x, z, 150.0), np.flatnonzero(d2 <= 150.0 ** 2))
+
+    check()
+    # Appends stay pending until merged; both states must answer correctly.
+    added = index.add(random_strokes(rng, 50))
+    assert np.array_equal(added, np.arange(3000, 3050))
+    check()
+    index.add(random_strokes(rng, 2000))
+    check()
+
+    # Removal renumbers the survivors (positions and mask both accepted).
+    before = layer.data.copy()
+    gone = rng.choice(len(layer), 700, replace=False)
+    index.remove(gone)
+    keep = np.ones(len(before), dtype=bool)
+    keep[gone] = False
+    assert np.array_equal(layer.data, before[keep])
+    check()
+    mask = layer.data["value"] > 1.5
+    index.remove(mask)
+    check()
+
+    # In-place moves and rescales.
+    moved = rng.choice(len(layer), 300, replace=False)
+    layer.data["pos_x"][moved] = rng.uniform(-1000, 1000, len(moved))
+    layer.data["pos_z"][moved] = rng.uniform(-1000, 1000, len(moved))
+    layer.data["scale_x"][moved] = 400.0
+    index.moved(moved)
+    check()
+
+
+# ---- dirty regions ----
+
+@pytest.mark.parametrize("shape", [(128, 128), (100, 77), (513, 300)])
+def test_dirty_regions_cover_every_dirty_cell(shape):
+    rng = np.random.default_rng(1)
+    dirty = np.zeros(shape, dtype=bool)
+    dirty[rng.integers(0, shape[0], 40), rng.integers(0, shape[1], 40)] = True
+    dirty[shape[0] // 3:shape[0] // 2, : shape[1] // 4] = True
+    dirty[-1, -1] = dirty[0, 0] = True
+    regions = dirty_regions(dirty, block=16)
+
+    rows, cols = np.nonzero(dirty)
+    step_x = 2000.0 / (shape[1] - 1)
+    step_z = 2000.0 / (shape[0] - 1)
+    x = -1000.0 + cols * step_x
+    z = -1000.0 + rows * step_z
+    covered = np.zeros(len(rows), dtype=bool)
+    for min_x, min_z, max_x, max_z in regions:
+        # The cell and its bilinear neighbours must be inside the rectangle.
+        covered |= (x - step_x >= min_x - 1e-9) & (x <= max_x + 1e-9) & (z - step_z >= min_z - 1e-9) & (
+            z <= max_z + 1e-9)
+    assert covered.all()
+    assert dirty_regions(np.zeros(shape, dtype=bool)) == []
+
+
+def test_dirty_mask_flags_moved_cells_and_water():
+    rng = np.random.default_rng(2)
+    height = field(rng)
+    water = np.zeros(height.shape, dtype=bool)
+    old = StampTarget(height, water, "k")
+    new = height.copy()
+    new[5, 6] += 0.2
+    new[7, 8] += 0.01
+    flipped = water.copy()
+    flipped[9, 9] = True
+    dirty = dirty_mask(old, new, flipped, 0.05)
+    assert set(zip(*np.nonzero(dirty))) == {(5, 6), (9, 9)}
+
+
+# ---- splice ----
+
+def test_splice_leaves_strokes_outside_regions_untouched():
+    rng = np.random.default_rng(3)
+    height = field(rng)
+    new_height = edited(height)
+    old_layer = lattice_stamps(height)
+    # Hand edits anywhere, including on top of the edited patch.
+    old_layer.append(random_strokes(rng, 200))
+    stamps = lattice_stamps(new_height)
+    regions = dirty_regions(dirty_mask(StampTarget(height, None, "k"), new_height, None, 0.05))
+    assert regions
+
+    before = old_layer.data.copy()
+    untouched = before[~touching_any(before, regions)]
+    layer = BrushLayer(before.copy())
+    report = splice_stamps(layer, stamps, regions)
+
+    after_untouched = layer.data[~touching_any(layer.data, regions)]
+    assert after_untouched.tobytes() == untouched.tobytes()
+    assert report.replaced > 0
+    assert report.kept == len(layer) - report.replaced - report.added
+
+    # Inside the regions the layer now holds exactly the regenerated stamps.
+    inside = layer.data[touching_any(layer.data, regions)]
+    fresh = stamps.data[touching_any(stamps.data, regions)]
+    assert not diff_layers(BrushLayer(fresh), BrushLayer(inside)).changed
+
+
+def test_splice_of_lattice_stamps_equals_full_regeneration():
+    rng = np.random.default_rng(4)
+    height = field(rng)
+    new_height = edited(height)
+    layer = lattice_stamps(height)
+    stamps = lattice_stamps(new_height)
+    regions = dirty_regions(dirty_mask(StampTarget(height, None, "k"), new_height, None, 0.05))
+    splice_stamps(layer, stamps, regions)
+    assert not diff_layers(stamps, layer).changed
+
+
+# ---- restamp_course vs write_course ----
+
+@pytest.mark.skipif(not TEMPLATE.exists(), reason="sample template not available")
+@pytest.mark.parametrize("edit", [False, True])
+def test_restamp_matches_full_write(tmp_path, edit):
+    rng = np.random.default_rng(5)
+    config = PipelineConfig(incremental_stamps=True, course_name="restamp test")
+    height = field(rng)
+    new_height = edited(height) if edit else height
+    quiet = lambda _msg: None  # noqa: E731
+
+    course = tmp_path / "inc.course"
+    write_course(config, lattice_stamps(height), TEMPLATE, course, tmp_path / "cache", quiet)
+    StampTarget(height, None, "key", {"auto_gain": 1.0}).save(target_path(course))
+    target = StampTarget(new_height, None, "key", {"auto_gain": 1.0})
+    report = restamp_course(config, lattice_stamps(new_height), target, course, quiet)
+    assert report is not None
+    assert (report.dirty_cells > 0) == edit
+
+    full = tmp_path / "full.course"
+    write_course(config, lattice_stamps(new_height), TEMPLATE, full, tmp_path / "cache", quiet)
+    diff = diff_courses(CourseFile.load(full), CourseFile.load(course))
+    assert not diff.changed, diff.lines(10)
+
+
+@pytest.mark.skipif(not TEMPLATE.exists(), reason="sample template not available")
+def test_restamp_falls_back_on_global_changes(tmp_path):
+    rng = np.random.default_rng(6)
+    height = field(rng)
+    quiet = lambda _msg: None  # noqa: E731
+    config = PipelineConfig(incremental_stamps=True)
+    course = tmp_path / "inc.course"
+    write_course(config, lattice_stamps(height), TEMPLATE, course, tmp_path / "cache", quiet)
+    StampTarget(height, None, "key", {"auto_gain": 1.0}).save(target_path(course))
+
+    stamps = lattice_stamps(height)
+    assert restamp_course(config, stamps, StampTarget(height, None, "key", {"auto_gain": 1.1}), course, quiet) is None
+    assert restamp_course(config, stamps, StampTarget(height, None, "other", {"auto_gain": 1.0}), course, quiet) is None
+    lsq = config.replace(stamp_solver="lsq")
+    assert restamp_course(lsq, stamps, StampTarget(height, None, "key", {"auto_gain": 1.0}), course, quiet) is None
+    compact = config.replace(compact_stamps=True)
+    assert restamp_course(compact, stamps, StampTarget(height, None, "key", {"auto_gain": 1.0}), course, quiet) is None